@@ -69,6 +69,7 @@ class Core(QObject):
         self._loadedPlugins = []
         self._cmdLine = {}
         self._project = None
+        self._fileWatcher = None
 
     def _prepareToCatchSigInt(self):
         """Catch SIGINT signal to close the application
@@ -119,6 +120,10 @@ class Core(QObject):
         self._project = enki.core.project.Project(self)
         profiler.stepDone('Create Project')
 
+        import enki.core.filewatcher
+        self._fileWatcher = enki.core.filewatcher.FileWatcher(self)
+        profiler.stepDone('Create FileWatcher')
+
         import enki.core.workspace
         profiler.stepDone('import workspace')
 
@@ -161,6 +166,9 @@ class Core(QObject):
         if self._workspace is not None:
             self._workspace.terminate()
             self._workspace = None
+        if self._fileWatcher is not None:
+            self._fileWatcher.terminate()
+            self._fileWatcher = None
         if self._project is not None:
             self._project.terminate()
             self._project = None
@@ -310,6 +318,13 @@ class Core(QObject):
         """
         return self._project
 
+    def fileWatcher(self):
+        """Central file watching service
+
+        ::class:`enki.core.filewatcher.FileWatcher`
+        """
+        return self._fileWatcher
+
 
 core = Core()  # pylint: disable=C0103
 """Core instance. It is accessible as:
@@ -4,9 +4,15 @@ document --- Opened file representation
 """
 
 import os.path
+import mmap
+import bisect
+import hashlib
+import functools
+import tempfile
+import stat
 
 import sip
-from PyQt5.QtCore import pyqtSignal, QFileSystemWatcher, QObject, QTimer, pyqtSlot, QEvent
+from PyQt5.QtCore import pyqtSignal, QObject, pyqtSlot, QEvent
 from PyQt5.QtWidgets import QFileDialog, \
     QInputDialog, \
     QMessageBox, \
@@ -22,10 +28,21 @@ from enki.core.core import core
 from enki.widgets.dockwidget import DockWidget
 
 
+_LARGE_FILE_CHUNK_SIZE = 1024 * 1024  # bytes, loaded to the editor at once
+_LARGE_FILE_TAIL_SIZE = 4096  # bytes, compared to detect if a large file has only been appended
+_SAVE_CHUNK_SIZE = 1024 * 1024  # chars, encoded and written at once
+
+
+def _contentsHash(data):
+    """Hash of the file contents. Watcher keeps it instead of a copy of the contents
+    """
+    return hashlib.sha1(data).digest()
+
 class _FileWatcher(QObject):
     """File watcher.
 
-    QFileSystemWatcher notifies client about any change (file access mode, modification date, etc.)
+    Client of the central :class:`enki.core.filewatcher.FileWatcher`.
+    The central watcher notifies client about any change (file access mode, modification date, etc.)
     But, we need signal, only after file contents had been changed
     """
     modified = pyqtSignal(bool)
@@ -33,10 +50,9 @@ class _FileWatcher(QObject):
 
     def __init__(self, path):
         QObject.__init__(self)
-        self._contents = None
-        self._watcher = QFileSystemWatcher(self)
-        self._timer = None
-        self._path = path
+        self._contentsHash = None
+        self._path = None
+        self._enabled = False
 
         self._lastEmittedModifiedStatus = None
         self._lastEmittedRemovedStatus = None
@@ -46,36 +62,36 @@ class _FileWatcher(QObject):
 
     def term(self):
         self.disable()
+        if self._path is not None:
+            core.fileWatcher().unwatch(self._path, self)
         sip.delete(self)
 
     def enable(self):
         """Enable signals from the watcher
         """
-        self._watcher.fileChanged.connect(self._onFileChanged)
+        self._enabled = True
 
     def disable(self):
         """Disable signals from the watcher
         """
-        self._watcher.fileChanged.disconnect(self._onFileChanged)
-        self._stopTimer()
+        self._enabled = False
 
-    def setContents(self, contents):
-        """Set file contents. Watcher uses it to compare old and new contents of the file.
+    def setContentsHash(self, contentsHash):
+        """Set hash of the file contents. Watcher uses it to compare old and new contents of the file.
         """
-        self._contents = contents
-        # Qt File watcher may work incorrectly, if file was not existing, when it started
-        if not self._watcher.files():
-            self.setPath(self._path)
+        self._contentsHash = contentsHash
+        if self._path is not None:
+            core.fileWatcher().rewatch(self._path)
         self._lastEmittedModifiedStatus = None
         self._lastEmittedRemovedStatus = None
 
     def setPath(self, path):
         """Path had been changed or file had been created. Set new path
         """
-        if self._watcher.files():
-            self._watcher.removePaths(self._watcher.files())
-        if path is not None and os.path.isfile(path):
-            self._watcher.addPath(path)
+        if self._path is not None:
+            core.fileWatcher().unwatch(self._path, self)
+        if path is not None:
+            core.fileWatcher().watch(path, self)
         self._path = path
         self._lastEmittedModifiedStatus = None
         self._lastEmittedRemovedStatus = None
@@ -83,7 +99,7 @@ class _FileWatcher(QObject):
     def _emitModifiedStatus(self):
         """Emit self.modified signal with right status
         """
-        isModified = self._contents != self._safeRead(self._path)
+        isModified = self._contentsHash != self._safeReadHash(self._path)
         if isModified != self._lastEmittedModifiedStatus:
             self.modified.emit(isModified)
             self._lastEmittedModifiedStatus = isModified
@@ -94,54 +110,95 @@ class _FileWatcher(QObject):
             self._lastEmittedRemovedStatus = isRemoved
             self.removed.emit(isRemoved)
 
-    @pyqtSlot()
-    def _onFileChanged(self):
-        """File changed. Emit own signal, if contents changed
+    def onFileChanged(self, exists):
+        """Central file watcher notification. Emit own signal, if contents changed
         """
-        if os.path.exists(self._path):
+        if not self._enabled:
+            return
+
+        if exists:
+            self._emitRemovedStatus(False)
             self._emitModifiedStatus()
         else:
             self._emitRemovedStatus(True)
 
-        # Sometimes QFileSystemWatcher emits only 1 signal for 2 modifications
-        # Check once more later
-        self._startTimer()
-
-    def _startTimer(self):
-        """Init a timer.
-        It is used for monitoring file after deletion.
-        Git removes file, than restores it.
+    def _safeReadHash(self, path):
+        """Read file by chunks and calculate the hash. Ignore exceptions
         """
-        if self._timer is None:
-            self._timer = QTimer()
-            self._timer.setInterval(500)
-            self._timer.timeout.connect(self._onCheckIfDeletedTimer)
-        self._timer.start()
+        fileHash = hashlib.sha1()
+        try:
+            with open(path, 'rb') as file:
+                for chunk in iter(lambda: file.read(_SAVE_CHUNK_SIZE), b''):
+                    fileHash.update(chunk)
+        except (OSError, IOError):
+            return None
+        return fileHash.digest()
 
-    def _stopTimer(self):
-        """Stop timer, if exists
-        """
-        if self._timer is not None:
-            self._timer.stop()
 
-    @pyqtSlot()
-    def _onCheckIfDeletedTimer(self):
-        """Check, if file has been restored
-        """
-        if os.path.exists(self._path):
-            self.setPath(self._path)  # restart Qt file watcher after file has been restored
-            self._stopTimer()
-            self._emitRemovedStatus(False)
-            self._emitModifiedStatus()
+class _LargeFileWatcher(_FileWatcher):
+    """File watcher for documents in the large file mode.
+
+    Reading whole file on every change is too expensive. Size and modification time are used instead of the hash
+    """
 
-    def _safeRead(self, path):
-        """Read file. Ignore exceptions
+    changed = pyqtSignal()
+
+    def _safeReadHash(self, path):
+        return _fileSignature(path)
+
+    def onFileChanged(self, exists):
+        """Emit ``changed`` on every change of the signature, not only when the modified status flips.
+        The mapped file must follow all changes, i.e. a growing log
         """
+        if self._enabled and exists and \
+           self._safeReadHash(self._path) != self._contentsHash:
+            self.changed.emit()
+        _FileWatcher.onFileChanged(self, exists)
+
+
+def _umask():
+    """Current process umask.
+    Linux reports it in /proc/self/status. Elsewhere, the usual default is used.
+    The umask is not read by setting it, because another thread might create a file in between
+    """
+    try:
+        with open('/proc/self/status') as statusFile:
+            for line in statusFile:
+                if line.startswith('Umask:'):
+                    return int(line.split()[1], 8)
+    except (OSError, IOError, ValueError):
+        pass
+    return 0o022
+
+
+def _copyFileAttributes(sourcePath, targetPath, sourceStat):
+    """Copy mode, owner and extended attributes (i.e. ACLs) of the replaced file to the new one.
+    Owner and extended attributes are copied if possible, mode is copied always
+    """
+    os.chmod(targetPath, stat.S_IMODE(sourceStat.st_mode))
+
+    if hasattr(os, 'chown'):
         try:
-            with open(path, 'rb') as file:
-                return file.read()
-        except (OSError, IOError):
-            return None
+            os.chown(targetPath, sourceStat.st_uid, sourceStat.st_gid)
+        except (OSError, IOError):  # i.e. the group of the file is not a group of the user
+            pass
+
+    if hasattr(os, 'listxattr'):
+        try:
+            for name in os.listxattr(sourcePath):
+                os.setxattr(targetPath, name, os.getxattr(sourcePath, name))
+        except (OSError, IOError):  # not supported by the file system or not permitted
+            pass
+
+
+def _fileSignature(path):
+    """Size and modification time of the file. None on error
+    """
+    try:
+        statInfo = os.stat(path)
+    except (OSError, IOError):
+        return None
+    return (statInfo.st_size, statInfo.st_mtime_ns)
 
 
 class Document(QWidget):
@@ -164,9 +221,10 @@ class Document(QWidget):
                       r'\n': '\n',
                       r'\r': '\r'}
 
-    def __init__(self, parentObject, filePath, createNew=False):
+    def __init__(self, parentObject, filePath, createNew=False, largeFile=False):
         """Create editor and open file.
         If file is None or createNew is True, empty not saved file is created
+        If largeFile is True, file is opened read-only in the large file mode. See :meth:`isLargeFile`
         IO Exceptions are not catched, therefore, must be catched on upper level
         """
         QWidget.__init__(self, parentObject)
@@ -174,9 +232,19 @@ class Document(QWidget):
         self._filePath = filePath
         self._externallyRemoved = False
         self._externallyModified = False
+        self._largeFile = largeFile and not self._neverSaved
+        self._mappedFile = None
+        self._mappedFileObject = None
+        self._loadedChunks = []  # list of (byte offset, char offset) of chunks loaded to the editor
+        self._loadedBytes = 0
+        self._loadedTail = b''  # last bytes of the loaded part. Used to detect if the file was only appended
         # File opening should be implemented in the document classes
 
-        self._fileWatcher = _FileWatcher(filePath)
+        if self._largeFile:
+            self._fileWatcher = _LargeFileWatcher(filePath)
+            self._fileWatcher.changed.connect(self._onLargeFileChanged)
+        else:
+            self._fileWatcher = _FileWatcher(filePath)
         self._fileWatcher.modified.connect(self._onWatcherFileModified)
         self._fileWatcher.removed.connect(self._onWatcherFileRemoved)
 
@@ -194,7 +262,9 @@ class Document(QWidget):
         layout.addWidget(self.qutepart)
         self.setFocusProxy(self.qutepart)
 
-        if not self._neverSaved:
+        if self._largeFile:
+            originalText = self._openLargeFile(filePath)
+        elif not self._neverSaved:
             originalText = self._readFile(filePath)
             self.qutepart.text = originalText
         else:
@@ -203,7 +273,10 @@ class Document(QWidget):
         # autodetect eol, if need
         self._configureEolMode(originalText)
 
-        self._tryDetectSyntax()
+        if self._largeFile:
+            self.qutepart.document().setModified(False)  # read-only, EOL is never converted
+        else:
+            self._tryDetectSyntax()
 
         QApplication.instance().installEventFilter(self)
 
@@ -223,6 +296,7 @@ class Document(QWidget):
         """Explicytly called destructor
         """
         self._fileWatcher.term()
+        self._unmapFile()
 
         # avoid emitting signals, document shall behave like it is already dead
         self.qutepart.document().modificationChanged.disconnect()
@@ -239,6 +313,45 @@ class Document(QWidget):
         self._externallyModified = modified
         self.documentDataChanged.emit()
 
+    @pyqtSlot()
+    def _onLargeFileChanged(self):
+        """File in the large file mode has been changed.
+        Accessing the mapping beyond the end of a truncated file crashes the process, therefore, the file is
+        mapped again. If the file has only been appended, loaded chunks are kept, otherwise, the file is reloaded
+        """
+        try:
+            if self._isOnlyAppended():
+                self._mapFile(self._filePath)
+                self._fileWatcher.setContentsHash(_fileSignature(self._filePath))
+                self._onLargeFileScrolled(self.qutepart.verticalScrollBar().value())
+            else:
+                self.reload()
+        except (OSError, IOError):
+            # File is not readable anymore. The text is kept in the editor, but not mapped
+            self._unmapFile()
+            self._externallyModified = True
+
+        self.documentDataChanged.emit()
+
+    def _isOnlyAppended(self):
+        """Check if the mapped file has only been appended since the loaded part was read.
+        Raise OSError, if file is not accessible
+        """
+        if self._mappedFileObject is None:
+            return False
+
+        statInfo = os.stat(self._filePath)
+        if statInfo.st_ino != os.fstat(self._mappedFileObject.fileno()).st_ino or \
+           statInfo.st_size < self._loadedBytes:
+            return False  # replaced or truncated
+
+        if self._loadedBytes > 0 and not self._loadedTail.endswith(b'\n'):
+            return False  # the last loaded line might continue
+
+        with open(self._filePath, 'rb') as file:
+            file.seek(self._loadedBytes - len(self._loadedTail))
+            return file.read(len(self._loadedTail)) == self._loadedTail
+
     @pyqtSlot(bool)
     def _onWatcherFileRemoved(self, isRemoved):
         """File has been removed
@@ -254,7 +367,7 @@ class Document(QWidget):
             self._filePath = os.path.abspath(filePath)  # abspath won't fail, if file exists
             data = openedFile.read()
 
-        self._fileWatcher.setContents(data)
+        self._fileWatcher.setContentsHash(_contentsHash(data))
 
         try:
             text = str(data, 'utf8')
@@ -275,6 +388,204 @@ class Document(QWidget):
 
         return text
 
+    def _mapFile(self, filePath):
+        """Map the file to the memory. Used in the large file mode.
+        Empty file can not be mapped, None is set
+        """
+        self._unmapFile()
+        self._mappedFileObject = open(filePath, 'rb')  # Exception is ok, raise it up
+        if os.fstat(self._mappedFileObject.fileno()).st_size > 0:
+            self._mappedFile = mmap.mmap(self._mappedFileObject.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def _unmapFile(self):
+        if self._mappedFile is not None:
+            self._mappedFile.close()
+            self._mappedFile = None
+        if self._mappedFileObject is not None:
+            self._mappedFileObject.close()
+            self._mappedFileObject = None
+
+    def _mappedSize(self):
+        return len(self._mappedFile) if self._mappedFile is not None else 0
+
+    def _openLargeFile(self, filePath):
+        """Map the file and load the first chunk to the read-only editor.
+        Return text of the first chunk
+        """
+        self._filePath = os.path.abspath(filePath)
+        self._mapFile(self._filePath)
+        self._fileWatcher.setContentsHash(_fileSignature(self._filePath))
+
+        self._loadedChunks = []
+        self._loadedBytes = 0
+        self._loadedTail = b''
+
+        self.qutepart.setReadOnly(True)
+        self.qutepart.document().setUndoRedoEnabled(False)
+        self.qutepart.text = ''
+        text = self._loadNextChunk()
+        self.qutepart.verticalScrollBar().valueChanged.connect(self._onLargeFileScrolled)
+
+        core.mainWindow().appendMessage(
+            "{} is opened read-only in the large file mode. "
+            "Highlighting, lint and preview are disabled".format(self._filePath), 5000)
+        return text
+
+    def _loadNextChunk(self):
+        """Load next chunk of the mapped file to the editor.
+        Chunk always ends with an end of line, therefore, it is appended as a set of complete lines.
+        Return text of the chunk or None, if whole file has been loaded
+        """
+        size = self._mappedSize()
+        if self._loadedBytes >= size:
+            return None
+
+        start = self._loadedBytes
+        end = self._chunkEnd(start)
+        text = str(self._mappedFile[start:end], 'utf8', 'replace')
+
+        if self._loadedChunks:
+            prevByteOffset, prevCharOffset = self._loadedChunks[-1]
+            charOffset = prevCharOffset + \
+                len(str(self._mappedFile[prevByteOffset:start], 'utf8', 'replace'))
+        else:
+            charOffset = 0
+        self._loadedChunks.append((start, charOffset))
+        self._loadedBytes = end
+        self._loadedTail = self._mappedFile[max(end - _LARGE_FILE_TAIL_SIZE, start):end]
+
+        # Last EOL is replaced with a block separator. Its length is 1 char too
+        if text.endswith('\n'):
+            text = text[:-1]
+
+        if start == 0:
+            self.qutepart.text = text
+        else:
+            self.qutepart.appendPlainText(text)
+        self.qutepart.document().setModified(False)
+
+        return text
+
+    def _chunkEnd(self, start):
+        """Byte offset of the end of the chunk, which starts at ``start``.
+        Chunk always ends with an end of line, or with the end of the file
+        """
+        size = self._mappedSize()
+        end = self._mappedFile.find(b'\n', min(start + _LARGE_FILE_CHUNK_SIZE, size - 1))
+        return size if end == -1 else end + 1
+
+    def _chunkBounds(self):
+        """``(start, end)`` byte offsets of all chunks of the mapped file, loaded or not
+        """
+        bounds = []
+        start = 0
+        while start < self._mappedSize():
+            end = self._chunkEnd(start)
+            bounds.append((start, end))
+            start = end
+        return bounds
+
+    @pyqtSlot(int)
+    def _onLargeFileScrolled(self, value):
+        """Load more text on demand, when user scrolls close to the end of loaded part
+        """
+        scrollBar = self.qutepart.verticalScrollBar()
+        if value >= scrollBar.maximum() - scrollBar.pageStep():
+            self._loadNextChunk()
+
+    def _ensureLoaded(self, byteOffset):
+        """Load chunks, until the byte offset is loaded to the editor
+        """
+        while self._loadedBytes <= byteOffset and \
+                self._loadNextChunk() is not None:
+            pass
+
+    def _byteOffsetToAbsPos(self, byteOffset):
+        """Convert offset in the mapped file to absolute position in the editor. Load the text, if necessary
+        """
+        self._ensureLoaded(byteOffset)
+        index = bisect.bisect_right(self._loadedChunks, (byteOffset, float('inf'))) - 1
+        chunkByteOffset, chunkCharOffset = self._loadedChunks[index]
+        return chunkCharOffset + \
+            len(str(self._mappedFile[chunkByteOffset:byteOffset], 'utf8', 'replace'))
+
+    def isLargeFile(self):
+        """Check if document is opened in the large file mode.
+
+        Such documents are read-only and mapped to the memory.
+        The text is loaded to the editor on demand, when user scrolls it, therefore,
+        ``qutepart.text`` might contain only the beginning of the file.
+        Highlighting, lint and preview are disabled for such documents.
+        """
+        return self._largeFile
+
+    def searchInLargeFile(self, regExp, startAbsPos, forward):
+        """Search the regular expression in the mapped file. Used in the large file mode instead of searching in
+        ``qutepart.text``, which might be not loaded.
+
+        Return ``(start, end)`` absolute positions of the nearest match in the editor, or None if not found.
+        The text is loaded to the editor, if the match is found in not loaded part.
+        Search wraps around the file end.
+        """
+        assert self._largeFile
+        if self._mappedFile is None:
+            return None
+
+        # The chunks are decoded as the editor decodes them, so a position in a chunk text plus
+        # the position of the chunk is a position in the editor.
+        # A chunk is searched together with the next one, so a match may span two chunks.
+        bounds = self._chunkBounds()
+
+        @functools.lru_cache(maxsize=2)
+        def chunkText(index):
+            start, end = bounds[index]
+            return str(self._mappedFile[start:end], 'utf8', 'replace')
+
+        def searchedText(index):
+            text = chunkText(index)
+            if index + 1 < len(bounds):
+                return text + chunkText(index + 1), len(text)
+            return text, len(text)
+
+        chunkCharOffsets = [charOffset for byteOffset, charOffset in self._loadedChunks]
+        startChunk = max(bisect.bisect_right(chunkCharOffsets, startAbsPos) - 1, 0)
+        startPos = startAbsPos - chunkCharOffsets[startChunk]
+
+        found = None
+        if forward:
+            # (chunk index, position to search from). Wrap, search from start
+            order = [(startChunk, startPos)] + \
+                [(index, 0) for index in range(startChunk + 1, len(bounds))] + \
+                [(index, 0) for index in range(startChunk + 1)]
+            for index, pos in order:
+                text, chunkLength = searchedText(index)
+                match = regExp.search(text, pos)
+                if match is not None and match.start() < chunkLength:
+                    found = index, match
+                    break
+        else:
+            # (chunk index, position the match must end before). Wrap, search from end
+            order = [(startChunk, startPos)] + \
+                [(index, None) for index in range(startChunk - 1, -1, -1)] + \
+                [(index, None) for index in range(len(bounds) - 1, startChunk - 1, -1)]
+            for index, endPos in order:
+                text, chunkLength = searchedText(index)
+                for match in regExp.finditer(text, 0, len(text) if endPos is None else endPos):
+                    if match.start() >= chunkLength:
+                        break
+                    found = index, match
+                if found is not None:
+                    break
+
+        if found is None:
+            return None
+
+        index, match = found
+        chunkAbsPos = self._byteOffsetToAbsPos(bounds[index][0])
+        if match.end() > len(chunkText(index)):
+            self._ensureLoaded(bounds[index + 1][0])
+        return chunkAbsPos + match.start(), chunkAbsPos + match.end()
+
     def isExternallyModified(self):
         """Check if document's file has been modified externally.
 
@@ -332,6 +643,94 @@ class Document(QWidget):
         else:
             pass  # Do not enter with statement, because it causes wrong textChanged signal
 
+    def _iterEncodedChunks(self):
+        """Generate the text for saving as encoded chunks.
+        The same text as ``qutepart.textForSaving()``, but full copy is never created
+        """
+        eol = self.qutepart.eol
+        lines = []
+        size = 0
+        block = self.qutepart.document().firstBlock()
+        while block.isValid():
+            line = block.text()
+            lines.append(line)
+            size += len(line)
+            if size >= _SAVE_CHUNK_SIZE:
+                yield (eol.join(lines) + eol).encode('utf8')
+                lines = []
+                size = 0
+            block = block.next()
+
+        if lines:
+            yield (eol.join(lines) + eol).encode('utf8')
+
+    def _writeChunks(self, openedFile):
+        """Write encoded text to the opened file and sync it to the disk.
+        Return hash of written contents
+        """
+        fileHash = hashlib.sha1()
+        for chunk in self._iterEncodedChunks():
+            openedFile.write(chunk)
+            fileHash.update(chunk)
+        openedFile.flush()
+        os.fsync(openedFile.fileno())
+        return fileHash.digest()
+
+    def _writeFile(self, filePath):
+        """Write the text to a temporary file in the same directory and atomically replace the file with it.
+        The file is written in place, if replacing it would lose something: the directory is not writable,
+        the file has other hard links or belongs to another user.
+        Return hash of written contents.
+        IO Exceptions are not catched
+        """
+        targetPath = os.path.realpath(filePath)  # do not replace symlinks with files
+        try:
+            statInfo = os.stat(targetPath)
+        except FileNotFoundError:  # new file
+            statInfo = None
+
+        if statInfo is not None:
+            if not os.access(targetPath, os.W_OK):
+                raise PermissionError("Permission denied: '{}'".format(targetPath))
+            if statInfo.st_nlink > 1 or \
+               (hasattr(os, 'getuid') and statInfo.st_uid != os.getuid()):
+                return self._writeFileInPlace(targetPath)
+
+        dirPath = os.path.dirname(targetPath)
+        try:
+            fd, tmpPath = tempfile.mkstemp(dir=dirPath,
+                                           prefix='.{}.'.format(os.path.basename(targetPath)),
+                                           suffix='.tmp')
+        except (OSError, IOError):
+            if statInfo is None:
+                raise
+            return self._writeFileInPlace(targetPath)  # directory is not writable, but the file is
+
+        try:
+            with os.fdopen(fd, 'wb') as openedFile:
+                fileHash = self._writeChunks(openedFile)
+
+            if statInfo is not None:
+                _copyFileAttributes(targetPath, tmpPath, statInfo)
+            else:
+                os.chmod(tmpPath, 0o666 & ~_umask())
+
+            os.replace(tmpPath, targetPath)
+        except BaseException:
+            if os.path.exists(tmpPath):
+                os.unlink(tmpPath)
+            raise
+
+        return fileHash
+
+    def _writeFileInPlace(self, targetPath):
+        """Truncate the file and write the text to it. Inode, links, owner and attributes are kept,
+        but the file is broken, if writing fails.
+        Return hash of written contents
+        """
+        with open(targetPath, 'wb') as openedFile:
+            return self._writeChunks(openedFile)
+
     def _saveToFs(self, filePath):
         """Low level method. Always saves file, even if not modified
         """
@@ -347,17 +746,11 @@ class Document(QWidget):
                                      self.tr("Cannot create directory '%s'. Error '%s'." % (dirPath, error)))
                 return
 
-        text = self.qutepart.textForSaving()
-
-        # Write file
-        data = text.encode('utf8')
-
         self._fileWatcher.disable()
         try:
-            with open(filePath, 'wb') as openedFile:
-                openedFile.write(data)
-            self._fileWatcher.setContents(data)
-        except IOError as ex:
+            contentsHash = self._writeFile(filePath)
+            self._fileWatcher.setContentsHash(contentsHash)
+        except (OSError, IOError) as ex:
             QMessageBox.critical(None,
                                  self.tr("Cannot write to file"),
                                  str(ex))
@@ -381,6 +774,10 @@ class Document(QWidget):
         Show QFileDialog if file name is not known.
         Return False, if user cancelled QFileDialog, True otherwise
         """
+        if self._largeFile:
+            core.mainWindow().appendMessage("Documents in the large file mode are read-only", 3000)
+            return False
+
         # Get path
         if not self._filePath:
             path, _ = QFileDialog.getSaveFileName(self, self.tr('Save file as...'))
@@ -398,6 +795,10 @@ class Document(QWidget):
     def saveFileAs(self):
         """Ask for new file name with dialog. Save file
         """
+        if self._largeFile:
+            core.mainWindow().appendMessage("Documents in the large file mode are read-only", 3000)
+            return
+
         if self._filePath:
             default_filename = os.path.basename(self._filePath)
         else:
@@ -415,9 +816,22 @@ class Document(QWidget):
         If child class reimplemented this method, it MUST call method of the parent class
         for update internal bookkeeping"""
 
-        text = self._readFile(self.filePath())
         pos = self.qutepart.cursorPosition
-        self.qutepart.text = text
+        if self._largeFile:
+            self._mapFile(self.filePath())
+            self._fileWatcher.setContentsHash(_fileSignature(self.filePath()))
+            self._loadedChunks = []
+            self._loadedBytes = 0
+            self._loadedTail = b''
+            self._loadNextChunk()
+            while pos[0] >= len(self.qutepart.lines) and \
+                    self._loadNextChunk() is not None:
+                pass
+            if pos[0] >= len(self.qutepart.lines):  # file has been truncated
+                pos = (len(self.qutepart.lines) - 1, 0)
+        else:
+            text = self._readFile(self.filePath())
+            self.qutepart.text = text
         self._externallyModified = False
         self._externallyRemoved = False
         self.qutepart.cursorPosition = pos
@@ -0,0 +1,164 @@
+"""
+filewatcher --- Watch opened files for external modifications
+=============================================================
+
+One instance of :class:`enki.core.filewatcher.FileWatcher` serves all opened documents.
+It owns single ``QFileSystemWatcher`` and single polling timer for removed files.
+
+``QFileSystemWatcher`` emits a lot of signals if many files are changed at once (i.e. ``git rebase``).
+The watcher coalesces such signals and dispatches them to the clients after a short delay.
+
+Client is any object, which has method ``onFileChanged(exists)``.
+The method is called when watched file has been modified, removed or restored.
+"""
+
+import os.path
+
+from PyQt5.QtCore import QFileSystemWatcher, QObject, QTimer, pyqtSlot
+
+
+_DEBOUNCE_TIMEOUT_MSEC = 50
+_CHECK_IF_DELETED_TIMEOUT_MSEC = 500
+
+
+class FileWatcher(QObject):
+    """Central file watching service.
+
+    Instance is accessible as: ::
+
+        from enki.core.core import core
+        core.fileWatcher()
+
+    Created by :class:`enki.core.core.Core`
+    """
+
+    def __init__(self, parent):
+        QObject.__init__(self, parent)
+        self._clients = {}  # path: list of clients
+        self._pendingPaths = set()
+        self._recheckPaths = set()
+        self._eventsReceived = 0
+        self._eventsHandled = 0
+
+        self._watcher = QFileSystemWatcher(self)
+        self._watcher.fileChanged.connect(self._onFileChanged)
+
+        self._debounceTimer = QTimer(self)
+        self._debounceTimer.setSingleShot(True)
+        self._debounceTimer.setInterval(_DEBOUNCE_TIMEOUT_MSEC)
+        self._debounceTimer.timeout.connect(self._onDebounceTimer)
+
+        # Used for monitoring files after deletion. Git removes file, than restores it.
+        # Sometimes QFileSystemWatcher emits only 1 signal for 2 modifications, therefore
+        # changed files are checked once more later
+        self._recheckTimer = QTimer(self)
+        self._recheckTimer.setInterval(_CHECK_IF_DELETED_TIMEOUT_MSEC)
+        self._recheckTimer.timeout.connect(self._onRecheckTimer)
+
+    def terminate(self):
+        """Explicitly called destructor
+        """
+        self._debounceTimer.stop()
+        self._recheckTimer.stop()
+        self._watcher.fileChanged.disconnect(self._onFileChanged)
+        if self._watcher.files():
+            self._watcher.removePaths(self._watcher.files())
+        self._clients = {}
+        self._pendingPaths.clear()
+        self._recheckPaths.clear()
+
+    def watch(self, path, client):
+        """Start watching the file for the client.
+
+        ``client.onFileChanged(exists)`` will be called when the file changes
+        """
+        clients = self._clients.setdefault(path, [])
+        if client not in clients:
+            clients.append(client)
+        self.rewatch(path)
+
+    def unwatch(self, path, client):
+        """Stop watching the file for the client.
+
+        The file is not watched anymore, if it has no other clients
+        """
+        clients = self._clients.get(path)
+        if clients is None or client not in clients:
+            return
+
+        clients.remove(client)
+        if not clients:
+            del self._clients[path]
+            self._pendingPaths.discard(path)
+            self._recheckPaths.discard(path)
+            if path in self._watcher.files():
+                self._watcher.removePath(path)
+
+    def rewatch(self, path):
+        """Restart watching the file, if it was created or replaced.
+
+        Qt file watcher may work incorrectly, if file was not existing, when it started
+        """
+        if path in self._clients and \
+           os.path.isfile(path) and \
+           path not in self._watcher.files():
+            self._watcher.addPath(path)
+
+    def eventsReceived(self):
+        """Count of raw ``QFileSystemWatcher`` events received since start
+        """
+        return self._eventsReceived
+
+    def eventsHandled(self):
+        """Count of coalesced per-file events dispatched to the clients since start
+        """
+        return self._eventsHandled
+
+    @pyqtSlot(str)
+    def _onFileChanged(self, path):
+        """QFileSystemWatcher handler. Remember the path, dispatch later
+        """
+        self._eventsReceived += 1
+        self._pendingPaths.add(path)
+        if not self._debounceTimer.isActive():
+            self._debounceTimer.start()
+
+    def _notifyClients(self, path, exists):
+        for client in list(self._clients.get(path, [])):
+            client.onFileChanged(exists)
+
+    @pyqtSlot()
+    def _onDebounceTimer(self):
+        """Dispatch all changes, collected since the first event
+        """
+        pendingPaths = self._pendingPaths
+        self._pendingPaths = set()
+        watchedPaths = set(self._watcher.files())
+
+        for path in pendingPaths:
+            if path not in self._clients:  # unwatched while pending
+                continue
+
+            exists = os.path.exists(path)
+            if exists and path not in watchedPaths:  # file has been replaced
+                self._watcher.addPath(path)
+
+            self._notifyClients(path, exists)
+            self._eventsHandled += 1
+            self._recheckPaths.add(path)
+
+        if self._recheckPaths:
+            self._recheckTimer.start()
+
+    @pyqtSlot()
+    def _onRecheckTimer(self):
+        """Check, if removed files have been restored
+        """
+        for path in list(self._recheckPaths):
+            if os.path.exists(path):
+                self._recheckPaths.discard(path)
+                self.rewatch(path)  # restart Qt file watcher after file has been restored
+                self._notifyClients(path, True)
+
+        if not self._recheckPaths:
+            self._recheckTimer.stop()
@@ -21,6 +21,7 @@ from enki.core.actionmanager import ActionMenuBar
 from enki.core.core import core
 import enki.core.defines
 import enki.core.json_wrapper
+import enki.lib.debounce
 
 
 class _StatusBar(QStatusBar):
@@ -199,6 +200,9 @@ class MainWindow(QMainWindow):
         self._statusBar = _StatusBar(self)
         self._topToolBar.addWidget(self._statusBar)
 
+        if enki.lib.debounce.DEBUG_ENVIRONMENT_VARIABLE in os.environ:
+            self._statusBar.addPermanentWidget(enki.lib.debounce.DelayOverlay(self._statusBar))
+
     def _initQueuedMessageToolBar(self):
         from enki.core.queued_msg_tool_bar import QueuedMessageToolBar
 
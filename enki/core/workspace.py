@@ -28,7 +28,8 @@ import enki.core.openedfilemodel
 from enki.core.document import Document
 
 
-_MAX_SUPPORTED_FILE_SIZE = 50 * 1000 * 1000  # Enki may freeze or crash if file is too big
+_MAX_SUPPORTED_FILE_SIZE = 2 * 1000 * 1000 * 1000  # Can't map bigger files on all platforms
+_LARGE_FILE_SIZE = 50 * 1000 * 1000  # Bigger files are opened in the large file mode. Enki may freeze otherwise
 
 
 class _UISaveFiles(QDialog):
@@ -568,7 +569,7 @@ class Workspace(QStackedWidget):
             return None
 
         # open the file
-        document = Document(self, filePath)
+        document = Document(self, filePath, largeFile=statInfo.st_size > _LARGE_FILE_SIZE)
         self._handleDocument(document)
 
         if not os.access(filePath, os.W_OK):
@@ -0,0 +1,168 @@
+"""
+debounce --- Start processing when the user pauses typing
+=========================================================
+
+:class:`AdaptiveDebouncer` replaces a fixed typing timer. It measures how long
+the processing it schedules takes and picks the pause from it: a fast job runs
+soon after the user stops typing, a slow one waits longer, so that it doesn't
+run again and again while the user is still editing.
+
+While a job is running, the debouncer doesn't start another one. If the pause
+ends meanwhile, the job is started when the running one finishes.
+
+Set the ``ENKI_DEBUG_DEBOUNCE`` environment variable to show the delays of all
+debouncers in the status bar, see :class:`DelayOverlay`.
+"""
+
+import time
+import weakref
+
+from PyQt5.QtCore import pyqtSignal, QObject, QTimer
+from PyQt5.QtWidgets import QLabel
+
+
+DEBUG_ENVIRONMENT_VARIABLE = 'ENKI_DEBUG_DEBOUNCE'
+
+# The pause is this many times the average processing time
+_DELAY_FACTOR = 2
+# Weight of the last measured processing time in the average
+_AVERAGE_WEIGHT = 0.3
+
+# All existing debouncers, for the overlay
+_debouncers = weakref.WeakSet()
+
+
+class AdaptiveDebouncer(QObject):
+    """Emit ``timeout`` when text hasn't changed for a while and no job is running.
+
+    The owner calls :meth:`restart` on every change, :meth:`jobStarted` when it starts processing
+    and :meth:`jobFinished` when the result arrives.
+    """
+    timeout = pyqtSignal()
+    delayChanged = pyqtSignal(int)
+
+    def __init__(self, name, initialDelay, minDelay=200, maxDelay=3000, parent=None):
+        QObject.__init__(self, parent)
+        self._name = name
+        self._minDelay = minDelay
+        self._maxDelay = maxDelay
+        self._delay = initialDelay
+        self._averageSec = None  # average processing time. None until measured
+
+        self._job = 0  # id of the last started job
+        self._jobStartTime = None  # None, if no job is running
+        self._pending = False  # the pause ended while a job was running
+
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(initialDelay)
+        self._timer.timeout.connect(self._onTimeout)
+
+        _debouncers.add(self)
+
+    def name(self):
+        return self._name
+
+    def delay(self):
+        """Current pause in milliseconds
+        """
+        return self._delay
+
+    def averageProcessingTime(self):
+        """Average processing time in seconds or None, if no job has finished yet
+        """
+        return self._averageSec
+
+    def isJobRunning(self):
+        return self._jobStartTime is not None
+
+    def restart(self):
+        """Text changed. Start waiting for a pause again
+        """
+        self._pending = False
+        self._timer.start()
+
+    def stop(self):
+        """Forget about the change. Processing has been started by other means or is not needed
+        """
+        self._timer.stop()
+        self._pending = False
+
+    def jobStarted(self):
+        """Processing started. Returns job id for :meth:`jobFinished`.
+
+        A new job replaces the running one.
+        """
+        self.stop()
+        self._job += 1
+        self._jobStartTime = time.monotonic()
+        return self._job
+
+    def jobFinished(self, job=None):
+        """Processing finished. Results of replaced jobs are ignored.
+        ``None`` means the last started job
+        """
+        if job is not None and job != self._job:
+            return
+        if self._jobStartTime is None:
+            return
+
+        self._measure(time.monotonic() - self._jobStartTime)
+        self._jobStartTime = None
+        self._emitPending()
+
+    def jobCancelled(self):
+        """The running job has been cancelled. It will not call :meth:`jobFinished`
+        """
+        self._jobStartTime = None
+        self._emitPending()
+
+    def _measure(self, durationSec):
+        if self._averageSec is None:
+            self._averageSec = durationSec
+        else:
+            self._averageSec = (_AVERAGE_WEIGHT * durationSec +
+                                (1 - _AVERAGE_WEIGHT) * self._averageSec)
+
+        delay = int(self._averageSec * 1000 * _DELAY_FACTOR)
+        delay = max(self._minDelay, min(self._maxDelay, delay))
+        if delay != self._delay:
+            self._delay = delay
+            self._timer.setInterval(delay)
+            self.delayChanged.emit(delay)
+
+    def _emitPending(self):
+        if self._pending:
+            self._pending = False
+            self.timeout.emit()
+
+    def _onTimeout(self):
+        if self.isJobRunning():
+            self._pending = True
+        else:
+            self.timeout.emit()
+
+
+class DelayOverlay(QLabel):
+    """Debug label which shows delays and processing times of all debouncers
+    """
+    _UPDATE_INTERVAL_MS = 500
+
+    def __init__(self, parent=None):
+        QLabel.__init__(self, parent)
+        self.setStyleSheet("color: gray")
+        self._timer = QTimer(self)
+        self._timer.timeout.connect(self._update)
+        self._timer.start(self._UPDATE_INTERVAL_MS)
+        self._update()
+
+    def _update(self):
+        parts = []
+        for debouncer in sorted(_debouncers, key=lambda d: d.name()):
+            average = debouncer.averageProcessingTime()
+            averageText = '-' if average is None else '{} ms'.format(int(average * 1000))
+            parts.append('{}: {} ms (job {}{})'.format(debouncer.name(),
+                                                      debouncer.delay(),
+                                                      averageText,
+                                                      ', running' if debouncer.isJobRunning() else ''))
+        self.setText('  '.join(parts))
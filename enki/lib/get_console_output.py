@@ -47,9 +47,12 @@ def open_console_output(command, cwd=None, **options):
     return popen
 
 
-def get_console_output(command, cwd=None, **options):
+def get_console_output(command, cwd=None, input=None, **options):
+    """Run the command and return its (stdout, stderr).
+    ``input`` is bytes for the stdin of the command
+    """
     popen = open_console_output(command, cwd, **options)
-    stdout_bin, stderr_bin = popen.communicate()
+    stdout_bin, stderr_bin = popen.communicate(input)
     try:
         stdout = stdout_bin.decode('utf8')
     except UnicodeDecodeError:
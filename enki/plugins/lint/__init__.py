@@ -2,121 +2,157 @@
 """
 
 
-import re
+import os
 import os.path
-import collections
-import queue
+import concurrent.futures
 
-from PyQt5.QtCore import QObject, QThread, pyqtSignal, pyqtSlot
+from PyQt5.QtCore import Qt, QObject, pyqtSignal, pyqtSlot
 from PyQt5.QtGui import QIcon
 
 from enki.core.core import core
 from enki.core.uisettings import ChoiseOption, TextOption, CheckableOption, NumericOption
-from enki.lib.get_console_output import get_console_output
+from enki.lib.debounce import AdaptiveDebouncer
 
 from qutepart import Qutepart
 
+from .linters import LINTERS, lintersForLanguage, lintersForFile
+from .lint_cache import LintCache, contentHash
 
-class ProcessorThread(QThread):
-    """Thread processes text with ctags and returns tags
-    """
-    resultsReady = pyqtSignal(object, object)  # Document, results dict
 
-    _Task = collections.namedtuple("Task", ["document", "language", "filePath"])
+# Linters run at once. Each runs an external process
+_MAX_PROCESSES = max(1, (os.cpu_count() or 2) // 2)
+# Files of a project checked by one linter process
+_BATCH_SIZE = 50
 
-    _PARSER_REG_EXP = re.compile('^(.+):(\d+):(\d+): ([A-Z]\d\d\d .+)$')
 
-    def __init__(self):
-        QThread.__init__(self)
-        self._queue = queue.Queue()
-        self.start(QThread.LowPriority)
+class LintRunner(QObject):
+    """Runs linters in a bounded pool of worker threads and caches the results
+    """
+    # Document, revision, linter name, results dict or None if the linter failed
+    resultsReady = pyqtSignal(object, int, str, object)
+    # Job id, linter name, {file path: results dict}, error message or '' if the linter has been executed
+    filesLinted = pyqtSignal(int, str, object, str)
 
-    def process(self, document):
-        """Parse text and emit results
-        """
-        self._queue.put(self._Task(document,
-                                   document.qutepart.language(),
-                                   document.filePath()))
+    def __init__(self, cache):
+        QObject.__init__(self)
+        self._cache = cache
+        self._executor = concurrent.futures.ThreadPoolExecutor(_MAX_PROCESSES)
+        # Project batches have own pool, so that the current document is not linted after all of them
+        self._filesExecutor = concurrent.futures.ThreadPoolExecutor(_MAX_PROCESSES)
+        # {Document: the last revision}. Jobs of older revisions are skipped
+        self._revisions = {}
+        # {(Document, linter name): Future} of the last revision
+        self._futures = {}
+        # The last job of processFiles() and its futures
+        self._filesJob = None
+        self._filesFutures = []
 
-    def stopAsync(self):
-        self._queue.put(None)
+    def terminate(self):
+        self._revisions.clear()
+        for future in self._futures.values():
+            future.cancel()
+        self._futures.clear()
+        self.cancelFiles()
+        self._executor.shutdown(wait=True)
+        self._filesExecutor.shutdown(wait=True)
+
+    def process(self, document, revision, linter, filePath, text):
+        """Lint the text of the document. The result is emitted with resultsReady.
+        Queued jobs of older revisions of the document are cancelled
+        """
+        self._revisions[document] = revision
+        oldFuture = self._futures.get((document, linter.name))
+        if oldFuture is not None:
+            oldFuture.cancel()
+        self._futures[(document, linter.name)] = \
+            self._executor.submit(self._run, document, revision, linter,
+                                  linter.settings(filePath), filePath, text.encode('utf8'))
+
+    def forget(self, document):
+        """The document has been closed. Skip its jobs
+        """
+        self._revisions.pop(document, None)
+        for key in [key for key in self._futures if key[0] is document]:
+            self._futures.pop(key).cancel()
+
+    def processFiles(self, job, linter, filePaths):
+        """Lint saved files. Results are emitted with filesLinted in batches.
+        The files are grouped by directory, since the settings include it.
+        Return the number of batches
+        """
+        self._filesJob = job
+        batchCount = 0
+        directories = {}
+        for filePath in filePaths:
+            directories.setdefault(os.path.dirname(filePath), []).append(filePath)
+
+        for directoryFiles in directories.values():
+            settings = linter.settings(directoryFiles[0])
+            for start in range(0, len(directoryFiles), _BATCH_SIZE):
+                batch = directoryFiles[start:start + _BATCH_SIZE]
+                self._filesFutures.append(
+                    self._filesExecutor.submit(self._runFiles, job, linter, settings, batch))
+                batchCount += 1
+        return batchCount
+
+    def cancelFiles(self):
+        """Cancel the jobs of processFiles(). Their results are not emitted
+        """
+        self._filesJob = None
+        for future in self._filesFutures:
+            future.cancel()
+        self._filesFutures = []
 
-    def run(self):
+    def _run(self, document, revision, linter, settings, filePath, data):
         """Thread function
         """
-        while True:  # exits with break
-            # wait task
-            task = self._queue.get()
-            # take the last task
-
-            # get the last task
-            while not self._queue.empty():
-                task = self._queue.get()
-
-            if task is None:  # None is a quit command
-                break
-
-            results = self._processSync(task.language, task.filePath)
-
-            if results is not None:
-                self.resultsReady.emit(task.document, results)
-
-    """ Note that most of the PEP8 "errors" listed in
-    http://pep8.readthedocs.org/en/latest/intro.html#error-codes aren't syntax errors.
-    So, mark most of these as warnings instead.
-    Later in the code, E9 errors are actually marked as errors.
-    See https://github.com/andreikop/enki/issues/349.
-    """
-    _MSG_ID_CONVERTOR = {  #
-        'E': Qutepart.LINT_WARNING,
-        'W': Qutepart.LINT_WARNING,
-        'F': Qutepart.LINT_WARNING,
-        'C': Qutepart.LINT_NOTE,
-        'N': Qutepart.LINT_NOTE,
-    }
-
-    _PEP8_ERRORS = ('E112', 'E113', 'E901', 'E902')
-    _PYFLAKES_ERRORS = ('F821', 'F822', 'F823', 'F831', 'E999')
-
-    def _msgType(self, msgId):
-        # Per comments on _MSG_ID_CONVERTOR, mark PEP8/pyflake errors as errors. All
-        # other errors are shown as warnings.
-        if(msgId in self._PEP8_ERRORS or
-           msgId in self._PYFLAKES_ERRORS):
-            return Qutepart.LINT_ERROR
-        else:
-            return self._MSG_ID_CONVERTOR[msgId[0]]
-
-    def _processSync(self, language, filePath):
-        conf = core.config()['Lint']['Python']
-        ignored = ','.join(conf['IgnoredMessages'].split())
-        try:
-            stdout = get_console_output([conf['Path'],
-                                         '--max-line-length={}'.format(conf['MaxLineLength']),
-                                         '--ignore={}'.format(ignored),
-                                         filePath])[0]
-        except OSError:
+        if self._revisions.get(document) != revision:  # outdated
             return
 
-        result = {}
+        hash_ = contentHash(data)
+        results = self._cache.get(linter.name, settings, filePath, hash_)
+        if results is None:
+            try:
+                results = linter.lint(filePath, settings, data)
+            except OSError:
+                results = None
+            else:
+                self._cache.put(linter.name, settings, filePath, hash_, results)
 
-        for line in stdout.splitlines():
-            match = self._PARSER_REG_EXP.match(line)
-            if match:
-                filePath = match.group(1)
-                lineNumber = match.group(2)
-                rest = match.group(4)
+        self.resultsReady.emit(document, revision, linter.name, results)
 
-                msgId, msgText = rest.lstrip().split(' ', 1)
-
-                lineIndex = int(lineNumber) - 1
-                msgType = self._msgType(msgId)
-
-                if msgType is not None:  # not ignored
-                    if lineIndex not in result:
-                        result[lineIndex] = (msgType, rest)
+    def _runFiles(self, job, linter, settings, filePaths):
+        """Thread function
+        """
+        if self._filesJob != job:  # cancelled
+            return
 
-        return result
+        results = {}
+        hashes = {}
+        for filePath in filePaths:
+            try:
+                with open(filePath, 'rb') as f:
+                    hash_ = contentHash(f.read())
+            except OSError:
+                continue
+            cached = self._cache.get(linter.name, settings, filePath, hash_)
+            if cached is not None:
+                results[filePath] = cached
+            else:
+                hashes[filePath] = hash_
+
+        error = ''
+        if hashes:
+            try:
+                linted = linter.lintFiles(list(hashes.keys()), settings)
+            except OSError as ex:
+                linted = {}
+                error = str(ex)
+            for filePath, fileResults in linted.items():
+                self._cache.put(linter.name, settings, filePath, hashes[filePath], fileResults)
+                results[filePath] = fileResults
+
+        self.filesLinted.emit(job, linter.name, results, error)
 
 
 class Plugin(QObject):
@@ -133,33 +169,71 @@ class Plugin(QObject):
 
         self._installed = False
         self._myMessageIsShown = False
-        self._thread = None
+        self._runner = None
+        # {Document: revision}. Incremented when the text changes and when a document is processed.
+        # Results of other revisions don't match the text and are never shown
+        self._revisions = {}
+        # {Document: {linter name: results dict}} of the last revision
+        self._results = {}
+        # {Document: [revision, debouncer job id, number of linters still running]}
+        self._jobs = {}
+        # Documents, which have been edited since processed
+        self._editedDocuments = set()
+
+        self._dock = None
+        # Id of the last project lint job, and the number of its batches still running
+        self._projectJob = 0
+        self._projectBatches = 0
+        # {linter name: error message} of the last project lint job
+        self._projectErrors = {}
+        self._waitingForProjectFiles = False
+
+        self._typingDebouncer = AdaptiveDebouncer('Lint', initialDelay=1000, parent=self)
+        self._typingDebouncer.timeout.connect(self._onTypingPause)
+
+        core.config().setdefault('Lint/Shell', {})
+        core.config().setdefault('Lint/Shell/Enabled', True)
+        core.config().setdefault('Lint/Shell/Path', 'shellcheck')
+
+        self._cache = LintCache()
+        self._cache.load()
 
         core.uiSettingsManager().aboutToExecute.connect(self._onSettingsDialogAboutToExecute)
         core.uiSettingsManager().dialogAccepted.connect(self._applySettings)
+        core.project().changed.connect(self._onProjectChanged)
+        core.project().filesReady.connect(self._onProjectFilesReady)
+
+        self._lintProjectAction = core.actionManager().addAction("mTools/aLintProject", "Lint project")
+        self._lintProjectAction.triggered.connect(self._lintProject)
 
         self._applySettings()
 
     def terminate(self):
         """Uninstall the plugin
         """
-        if self._thread is not None:
-            self._thread.stopAsync()
-            self._thread.wait()
-
         self._uninstall()
+        self._cache.save()
 
         core.uiSettingsManager().aboutToExecute.disconnect(self._onSettingsDialogAboutToExecute)
         core.uiSettingsManager().dialogAccepted.disconnect(self._applySettings)
+        core.project().changed.disconnect(self._onProjectChanged)
+        core.project().filesReady.disconnect(self._onProjectFilesReady)
+
+        core.actionManager().removeAction(self._lintProjectAction)
+        if self._dock is not None:
+            self._dock.terminate()
+            core.mainWindow().removeDockWidget(self._dock)
+            self._dock = None
 
     def _install(self):
         if self._installed:
             return
 
         core.workspace().documentOpened.connect(self._onDocumentOpened)
+        core.workspace().documentClosed.connect(self._onDocumentClosed)
         core.workspace().currentDocumentChanged.connect(self._onCurrentDocumentChanged)
         core.workspace().cursorPositionChanged.connect(self._onCursorPositionChanged)
-        core.workspace().modificationChanged.connect(self._onModificationChanged)
+        core.workspace().textChanged.connect(self._onTextChanged)
         core.mainWindow().statusBar().messageChanged.connect(self._onStatusBarMessageChanged)
 
         self._installed = True
@@ -169,16 +243,25 @@ class Plugin(QObject):
             return
 
         core.workspace().documentOpened.disconnect(self._onDocumentOpened)
+        core.workspace().documentClosed.disconnect(self._onDocumentClosed)
         core.workspace().currentDocumentChanged.disconnect(self._onCurrentDocumentChanged)
         core.workspace().cursorPositionChanged.disconnect(self._onCursorPositionChanged)
-        core.workspace().modificationChanged.disconnect(self._onModificationChanged)
+        core.workspace().textChanged.disconnect(self._onTextChanged)
         core.mainWindow().statusBar().messageChanged.disconnect(self._onStatusBarMessageChanged)
 
-        if self._thread is not None:
-            self._thread.resultsReady.disconnect(self._onResultsReady)
-            self._thread.stopAsync()
-            self._thread.wait()
-            self._thread = None
+        if self._runner is not None:
+            self._runner.resultsReady.disconnect(self._onResultsReady)
+            self._runner.filesLinted.disconnect(self._onProjectFilesLinted)
+            self._runner.terminate()
+            self._runner = None
+        self._stopProjectLint('Stopped')
+        self._typingDebouncer.stop()
+        if self._jobs:
+            self._typingDebouncer.jobCancelled()
+        self._jobs.clear()
+        self._revisions.clear()
+        self._results.clear()
+        self._editedDocuments.clear()
 
         self._clearMessage()
 
@@ -208,8 +291,11 @@ class Plugin(QObject):
                                           "Lint/Python/MaxLineLength", widget.spMaxLineLength))
 
     def _applySettings(self):
-        if core.config()['Lint']['Python']['Enabled']:
+        if any(linter.isEnabled() for linter in LINTERS):
             self._install()
+            for document in core.workspace().documents():
+                if not lintersForLanguage(document.qutepart.language()):
+                    document.qutepart.lintMarks = {}
             if self._isSupported(core.workspace().currentDocument()):
                 self._processDocument(core.workspace().currentDocument())
         else:
@@ -217,27 +303,62 @@ class Plugin(QObject):
             for document in core.workspace().documents():
                 document.qutepart.lintMarks = {}
 
+    def _getRunner(self):
+        if self._runner is None:
+            self._runner = LintRunner(self._cache)
+            self._runner.resultsReady.connect(self._onResultsReady)
+            self._runner.filesLinted.connect(self._onProjectFilesLinted)
+        return self._runner
+
     def _processDocument(self, document):
-        if self._thread is None:
-            self._thread = ProcessorThread()
-            self._thread.resultsReady.connect(self._onResultsReady)
+        linters = lintersForLanguage(document.qutepart.language())
+        revision = self._revisions.get(document, 0) + 1
+        self._revisions[document] = revision
+        self._results[document] = {}
+        self._editedDocuments.discard(document)
+        self._jobs[document] = [revision, self._typingDebouncer.jobStarted(), len(linters)]
 
-        self._thread.process(document)
+        text = document.qutepart.text
+        for linter in linters:
+            self._getRunner().process(document, revision, linter, document.filePath(), text)
 
     def _isSupported(self, document):
         return document is not None and \
             document.filePath() is not None and \
-            document.qutepart.language() in ('Python',)
+            not document.isLargeFile() and \
+            bool(lintersForLanguage(document.qutepart.language()))
 
     def _onDocumentOpened(self, document):
-        if not core.config()['Lint']['Python']['Enabled']:
-            return
-
         if self._isSupported(document):
             self._processDocument(document)
 
+    def _onDocumentClosed(self, document):
+        self._revisions.pop(document, None)
+        self._results.pop(document, None)
+        self._editedDocuments.discard(document)
+        job = self._jobs.pop(document, None)
+        if job is not None:
+            self._typingDebouncer.jobFinished(job[1])
+        if self._runner is not None:
+            self._runner.forget(document)
+
     def _onCurrentDocumentChanged(self, old, new):
         self._clearMessage()
+        if new in self._editedDocuments and self._isSupported(new):
+            self._typingDebouncer.stop()
+            self._processDocument(new)
+
+    def _onTextChanged(self, document):
+        # Results, which are being prepared, don't match the text anymore
+        self._revisions[document] = self._revisions.get(document, 0) + 1
+        self._editedDocuments.add(document)
+        if document is core.workspace().currentDocument():
+            self._typingDebouncer.restart()
+
+    def _onTypingPause(self):
+        document = core.workspace().currentDocument()
+        if document in self._editedDocuments and self._isSupported(document):
+            self._processDocument(document)
 
     def _onCursorPositionChanged(self, document):
         lineNumber = document.qutepart.cursorPosition[0]
@@ -253,27 +374,37 @@ class Plugin(QObject):
         if self._myMessageIsShown:
             statusBar.clearMessage()
 
-    def _onModificationChanged(self, document, modified):
-        if not modified:
-            if self._isSupported(document):
-                self._processDocument(document)
-
     def _onStatusBarMessageChanged(self):
         self._myMessageIsShown = False
 
-    @pyqtSlot(object, object)
-    def _onResultsReady(self, document, results):
-        # Check that the document with lint marks is still the current document.
-        if core.workspace().currentDocument() is not document:
+    @pyqtSlot(object, int, str, object)
+    def _onResultsReady(self, document, revision, linterName, results):
+        job = self._jobs.get(document)
+        if job is not None and job[0] == revision:
+            job[2] -= 1
+            if job[2] == 0:
+                del self._jobs[document]
+                self._typingDebouncer.jobFinished(job[1])
+
+        # Check that the results match the current text of an open document
+        if self._revisions.get(document) != revision:
             return
+        self._results[document][linterName] = results if results is not None else {}
+
         errors = 0
         warnings = 0
 
         visibleMessagesFilter = self._LEVEL_FILTER[core.config().get('Lint/Python/Show')]
 
-        filteredResults = {lineNumber: value
-                           for lineNumber, value in results.items()
-                           if (value[0] in visibleMessagesFilter)}
+        # Show the most severe message of a line
+        filteredResults = {}
+        for linterResults in self._results[document].values():
+            for lineNumber, value in linterResults.items():
+                if value[0] in visibleMessagesFilter and \
+                   (lineNumber not in filteredResults or
+                        visibleMessagesFilter.index(value[0]) <
+                        visibleMessagesFilter.index(filteredResults[lineNumber][0])):
+                    filteredResults[lineNumber] = value
 
         for level, message in filteredResults.values():
             if level == Qutepart.LINT_ERROR:
@@ -282,6 +413,9 @@ class Plugin(QObject):
                 warnings += 1
 
         document.qutepart.lintMarks = filteredResults
+        # Other documents keep the marks. Messages are shown for the current one
+        if core.workspace().currentDocument() is not document:
+            return
         if document.qutepart.cursorPosition[0] in filteredResults:
             self._onCursorPositionChanged(document)  # show msg on statusbar
         elif errors:
@@ -290,3 +424,89 @@ class Plugin(QObject):
         elif warnings:
             core.mainWindow().statusBar().showMessage('Lint: {} warning(s) found'.format(warnings))
             self._myMessageIsShown = True
+
+    def _lintProject(self):
+        """Lint all files of the project. Results are shown in the dock
+        """
+        if self._dock is None:
+            from .project_lint import ProjectLintDock
+            self._dock = ProjectLintDock(core.mainWindow())
+            core.mainWindow().addDockWidget(Qt.BottomDockWidgetArea, self._dock)
+
+        if self._runner is not None:
+            self._runner.cancelFiles()
+        self._projectJob += 1
+        self._projectBatches = 0
+        self._projectErrors = {}
+        self._dock.clear()
+        self._dock.show()
+
+        if not any(linter.isEnabled() for linter in LINTERS):
+            self._dock.setStatus('All linters are disabled')
+        elif core.project().files() is None:
+            self._waitingForProjectFiles = True
+            core.project().startLoadingFiles()
+            self._dock.setStatus(core.project().scanStatus())
+        else:
+            self._startProjectLint()
+
+    def _startProjectLint(self):
+        self._waitingForProjectFiles = False
+        projectPath = core.project().path()
+        # {linter: [absolute file path]}
+        filesOfLinters = {}
+        for relPath in core.project().files():
+            for linter in lintersForFile(relPath):
+                filesOfLinters.setdefault(linter, []).append(os.path.join(projectPath, relPath))
+
+        for linter, filePaths in filesOfLinters.items():
+            self._projectBatches += self._getRunner().processFiles(self._projectJob, linter, filePaths)
+
+        fileCount = sum(len(filePaths) for filePaths in filesOfLinters.values())
+        if self._projectBatches:
+            self._dock.setStatus('Linting {} files'.format(fileCount))
+        else:
+            self._dock.setStatus('No files to lint')
+
+    def _stopProjectLint(self, status):
+        if self._waitingForProjectFiles or self._projectBatches:
+            self._projectJob += 1
+            self._projectBatches = 0
+            self._waitingForProjectFiles = False
+            if self._runner is not None:
+                self._runner.cancelFiles()
+            if self._dock is not None:
+                self._dock.setStatus(status)
+
+    def _onProjectChanged(self, path):
+        self._stopProjectLint('Stopped. The project has been changed')
+
+    def _onProjectFilesReady(self):
+        if self._waitingForProjectFiles:
+            self._startProjectLint()
+
+    @pyqtSlot(int, str, object, str)
+    def _onProjectFilesLinted(self, job, linterName, results, error):
+        if job != self._projectJob or self._dock is None:
+            return
+        if error:
+            self._projectErrors[linterName] = error
+
+        visibleMessagesFilter = self._LEVEL_FILTER[core.config().get('Lint/Python/Show')]
+        projectPath = core.project().path()
+        for filePath, fileResults in results.items():
+            filteredResults = {lineNumber: value
+                               for lineNumber, value in fileResults.items()
+                               if value[0] in visibleMessagesFilter}
+            self._dock.appendResults(filePath, os.path.relpath(filePath, projectPath), filteredResults)
+
+        self._projectBatches -= 1
+        if self._projectBatches == 0:
+            model = self._dock.model()
+            status = '{} error(s), {} warning(s) in {} file(s)'.format(
+                model.messageCount(Qutepart.LINT_ERROR),
+                model.messageCount(Qutepart.LINT_WARNING),
+                model.fileCount())
+            for name, error in sorted(self._projectErrors.items()):
+                status += '. Failed to run {}: {}'.format(name, error)
+            self._dock.setStatus(status)
@@ -0,0 +1,89 @@
+"""Cache of lint results
+
+Results are keyed by the linter, its settings, the file path and the hash of the checked file contents,
+so that reopening a file, which hasn't changed, shows its messages without running the linter.
+The settings include the modification times of the linter configuration files. The path is a part of
+the key, since the configuration may apply to some files only, like flake8 ``per-file-ignores``.
+The cache keeps the ``_MAX_ENTRIES`` most recently used results and is saved to the
+configuration directory when Enki exits.
+"""
+
+import collections
+import hashlib
+import json
+import os
+import os.path
+import sys
+import threading
+
+from enki.core.defines import CONFIG_DIR
+
+
+_MAX_ENTRIES = 2000
+_FILE_FORMAT_VERSION = 2
+
+
+def contentHash(data):
+    return hashlib.sha1(data).hexdigest()
+
+
+def _keyText(linterName, settings, filePath, hash_):
+    return json.dumps([linterName, repr(settings), filePath, hash_])
+
+
+class LintCache:
+    """Thread safe LRU cache of lint results
+    """
+    def __init__(self, filePath=None):
+        self._filePath = filePath or os.path.join(CONFIG_DIR, 'lint_cache.json')
+        self._lock = threading.Lock()
+        # {key text: {line index: (message type, message text)}}, the least recently used first
+        self._entries = collections.OrderedDict()
+        self._modified = False
+
+    def get(self, linterName, settings, filePath, hash_):
+        key = _keyText(linterName, settings, filePath, hash_)
+        with self._lock:
+            result = self._entries.get(key)
+            if result is not None:
+                self._entries.move_to_end(key)
+            return result
+
+    def put(self, linterName, settings, filePath, hash_, result):
+        key = _keyText(linterName, settings, filePath, hash_)
+        with self._lock:
+            self._entries[key] = result
+            self._entries.move_to_end(key)
+            while len(self._entries) > _MAX_ENTRIES:
+                self._entries.popitem(last=False)
+            self._modified = True
+
+    def load(self):
+        try:
+            with open(self._filePath, encoding='utf8') as f:
+                data = json.load(f)
+            if data.get('version') != _FILE_FORMAT_VERSION:
+                return
+            entries = [(key, {int(lineIndex): tuple(message)
+                              for lineIndex, message in result.items()})
+                       for key, result in data['entries']]
+        except (OSError, ValueError, KeyError, TypeError, AttributeError):
+            return
+        with self._lock:
+            self._entries = collections.OrderedDict(entries[-_MAX_ENTRIES:])
+            self._modified = False
+
+    def save(self):
+        with self._lock:
+            if not self._modified:
+                return
+            data = {'version': _FILE_FORMAT_VERSION,
+                    'entries': list(self._entries.items())}
+            self._modified = False
+        try:
+            os.makedirs(os.path.dirname(self._filePath), exist_ok=True)
+            with open(self._filePath + '.tmp', 'w', encoding='utf8') as f:
+                json.dump(data, f)
+            os.replace(self._filePath + '.tmp', self._filePath)
+        except OSError as ex:
+            print('lint: failed to save the cache to {}: {}'.format(self._filePath, ex), file=sys.stderr)
@@ -0,0 +1,269 @@
+"""Linters supported by the lint plugin
+
+A linter runs an external utility for the text of a document, passed through stdin,
+and parses its output to ``{line index: (message type, message text)}``. To support a new one, subclass :class:`Linter`
+and add it to ``LINTERS``.
+
+Linters are run in worker threads. They read the configuration in the GUI thread,
+with :meth:`Linter.settings`, and get it as a parameter.
+"""
+
+import abc
+import fnmatch
+import os
+import os.path
+import re
+
+from qutepart import Qutepart
+
+from enki.core.core import core
+from enki.lib.get_console_output import get_console_output
+
+
+def _configStamps(directory, fileNames, otherPaths=()):
+    """Modification times and sizes of the configuration files, which exist.
+    The files are looked up by name in the directory and its parents
+    """
+    paths = []
+    while True:
+        paths.extend(os.path.join(directory, fileName) for fileName in fileNames)
+        parent = os.path.dirname(directory)
+        if parent == directory:
+            break
+        directory = parent
+    paths.extend(otherPaths)
+
+    stamps = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        stamps.append((path, stat.st_mtime_ns, stat.st_size))
+    return tuple(stamps)
+
+
+class Linter(abc.ABC):
+    """Base class for linters. Subclasses set ``name``, which is also a part of the cache key,
+    and implement :meth:`lint`
+    """
+    # Names of configuration files, which the utility looks for in the directory of the file and its parents
+    configFileNames = ()
+    # Qutepart languages the linter checks
+    languages = ()
+    # File name masks of the languages. Used to find project files to check
+    fileMasks = ()
+
+    def isEnabled(self):
+        return True
+
+    def userConfigPaths(self):
+        """Configuration files of the utility, which don't depend on the checked file
+        """
+        return ()
+
+    def settings(self, filePath):
+        """Everything which affects the results, except the file contents and name. Must be hashable.
+        Files of a directory share the settings.
+
+        Called in the GUI thread. Starts with the file directory, since linters read
+        configuration files from it, and with the modification times of the configuration files
+        """
+        directory = os.path.dirname(filePath)
+        return (directory, _configStamps(directory, self.configFileNames, self.userConfigPaths()))
+
+    @abc.abstractmethod
+    def lint(self, filePath, settings, data):
+        """Check ``data``, the utf8 encoded text of the file, which may be unsaved.
+        Return ``{line index: (message type, message text)}``. Called in a worker thread.
+
+        Raise OSError if the utility can't be executed
+        """
+
+    def lintFiles(self, filePaths, settings):
+        """Check saved files, which share the settings.
+        Return ``{file path: {line index: (message type, message text)}}``. Called in a worker thread.
+
+        Raise OSError if the utility can't be executed
+        """
+        results = {}
+        for filePath in filePaths:
+            try:
+                with open(filePath, 'rb') as f:
+                    data = f.read()
+            except OSError:
+                continue
+            results[filePath] = self.lint(filePath, settings, data)
+        return results
+
+    @staticmethod
+    def _addMessage(result, lineIndex, msgType, text):
+        """Add a message. Keep the first message of a line
+        """
+        if lineIndex not in result:
+            result[lineIndex] = (msgType, text)
+
+
+class Flake8(Linter):
+    name = 'flake8'
+    languages = ('Python',)
+    fileMasks = ('*.py', '*.pyw')
+    configFileNames = ('setup.cfg', 'tox.ini', '.flake8')
+
+    _PARSER_REG_EXP = re.compile('^(.+):(\d+):(\d+): ([A-Z]\d\d\d .+)$')
+
+    """ Note that most of the PEP8 "errors" listed in
+    http://pep8.readthedocs.org/en/latest/intro.html#error-codes aren't syntax errors.
+    So, mark most of these as warnings instead.
+    Later in the code, E9 errors are actually marked as errors.
+    See https://github.com/andreikop/enki/issues/349.
+    """
+    _MSG_ID_CONVERTOR = {  #
+        'E': Qutepart.LINT_WARNING,
+        'W': Qutepart.LINT_WARNING,
+        'F': Qutepart.LINT_WARNING,
+        'C': Qutepart.LINT_NOTE,
+        'N': Qutepart.LINT_NOTE,
+    }
+
+    _PEP8_ERRORS = ('E112', 'E113', 'E901', 'E902')
+    _PYFLAKES_ERRORS = ('F821', 'F822', 'F823', 'F831', 'E999')
+
+    def isEnabled(self):
+        return core.config()['Lint']['Python']['Enabled']
+
+    def userConfigPaths(self):
+        # Used by flake8 before 4.0
+        configHome = os.environ.get('XDG_CONFIG_HOME') or os.path.expanduser(os.path.join('~', '.config'))
+        return (os.path.join(configHome, 'flake8'),)
+
+    def settings(self, filePath):
+        conf = core.config()['Lint']['Python']
+        return Linter.settings(self, filePath) + \
+            (conf['Path'], conf['MaxLineLength'], ','.join(conf['IgnoredMessages'].split()))
+
+    def _msgType(self, msgId):
+        # Per comments on _MSG_ID_CONVERTOR, mark PEP8/pyflake errors as errors. All
+        # other errors are shown as warnings.
+        if(msgId in self._PEP8_ERRORS or
+           msgId in self._PYFLAKES_ERRORS):
+            return Qutepart.LINT_ERROR
+        else:
+            return self._MSG_ID_CONVERTOR.get(msgId[0])
+
+    def lint(self, filePath, settings, data):
+        directory, configStamps, path, maxLineLength, ignored = settings
+        # flake8 finds its configuration files in the working directory
+        stdout = get_console_output([path,
+                                     '--max-line-length={}'.format(maxLineLength),
+                                     '--ignore={}'.format(ignored),
+                                     '--stdin-display-name={}'.format(filePath),
+                                     '-'],
+                                    cwd=directory,
+                                    input=data)[0]
+        return self._parse(stdout).get(filePath, {})
+
+    def lintFiles(self, filePaths, settings):
+        directory, configStamps, path, maxLineLength, ignored = settings
+        # The files are already checked in parallel. Don't start a process per CPU for each batch
+        stdout = get_console_output([path,
+                                     '--max-line-length={}'.format(maxLineLength),
+                                     '--ignore={}'.format(ignored),
+                                     '--jobs=1'] +
+                                    list(filePaths),
+                                    cwd=directory)[0]
+        results = self._parse(stdout)
+        return {filePath: results.get(filePath, {})
+                for filePath in filePaths}
+
+    def _parse(self, stdout):
+        """Parse the output to ``{file path: results}``
+        """
+        results = {}
+
+        for line in stdout.splitlines():
+            match = self._PARSER_REG_EXP.match(line)
+            if match:
+                lineNumber = match.group(2)
+                rest = match.group(4)
+
+                msgId, msgText = rest.lstrip().split(' ', 1)
+
+                msgType = self._msgType(msgId)
+
+                if msgType is not None:  # not ignored
+                    self._addMessage(results.setdefault(match.group(1), {}),
+                                     int(lineNumber) - 1, msgType, rest)
+
+        return results
+
+
+class ShellCheck(Linter):
+    name = 'shellcheck'
+    languages = ('Bash',)
+    fileMasks = ('*.sh', '*.bash')
+    configFileNames = ('.shellcheckrc', 'shellcheckrc')
+
+    _PARSER_REG_EXP = re.compile('^(.+):(\d+):(\d+): (error|warning|note): (.+)$')
+
+    _MSG_TYPE_CONVERTOR = {
+        'error': Qutepart.LINT_ERROR,
+        'warning': Qutepart.LINT_WARNING,
+        'note': Qutepart.LINT_NOTE,
+    }
+
+    def isEnabled(self):
+        return core.config()['Lint']['Shell']['Enabled']
+
+    def userConfigPaths(self):
+        configHome = os.environ.get('XDG_CONFIG_HOME') or os.path.expanduser(os.path.join('~', '.config'))
+        return (os.path.join(configHome, 'shellcheckrc'),
+                os.path.expanduser(os.path.join('~', '.shellcheckrc')))
+
+    def settings(self, filePath):
+        return Linter.settings(self, filePath) + (core.config()['Lint']['Shell']['Path'],)
+
+    def lint(self, filePath, settings, data):
+        directory, configStamps, path = settings
+        command = [path, '--format=gcc']
+        # ShellCheck can't guess the shell of stdin by the file name
+        if not data.startswith(b'#!'):
+            command.append('--shell=bash')
+        stdout = get_console_output(command + ['-'], cwd=directory, input=data)[0]
+        return self._parse(stdout).get('-', {})
+
+    def lintFiles(self, filePaths, settings):
+        directory, configStamps, path = settings
+        stdout = get_console_output([path, '--format=gcc'] + list(filePaths), cwd=directory)[0]
+        results = self._parse(stdout)
+        return {filePath: results.get(filePath, {})
+                for filePath in filePaths}
+
+    def _parse(self, stdout):
+        """Parse the output to ``{file path: results}``
+        """
+        results = {}
+        for line in stdout.splitlines():
+            match = self._PARSER_REG_EXP.match(line)
+            if match:
+                self._addMessage(results.setdefault(match.group(1), {}), int(match.group(2)) - 1,
+                                 self._MSG_TYPE_CONVERTOR[match.group(4)], match.group(5))
+        return results
+
+
+LINTERS = (Flake8(), ShellCheck())
+
+
+def lintersForLanguage(language):
+    """Enabled linters for the Qutepart language
+    """
+    return [linter for linter in LINTERS
+            if language in linter.languages and linter.isEnabled()]
+
+
+def lintersForFile(fileName):
+    """Enabled linters for the file name
+    """
+    return [linter for linter in LINTERS
+            if any(fnmatch.fnmatch(fileName, mask) for mask in linter.fileMasks) and
+            linter.isEnabled()]
@@ -0,0 +1,218 @@
+"""Lint results of the whole project
+
+The dock shows messages of all project files, grouped by file, as they are streamed from the linters.
+"""
+
+import bisect
+import os.path
+
+from PyQt5.QtCore import Qt, QAbstractItemModel, QModelIndex
+from PyQt5.QtWidgets import QLabel, QTreeView, QVBoxLayout, QWidget
+from PyQt5.QtGui import QIcon
+
+from qutepart import Qutepart
+
+from enki.core.core import core
+from enki.widgets.dockwidget import DockWidget
+
+
+_TYPE_NAMES = {Qutepart.LINT_ERROR: 'error',
+               Qutepart.LINT_WARNING: 'warning',
+               Qutepart.LINT_NOTE: 'note'}
+
+
+class _FileMessages:
+    """Messages of a file. Top level item of the model
+    """
+    def __init__(self, filePath, relPath, messages):
+        self.filePath = filePath
+        self.relPath = relPath
+        self.messages = messages  # list of _Message, sorted by line
+
+    def text(self):
+        return '{} ({})'.format(self.relPath, len(self.messages))
+
+
+class _Message:
+    def __init__(self, fileMessages, lineIndex, msgType, msgText):
+        self.fileMessages = fileMessages
+        self.lineIndex = lineIndex
+        self.msgType = msgType
+        self.msgText = msgText
+
+    def text(self):
+        return 'Line {}: {}: {}'.format(self.lineIndex + 1, _TYPE_NAMES.get(self.msgType, ''), self.msgText)
+
+
+class ProjectLintModel(QAbstractItemModel):
+    """Files with messages, sorted by path, and their messages
+    """
+    def __init__(self, parent):
+        QAbstractItemModel.__init__(self, parent)
+        self._files = []  # list of _FileMessages
+        self._relPaths = []  # sorted relative paths of _files, for bisect
+
+    def clear(self):
+        self.beginResetModel()
+        self._files = []
+        self._relPaths = []
+        self.endResetModel()
+
+    def empty(self):
+        return not self._files
+
+    def messageCount(self, msgType):
+        return sum(1
+                   for fileMessages in self._files
+                   for message in fileMessages.messages
+                   if message.msgType == msgType)
+
+    def fileCount(self):
+        return len(self._files)
+
+    def appendResults(self, filePath, relPath, results):
+        """Add messages of a file. ``results`` is ``{line index: (message type, message text)}``
+        """
+        if not results:
+            return
+
+        row = bisect.bisect_left(self._relPaths, relPath)
+        if row < len(self._relPaths) and self._relPaths[row] == relPath:
+            # The file is checked by one more linter
+            fileMessages = self._files[row]
+            parentIndex = self.index(row, 0, QModelIndex())
+            self.beginRemoveRows(parentIndex, 0, len(fileMessages.messages) - 1)
+            oldMessages = fileMessages.messages
+            fileMessages.messages = []
+            self.endRemoveRows()
+            messages = oldMessages + self._makeMessages(fileMessages, results)
+            messages.sort(key=lambda message: message.lineIndex)
+            self.beginInsertRows(parentIndex, 0, len(messages) - 1)
+            fileMessages.messages = messages
+            self.endInsertRows()
+            self.dataChanged.emit(parentIndex, parentIndex)
+        else:
+            fileMessages = _FileMessages(filePath, relPath, [])
+            fileMessages.messages = self._makeMessages(fileMessages, results)
+            self.beginInsertRows(QModelIndex(), row, row)
+            self._files.insert(row, fileMessages)
+            self._relPaths.insert(row, relPath)
+            self.endInsertRows()
+
+    @staticmethod
+    def _makeMessages(fileMessages, results):
+        return [_Message(fileMessages, lineIndex, msgType, msgText)
+                for lineIndex, (msgType, msgText) in sorted(results.items())]
+
+    def index(self, row, column, parent):
+        """See QAbstractItemModel docs
+        """
+        if row < 0 or row >= self.rowCount(parent) or column != 0:
+            return QModelIndex()
+
+        if parent.isValid():
+            return self.createIndex(row, column, parent.internalPointer().messages[row])
+        else:
+            return self.createIndex(row, column, self._files[row])
+
+    def parent(self, index):
+        """See QAbstractItemModel docs
+        """
+        if not index.isValid():
+            return QModelIndex()
+
+        item = index.internalPointer()
+        if isinstance(item, _FileMessages):
+            return QModelIndex()
+
+        row = bisect.bisect_left(self._relPaths, item.fileMessages.relPath)
+        return self.createIndex(row, 0, item.fileMessages)
+
+    def rowCount(self, parent):
+        """See QAbstractItemModel docs
+        """
+        if not parent.isValid():
+            return len(self._files)
+
+        item = parent.internalPointer()
+        if isinstance(item, _FileMessages):
+            return len(item.messages)
+        else:
+            return 0
+
+    def columnCount(self, parent):
+        """See QAbstractItemModel docs
+        """
+        return 1
+
+    def data(self, index, role):
+        """See QAbstractItemModel docs
+        """
+        if not index.isValid():
+            return None
+
+        item = index.internalPointer()
+        if role == Qt.DisplayRole:
+            return item.text()
+        elif role == Qt.ToolTipRole:
+            return item.filePath if isinstance(item, _FileMessages) else item.msgText
+        else:
+            return None
+
+
+class ProjectLintDock(DockWidget):
+    """Dock with lint results of the project
+    """
+
+    def __init__(self, parent):
+        DockWidget.__init__(self, parent, "&Lint Results",
+                            QIcon(os.path.join(os.path.dirname(__file__), 'python.png')), "Alt+L")
+
+        self._model = ProjectLintModel(self)
+
+        widget = QWidget(self)
+        layout = QVBoxLayout(widget)
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.setSpacing(1)
+
+        self._statusLabel = QLabel(widget)
+        layout.addWidget(self._statusLabel)
+
+        self._view = QTreeView(widget)
+        self._view.setHeaderHidden(True)
+        self._view.setUniformRowHeights(True)
+        self._view.setModel(self._model)
+        layout.addWidget(self._view)
+
+        self.setWidget(widget)
+        self.setFocusProxy(self._view)
+
+        self._view.activated.connect(self._onActivated)
+
+        core.actionManager().addAction("mView/aLintResults", self.showAction())
+
+    def terminate(self):
+        core.actionManager().removeAction("mView/aLintResults")
+
+    def clear(self):
+        self._model.clear()
+        self._statusLabel.clear()
+
+    def setStatus(self, text):
+        self._statusLabel.setText(text)
+
+    def model(self):
+        return self._model
+
+    def appendResults(self, filePath, relPath, results):
+        self._model.appendResults(filePath, relPath, results)
+
+    def _onActivated(self, index):
+        """Open the file and go to the line of the message
+        """
+        item = index.internalPointer()
+        if isinstance(item, _Message):
+            core.workspace().goTo(item.fileMessages.filePath, line=item.lineIndex)
+            self.setFocus()
+        elif isinstance(item, _FileMessages):
+            core.workspace().goTo(item.filePath)
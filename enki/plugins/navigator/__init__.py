@@ -5,7 +5,7 @@ import os.path
 import collections
 import queue
 
-from PyQt5.QtCore import pyqtSignal, QObject, QThread, QTimer
+from PyQt5.QtCore import pyqtSignal, QObject, QThread
 from PyQt5.QtWidgets import QFileDialog, QWidget
 from PyQt5.QtGui import QIcon
 from PyQt5 import uic
@@ -14,9 +14,12 @@ from PyQt5 import uic
 from enki.core.core import core
 from enki.core.uisettings import TextOption, CheckableOption
 import enki.lib.get_console_output as gco
+from enki.lib.debounce import AdaptiveDebouncer
 
 from . import ctags
 from .dock import NavigatorDock
+from .symbol_index import SymbolIndex
+from .symbol_locator import SymbolCommand
 
 
 # source map. 1 ctags language is mapped to multiply Qutepart languages
@@ -77,18 +80,22 @@ class ProcessorThread(QThread):
     """
     tagsReady = pyqtSignal(list)
     error = pyqtSignal(str)
+    # Task has been processed, after tagsReady or error. Job id, passed to process()
+    processed = pyqtSignal(int)
 
-    _Task = collections.namedtuple("Task", ["ctagsLang", "text", "sortAlphabetically"])
+    _Task = collections.namedtuple("Task", ["ctagsLang", "text", "sortAlphabetically", "job"])
 
     def __init__(self):
         QThread.__init__(self)
         self._queue = queue.Queue()
+        # Used by the thread only
+        self._tagger = ctags.Tagger()
         self.start(QThread.LowPriority)
 
-    def process(self, ctagsLang, text, sortAlphabetically):
-        """Parse text and emit tags
+    def process(self, ctagsLang, text, sortAlphabetically, job):
+        """Parse text and emit tags. ``job`` is emitted with ``processed``
         """
-        self._queue.put(self._Task(ctagsLang, text, sortAlphabetically))
+        self._queue.put(self._Task(ctagsLang, text, sortAlphabetically, job))
 
     def stopAsync(self):
         self._queue.put(None)
@@ -104,15 +111,17 @@ class ProcessorThread(QThread):
                 task = self._queue.get()
 
             if task is None:  # None is a quit command
+                self._tagger.terminate()
                 break
 
             try:
-                tags = ctags.processText(task.ctagsLang, task.text, task.sortAlphabetically)
+                tags = self._tagger.processText(task.ctagsLang, task.text, task.sortAlphabetically)
             except ctags.FailedException as ex:
                 self.error.emit(ex.args[0])
             else:
                 if not self._queue.qsize():  # Do not emit results, if having new task
                     self.tagsReady.emit(tags)
+            self.processed.emit(task.job)
 
 
 class SettingsWidget(QWidget):
@@ -140,7 +149,7 @@ class SettingsWidget(QWidget):
         except OSError as ex:
             self.lExecuteError.setText('Failed to execute ctags: {}'.format(ex))
         else:
-            if 'Exuberant Ctags' in stdout:
+            if 'Exuberant Ctags' in stdout or 'Universal Ctags' in stdout:
                 self.lExecuteError.setText('ctags is found!')
             elif 'GNU Emacs' in stdout:
                 self.lExecuteError.setText(
@@ -161,13 +170,17 @@ class Plugin(QObject):
         core.uiSettingsManager().dialogAccepted.connect(self._scheduleDocumentProcessing)
 
         # If we update Tree on every key pressing, freezes are sensible (GUI thread draws tree too slowly
-        # This timer is used for drawing Preview 1000 ms After user has stopped typing text
-        self._typingTimer = QTimer()
-        self._typingTimer.setInterval(1000)
-        self._typingTimer.setSingleShot(True)
-        self._typingTimer.timeout.connect(self._scheduleDocumentProcessing)
+        # The tree is updated after user has stopped typing text. The pause depends on how long ctags takes
+        self._typingDebouncer = AdaptiveDebouncer('Navigator', initialDelay=1000)
+        self._typingDebouncer.timeout.connect(self._scheduleDocumentProcessing)
 
         self._thread = ProcessorThread()
+        self._thread.processed.connect(self._onProcessingFinished)
+
+        # Symbols of the whole project for the locator
+        self._symbolIndex = SymbolIndex()
+        SymbolCommand.symbolIndex = self._symbolIndex
+        core.locator().addCommandClass(SymbolCommand)
 
     def terminate(self):
         """Uninstall the plugin
@@ -177,10 +190,15 @@ class Plugin(QObject):
             self._thread.error.disconnect(self._dock.onError)
             self._dock.remove()
             self._dock.term()
-        self._typingTimer.stop()
+        self._typingDebouncer.stop()
+        self._thread.processed.disconnect(self._onProcessingFinished)
         self._thread.stopAsync()
         self._thread.wait()
 
+        core.locator().removeCommandClass(SymbolCommand)
+        SymbolCommand.symbolIndex = None
+        self._symbolIndex.terminate()
+
         core.workspace().currentDocumentChanged.disconnect(self._onDocumentChanged)
         core.workspace().textChanged.disconnect(self._onTextChanged)
         core.uiSettingsManager().aboutToExecute.disconnect(self._onSettingsDialogAboutToExecute)
@@ -233,8 +251,7 @@ class Plugin(QObject):
 
     def _onTextChanged(self):
         if self._isEnabled():
-            self._typingTimer.stop()
-            self._typingTimer.start()
+            self._typingDebouncer.restart()
 
     def _clear(self):
         if self._dock is not None:
@@ -243,14 +260,20 @@ class Plugin(QObject):
     def _scheduleDocumentProcessing(self):
         """Start document processing with the thread.
         """
-        self._typingTimer.stop()
+        self._typingDebouncer.stop()
 
         document = core.workspace().currentDocument()
         if document is not None and \
            document.qutepart.language() in _QUTEPART_TO_CTAGS_LANG_MAP:
             ctagsLang = _QUTEPART_TO_CTAGS_LANG_MAP[document.qutepart.language()]
+            job = self._typingDebouncer.jobStarted()
             self._thread.process(ctagsLang, document.qutepart.text,
-                                 core.config()['Navigator']['SortAlphabetically'])
+                                 core.config()['Navigator']['SortAlphabetically'], job)
+
+    def _onProcessingFinished(self, job):
+        """Thread processed a task. Finishing replaced jobs is ignored by the debouncer
+        """
+        self._typingDebouncer.jobFinished(job)
 
     def _onSettingsDialogAboutToExecute(self, dialog):
         """UI settings dialogue is about to execute.
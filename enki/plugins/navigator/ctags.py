@@ -1,9 +1,12 @@
 """Ctags execution and output parsing functionality
 """
 
+import collections
+import json
 import os
 import sys
 import tempfile
+import threading
 from contextlib import contextmanager
 
 from enki.core.core import core
@@ -24,6 +27,8 @@ class _ParseFailed(UserWarning):
 
 
 class Tag:
+    # The navigator keeps thousands of tags
+    __slots__ = ('type', 'name', 'lineNumber', 'parent', 'children')
 
     def __init__(self, type_, name, lineNumber, parent):
         self.type = type_
@@ -87,10 +92,41 @@ def _findScope(tag, scopeType, scopeName):
         return None
 
 
+def _parseJsonTag(tag):
+    """Parse a tag of the JSON output of Universal Ctags, like _parseTag
+    """
+    try:
+        scopeText = tag.get('scope')
+        scopeName = scopeText.split(':')[-1].split('.')[-1] if scopeText else None
+        return (tag['name'], tag['line'] - 1, tag['kind'],
+                tag.get('scopeKind') if scopeText else None, scopeName)
+    except (KeyError, TypeError, AttributeError):
+        raise _ParseFailed()
+
+
+def _parseLines(text):
+    """Parse the lines of the ctags output. Yield the tags as _parseTag returns them
+    """
+    for line in text.splitlines():
+        if line.startswith('ctags:'):  # warnings from the utility
+            continue
+
+        try:
+            yield _parseTag(line)
+        except _ParseFailed:
+            print('navigator: failed to parse ctags output line "{}"'.format(line), file=sys.stderr)
+
+
 def _parseTags(ctagsLang, text):
     if "Try `ctags --help' for a complete list of options." in text:
         raise FailedException("ctags from Emacs package is used. Use Exuberant Ctags")
 
+    return _buildTags(ctagsLang, _parseLines(text))
+
+
+def _buildTags(ctagsLang, parsedTags):
+    """Build the tag tree from the parsed tags
+    """
     ignoredTypes = ['variable']
 
     if ctagsLang in ('C', 'C++',):
@@ -98,22 +134,15 @@ def _parseTags(ctagsLang, text):
 
     tags = []
     lastTag = None
-    for line in text.splitlines():
-        if line.startswith('ctags:'):  # warnings from the utility
-            continue
-
-        try:
-            name, lineNumber, type_, scopeType, scopeName = _parseTag(line)
-        except _ParseFailed:
-            print('navigator: failed to parse ctags output line "{}"'.format(line), file=sys.stderr)
-            continue
-
+    for name, lineNumber, type_, scopeType, scopeName in parsedTags:
         if type_ not in ignoredTypes:
             if type_ == 'member':
                 """ctags returns parent scope type 'function' for members'.
                 Workaround this issue - use one term for functions and members
                 """
                 type_ = 'function'
+            if scopeType == 'member':  # Universal Ctags does return 'member'
+                scopeType = 'function'
 
             parent = _findScope(lastTag, scopeType, scopeName)
 
@@ -157,7 +186,22 @@ def _sortTagsAlphabetically(tags):
     return sorted(tags, key=lambda tag: tag.name)
 
 
+def _ctagsNotExecuted(ctagsPath, ex):
+    return FailedException('Failed to execute ctags console utility "{}": {}\n'
+                           .format(ctagsPath, str(ex)) +
+                           'Go to Settings -> Settings -> Navigator to set path to ctags')
+
+
+def _finishTags(tags, sortAlphabetically):
+    if sortAlphabetically:
+        return _sortTagsAlphabetically(tags)
+    else:
+        return tags
+
+
 def processText(ctagsLang, text, sortAlphabetically):
+    """Run ctags once for the text and return the tags
+    """
     ctagsPath = core.config()['Navigator']['CtagsPath']
     langArg = '--language-force={}'.format(ctagsLang)
 
@@ -173,13 +217,150 @@ def processText(ctagsLang, text, sortAlphabetically):
             stdout = gco.get_console_output([ctagsPath,
                                              '-f', '-', '-u', '--fields=nKs', langArg, tempFile.name])[0]
         except OSError as ex:
-            raise FailedException('Failed to execute ctags console utility "{}": {}\n'
-                                  .format(ctagsPath, str(ex)) +
-                                  'Go to Settings -> Settings -> Navigator to set path to ctags')
+            raise _ctagsNotExecuted(ctagsPath, ex)
 
-    tags = _parseTags(ctagsLang, stdout)
+    return _finishTags(_parseTags(ctagsLang, stdout), sortAlphabetically)
 
-    if sortAlphabetically:
-        return _sortTagsAlphabetically(tags)
-    else:
-        return tags
+
+class _CoprocessDied(UserWarning):
+    """The interactive ctags process exited or failed. Exception for internal usage"""
+    pass
+
+
+class _Coprocess:
+    """Universal Ctags running in the interactive mode for one language.
+
+    Each request sends a buffer to stdin and reads the JSON tags ctags streams back,
+    so neither a temporary file nor a new process is needed per request
+    """
+    # The last lines of stderr kept for error messages
+    _STDERR_LINES = 10
+
+    def __init__(self, ctagsPath, ctagsLang):
+        self._popen = gco.open_console_output([ctagsPath, '--_interactive', '--sort=no', '--fields=nKs',
+                                               '--language-force={}'.format(ctagsLang)])
+        # stderr is a pipe. Read it, so that warnings can't fill it and block ctags
+        self._stderrLines = collections.deque(maxlen=self._STDERR_LINES)
+        thread = threading.Thread(target=self._readStderr, args=(self._popen.stderr,))
+        thread.daemon = True
+        thread.start()
+
+    def _readStderr(self, stderr):
+        for line in stderr:
+            self._stderrLines.append(line.decode('utf8', 'replace').rstrip())
+        stderr.close()
+
+    def stderrText(self):
+        return '\n'.join(self._stderrLines)
+
+    def generateTags(self, data):
+        """Tag the utf8 data. Yield the tags as _parseTag returns them.
+        Raise _CoprocessDied if ctags exits
+        """
+        request = json.dumps({'command': 'generate-tags', 'filename': 'buffer', 'size': len(data)})
+        try:
+            self._popen.stdin.write(request.encode('utf8') + b'\n' + data)
+            self._popen.stdin.flush()
+        except OSError as ex:
+            raise _CoprocessDied(str(ex))
+
+        parsedTags = []
+        while True:
+            line = self._popen.stdout.readline()
+            if not line:
+                raise _CoprocessDied('ctags exited')
+            try:
+                message = json.loads(line.decode('utf8', 'replace'))
+            except ValueError:
+                print('navigator: failed to parse ctags output line "{}"'.format(line), file=sys.stderr)
+                continue
+
+            type_ = message.get('_type')
+            if type_ == 'tag':
+                try:
+                    parsedTags.append(_parseJsonTag(message))
+                except _ParseFailed:
+                    print('navigator: failed to parse ctags tag {}'.format(message), file=sys.stderr)
+            elif type_ == 'completed':
+                return parsedTags
+            elif type_ == 'error':
+                raise FailedException('ctags failed: {}'.format(message.get('message', '')))
+            # else the program banner, which is printed on start
+
+    def terminate(self):
+        try:
+            self._popen.stdin.close()
+        except OSError:
+            pass
+        self._popen.kill()
+        self._popen.wait()
+        self._popen.stdout.close()
+
+
+class Tagger:
+    """Runs ctags for the navigator.
+
+    Universal Ctags, if it supports the interactive mode, runs as a long-lived process
+    per language, which tags every buffer sent to it. A crashed process is restarted.
+    Other ctags, such as Exuberant Ctags, are run once per request with processText.
+
+    Not thread safe. Use from one thread
+    """
+    def __init__(self):
+        # {(ctagsPath, ctagsLang): _Coprocess}
+        self._coprocesses = {}
+        # {ctagsPath: True if it supports the interactive mode}
+        self._interactive = {}
+
+    def terminate(self):
+        """Stop all ctags processes
+        """
+        for coprocess in self._coprocesses.values():
+            coprocess.terminate()
+        self._coprocesses.clear()
+
+    def processText(self, ctagsLang, text, sortAlphabetically):
+        ctagsPath = core.config()['Navigator']['CtagsPath']
+        # The processes of a ctags which is no longer configured aren't needed
+        for key in [key for key in self._coprocesses if key[0] != ctagsPath]:
+            self._coprocesses.pop(key).terminate()
+
+        if not self._isInteractive(ctagsPath):
+            return processText(ctagsLang, text, sortAlphabetically)
+
+        data = text.encode('utf8')
+        key = (ctagsPath, ctagsLang)
+        # Restart a crashed process once. If it crashes again, don't use the interactive mode
+        for attempt in range(2):
+            coprocess = self._coprocesses.get(key)
+            if coprocess is None:
+                try:
+                    coprocess = _Coprocess(ctagsPath, ctagsLang)
+                except OSError as ex:
+                    raise _ctagsNotExecuted(ctagsPath, ex)
+                self._coprocesses[key] = coprocess
+
+            try:
+                parsedTags = coprocess.generateTags(data)
+            except _CoprocessDied as ex:
+                del self._coprocesses[key]
+                coprocess.terminate()
+                print('navigator: interactive ctags failed: {}\n{}'.format(ex, coprocess.stderrText()),
+                      file=sys.stderr)
+            else:
+                return _finishTags(_buildTags(ctagsLang, parsedTags), sortAlphabetically)
+
+        self._interactive[ctagsPath] = False
+        return processText(ctagsLang, text, sortAlphabetically)
+
+    def _isInteractive(self, ctagsPath):
+        if ctagsPath not in self._interactive:
+            try:
+                version = gco.get_console_output([ctagsPath, '--version'])[0]
+                features = gco.get_console_output([ctagsPath, '--list-features'])[0] \
+                    if 'Universal Ctags' in version else ''
+            except OSError:
+                # Don't remember. ctags may be installed later. processText reports the error
+                return False
+            self._interactive[ctagsPath] = 'interactive' in features.split()
+        return self._interactive[ctagsPath]
@@ -2,9 +2,12 @@
 Contains tag model class
 """
 
+import bisect
+import difflib
 import fnmatch
 
-from PyQt5.QtCore import pyqtSignal, Qt, QEvent, QTimer, QAbstractItemModel, QModelIndex
+from PyQt5.QtCore import (pyqtSignal, Qt, QEvent, QTimer, QAbstractItemModel, QModelIndex,
+                          QPersistentModelIndex)
 from PyQt5.QtWidgets import QApplication, QVBoxLayout, QLabel, QTreeView, QWidget
 from PyQt5.QtGui import QBrush, QColor, QIcon
 
@@ -25,12 +28,27 @@ def _tagPath(tag):
         return _tagPath(tag.parent) + '.' + tag.name
 
 
+def _tagKey(tag):
+    """Tags with equal keys are the same tag, maybe moved to another line
+    """
+    return tag.type, tag.name
+
+
+def _copyTag(tag, parent):
+    newTag = ctags.Tag(tag.type, tag.name, tag.lineNumber, parent)
+    newTag.children = [_copyTag(child, newTag) for child in tag.children]
+    return newTag
+
+
 class _TagModel(QAbstractItemModel):
     jumpToTagDone = pyqtSignal()
 
     def __init__(self, *args):
         QAbstractItemModel.__init__(self, *args)
         self._tags = []
+        # All tags as (row, tag), sorted by line number, and their line numbers, for bisect
+        self._sortedRowsAndTags = []
+        self._sortedLineNumbers = []
 
         self.currentTagIndex = QModelIndex()
 
@@ -48,10 +66,49 @@ class _TagModel(QAbstractItemModel):
         self._updateCurrentTagTimer.stop()
 
     def setTags(self, tags):
-        self.beginResetModel()
-        self._tags = tags
+        """Update the model to show the tags.
+
+        The new tags are compared with the shown ones, and only the differences are
+        inserted and removed, so that the view keeps its state.
+        The model keeps its own copy of the tags
+        """
+        oldCurrentTagIndex = QPersistentModelIndex(self.currentTagIndex)
+        self.currentTagIndex = QModelIndex()
+
+        self._updateChildren(QModelIndex(), None, self._tags, tags)
+        self._updateLineIndex()
+
         self._updateCurrentTag(False)
-        self.endResetModel()
+        for index in (QModelIndex(oldCurrentTagIndex), self.currentTagIndex):
+            if index.isValid():
+                self.dataChanged.emit(index, index)
+
+    def _updateChildren(self, parentIndex, parentTag, oldTags, newTags):
+        """Make the shown oldTags, children of parentTag, equal to newTags
+        """
+        matcher = difflib.SequenceMatcher(None,
+                                          [_tagKey(tag) for tag in oldTags],
+                                          [_tagKey(tag) for tag in newTags],
+                                          autojunk=False)
+        # Apply the changes from the end, so that the rows of the not yet applied ones don't move
+        for op, oldStart, oldEnd, newStart, newEnd in reversed(matcher.get_opcodes()):
+            if op == 'equal':
+                for oldRow, newTag in zip(range(oldStart, oldEnd), newTags[newStart:newEnd]):
+                    oldTag = oldTags[oldRow]
+                    oldTag.lineNumber = newTag.lineNumber
+                    if oldTag.children or newTag.children:
+                        self._updateChildren(self.createIndex(oldRow, 0, oldTag), oldTag,
+                                             oldTag.children, newTag.children)
+            else:
+                if oldEnd > oldStart:
+                    self.beginRemoveRows(parentIndex, oldStart, oldEnd - 1)
+                    del oldTags[oldStart:oldEnd]
+                    self.endRemoveRows()
+                if newEnd > newStart:
+                    self.beginInsertRows(parentIndex, oldStart, oldStart + newEnd - newStart - 1)
+                    oldTags[oldStart:oldStart] = [_copyTag(tag, parentTag)
+                                                  for tag in newTags[newStart:newEnd]]
+                    self.endInsertRows()
 
     def _onCursorPositionChanged(self):
         """If position is updated on every key pressing - cursor movement might be slow
@@ -186,30 +243,32 @@ class _TagModel(QAbstractItemModel):
         else:
             return QModelIndex()
 
-    def _indexForLineNumber(self, number):
-
+    def _updateLineIndex(self):
+        """Sort the tags by line number for _indexForLineNumber
+        """
         def recursiveTagGenerator(tags):
             for childRow, childTag in enumerate(tags):
                 yield childRow, childTag
-                for gcRow, grandChild in recursiveTagGenerator(childTag.children):
-                    yield gcRow, grandChild
-
-        prevRow, prevTag = None, None
-        for row, tag in recursiveTagGenerator(self._tags):
-            if tag.lineNumber == number:
-                return self.createIndex(row, 0, tag)
-            elif tag.lineNumber > number and \
-                    prevTag is not None and \
-                    prevTag.lineNumber <= number:
-                return self.createIndex(prevRow, 0, prevTag)
-            else:
-                prevRow, prevTag = row, tag
-        else:
-            if prevTag is not None and \
-               prevTag.lineNumber <= number:  # the last tag is current
-                return self.createIndex(prevRow, 0, prevTag)
+                yield from recursiveTagGenerator(childTag.children)
+
+        # sorted() is stable. Tags on the same line stay in tree order
+        rowsAndTags = sorted(recursiveTagGenerator(self._tags), key=lambda item: item[1].lineNumber)
+        self._sortedLineNumbers = [tag.lineNumber for row, tag in rowsAndTags]
+        self._sortedRowsAndTags = rowsAndTags
+
+    def _indexForLineNumber(self, number):
+        """Index of the tag on the line, or of the last tag above it
+        """
+        end = bisect.bisect_right(self._sortedLineNumbers, number)
+        if end == 0:
+            return QModelIndex()
 
-        return QModelIndex()
+        if self._sortedLineNumbers[end - 1] == number:
+            # The first tag on the line. I.e. a class rather than its first method
+            row, tag = self._sortedRowsAndTags[bisect.bisect_left(self._sortedLineNumbers, number)]
+        else:
+            row, tag = self._sortedRowsAndTags[end - 1]
+        return self.createIndex(row, 0, tag)
 
 
 def _filterTag(wildcard, tag, parent):
@@ -288,13 +347,10 @@ class NavigatorDock(DockWidget):
         self._tree.setModel(self._tagModel)
         self._tree.activated.connect(self._tagModel.onActivated)
         self._tree.clicked.connect(self._tagModel.onActivated)
-        self._tagModel.modelAboutToBeReset.connect(self._onModelAboutToBeReset)
-        self._tagModel.modelReset.connect(self._onModelReset)
+        self._tagModel.rowsInserted.connect(self._onRowsInserted)
 
         self._showAction.triggered.connect(self._onShowTriggered)
 
-        self._currentTagPath = None
-
         self._errorLabel = None
 
         self._installed = False
@@ -342,18 +398,21 @@ class NavigatorDock(DockWidget):
             self._errorLabel.show()
             self._displayWidget.hide()
 
-    def _onModelAboutToBeReset(self):
-        currIndex = self._tree.currentIndex()
-        self._currentTagPath = self._tagModel.tagPathForIndex(currIndex) if currIndex.isValid() else None
-
-    def _onModelReset(self):
-        self._tree.expandAll()
-
-        # restore current item
-        if self._currentTagPath is not None:
-            index = self._tagModel.indexForTagPath(self._currentTagPath)
-            if index.isValid():
-                self._tree.setCurrentIndex(index)
+    def _onRowsInserted(self, parent, first, last):
+        """Expand new tags. Tags, which are still shown, keep their state
+        """
+        # A tag, which had no children, isn't expanded yet
+        if parent.isValid() and self._tagModel.rowCount(parent) == last - first + 1:
+            self._tree.expand(parent)
+        for row in range(first, last + 1):
+            self._expandRecursively(self._tagModel.index(row, 0, parent))
+
+    def _expandRecursively(self, index):
+        rowCount = self._tagModel.rowCount(index)
+        if rowCount:
+            self._tree.expand(index)
+            for row in range(rowCount):
+                self._expandRecursively(self._tagModel.index(row, 0, index))
 
     def eventFilter(self, object_, event):
         if object_ is self._tree:
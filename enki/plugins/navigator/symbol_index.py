@@ -0,0 +1,416 @@
+"""Project symbol index
+
+Tags all project files with ctags in a background thread, so that the locator can jump to
+a symbol anywhere in the project. The index is saved to the configuration directory and
+keyed by file modification time, so that reopening a project re-tags only the changed files.
+Saved files are re-tagged.
+
+Symbols of a file are kept compactly: the names as one newline-separated string, which
+a regular expression searches quickly, and the line numbers as an array.
+At most ``_MAX_SYMBOLS`` symbols are kept, so that huge projects don't exhaust the memory.
+"""
+
+import array
+import collections
+import concurrent.futures
+import hashlib
+import heapq
+import json
+import os
+import os.path
+import queue
+import re
+import sys
+import threading
+
+from PyQt5.QtCore import pyqtSignal, QObject, QThread
+
+from enki.core.core import core
+from enki.core.defines import CONFIG_DIR
+import enki.lib.get_console_output as gco
+
+
+# Symbols of one file. ``names`` is a newline-separated string,
+# ``lines`` an array of 0-based line numbers, ``kinds`` a tuple of kind names
+FileSymbols = collections.namedtuple('FileSymbols', ['mtime', 'names', 'lines', 'kinds'])
+
+# Symbol found by findSymbols
+Symbol = collections.namedtuple('Symbol', ['name', 'kind', 'filePath', 'line'])
+
+# Local names aren't interesting outside of the file
+_IGNORED_KINDS = ('variable', 'local', 'parameter')
+# Memory budget. A symbol takes about 30 bytes
+_MAX_SYMBOLS = 2000000
+# Files tagged by one ctags process, and the number of processes running at once
+_BATCH_SIZE = 200
+_MAX_PROCESSES = os.cpu_count() or 1
+# The index is saved this long after the last file update
+_SAVE_DELAY_SEC = 30
+_FILE_FORMAT_VERSION = 1
+# findSymbols drops worse matches when it has found this many times more than needed
+_KEPT_MATCHES_FACTOR = 10
+
+
+def _indexFilePath(projectPath):
+    name = hashlib.sha1(projectPath.encode('utf8')).hexdigest() + '.json'
+    return os.path.join(CONFIG_DIR, 'symbols', name)
+
+
+def makeFileSymbols(mtime, symbols):
+    """Make FileSymbols from a list of ``(name, line, kind)``
+    """
+    return FileSymbols(mtime,
+                       '\n'.join(name for name, line, kind in symbols),
+                       array.array('i', (line for name, line, kind in symbols)),
+                       tuple(sys.intern(kind) for name, line, kind in symbols))
+
+
+def symbolCount(fileSymbols):
+    return len(fileSymbols.lines)
+
+
+def parseCtagsOutput(text):
+    """Parse the output of ``ctags -f - --excmd=number --fields=nK``.
+    Return ``{file path: [(name, line, kind)]}``
+    """
+    result = {}
+    for line in text.splitlines():
+        items = line.split('\t')
+        if len(items) < 4 or line.startswith('ctags:'):
+            continue
+        name, filePath, lineText, kind = items[:4]
+        if kind in _IGNORED_KINDS:
+            continue
+        try:
+            # -1 to convert from human readable to machine numeration
+            lineNumber = int(lineText.split(';')[0]) - 1
+        except ValueError:
+            continue
+        result.setdefault(filePath, []).append((name, lineNumber, kind))
+    return result
+
+
+def _tagBatch(ctagsPath, projectPath, relPaths):
+    """Run ctags for the files. Return the parseCtagsOutput result
+    """
+    popen = gco.open_console_output([ctagsPath, '-f', '-', '-u', '--excmd=number',
+                                     '--fields=nK', '-L', '-'],
+                                    cwd=projectPath)
+    stdout, stderr = popen.communicate('\n'.join(relPaths).encode('utf8'))
+    return parseCtagsOutput(stdout.decode('utf8', 'replace'))
+
+
+def loadIndex(projectPath):
+    """Load the saved index of the project. Return ``{relative path: FileSymbols}``
+    """
+    try:
+        with open(_indexFilePath(projectPath), encoding='utf8') as f:
+            data = json.load(f)
+        if data.get('version') != _FILE_FORMAT_VERSION or data.get('projectPath') != projectPath:
+            return {}
+        return {relPath: FileSymbols(mtime, names, array.array('i', lines),
+                                     tuple(sys.intern(kind) for kind in kinds))
+                for relPath, (mtime, names, lines, kinds) in data['files'].items()}
+    except (OSError, ValueError, KeyError, TypeError):
+        return {}
+
+
+def saveIndex(projectPath, files):
+    path = _indexFilePath(projectPath)
+    data = {'version': _FILE_FORMAT_VERSION,
+            'projectPath': projectPath,
+            'files': {relPath: [entry.mtime, entry.names, entry.lines.tolist(), entry.kinds]
+                      for relPath, entry in files.items()}}
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write a new file and replace the old one, so that a crash doesn't corrupt the index
+        with open(path + '.tmp', 'w', encoding='utf8') as f:
+            json.dump(data, f, separators=(',', ':'))
+        os.replace(path + '.tmp', path)
+    except OSError as ex:
+        print('navigator: failed to save the symbol index to {}: {}'.format(path, ex), file=sys.stderr)
+
+
+def _patternRegExp(pattern, caseSensitive):
+    """Regular expression, which finds names containing the pattern characters in order
+    """
+    anything = '[^\\n]*?'
+    return re.compile('^' + anything + anything.join(re.escape(char) for char in pattern) + '[^\\n]*$',
+                      re.MULTILINE | (0 if caseSensitive else re.IGNORECASE))
+
+
+def _fuzzyScore(reversedPattern, name):
+    """Like fuzzyopen.fuzzyMatch. Less is better. Continuous pieces close to the end score best
+    """
+    score = 0
+    index = len(name) + 1
+    prevMatch = index
+    for char in reversedPattern:
+        index = name.rfind(char, 0, index)
+        if index == -1:
+            return None
+        if index + 1 != prevMatch:
+            score += len(name) - index
+        prevMatch = index
+    # Prefer short names and names starting with the pattern
+    return score + index + len(name) / 1000
+
+
+def _matchKey(match):
+    score, relPath, lineIndex, name, entry = match
+    return score, relPath, lineIndex
+
+
+def findSymbols(entries, pattern, maxCount, stopEvent=None):
+    """Find symbols, which names fuzzy match the pattern.
+    ``entries`` is a list of ``(relative path, FileSymbols)``.
+    Return up to ``maxCount`` Symbols, the best matches first
+    """
+    caseSensitive = any(char.isupper() for char in pattern)
+    regExp = _patternRegExp(pattern, caseSensitive)
+    reversedPattern = (pattern if caseSensitive else pattern.lower())[::-1]
+
+    scored = []
+    for i, (relPath, entry) in enumerate(entries):
+        if stopEvent is not None and not i % 100 and stopEvent.is_set():
+            return []
+        # Track the line of the match in names
+        lineIndex = 0
+        lineStart = 0
+        for match in regExp.finditer(entry.names):
+            lineIndex += entry.names.count('\n', lineStart, match.start())
+            lineStart = match.start()
+            name = match.group(0)
+            score = _fuzzyScore(reversedPattern, name if caseSensitive else name.lower())
+            if score is not None:
+                scored.append((score, relPath, lineIndex, name, entry))
+        # Short patterns match most symbols. Don't keep them all
+        if len(scored) > _KEPT_MATCHES_FACTOR * maxCount:
+            scored = heapq.nsmallest(maxCount, scored, key=_matchKey)
+
+    best = heapq.nsmallest(maxCount, scored, key=_matchKey)
+    return [Symbol(name, entry.kinds[lineIndex], relPath, entry.lines[lineIndex])
+            for score, relPath, lineIndex, name, entry in best]
+
+
+class _IndexerThread(QThread):
+    """Tags files. Owns a copy of the index of the project, which it saves
+    """
+    status = pyqtSignal(str)
+    # projectPath, {relative path: FileSymbols}, True if the memory budget was exceeded
+    indexed = pyqtSignal(str, object, bool)
+    # projectPath, relative path, FileSymbols or None if the file doesn't exist
+    fileIndexed = pyqtSignal(str, str, object)
+
+    def __init__(self):
+        QThread.__init__(self)
+        self._queue = queue.Queue()
+        self._stopEvent = threading.Event()
+        self._projectPath = None
+        self._files = {}
+        self._dirty = False
+        self.start(QThread.LowPriority)
+
+    def indexProject(self, projectPath, relPaths, ctagsPath):
+        self._queue.put(('project', projectPath, relPaths, ctagsPath))
+
+    def indexFile(self, projectPath, relPath, ctagsPath):
+        self._queue.put(('file', projectPath, relPath, ctagsPath))
+
+    def stopAsync(self):
+        self._stopEvent.set()
+        self._queue.put(None)
+
+    def run(self):
+        """Thread function
+        """
+        while True:  # exits with break
+            try:
+                task = self._queue.get(timeout=_SAVE_DELAY_SEC if self._dirty else None)
+            except queue.Empty:
+                self._save()
+                continue
+
+            if task is None:  # None is a quit command
+                self._save()
+                break
+
+            kind, projectPath, arg, ctagsPath = task
+            if projectPath != self._projectPath:
+                self._save()
+                self._projectPath = projectPath
+                self._files = loadIndex(projectPath)
+            try:
+                if kind == 'project':
+                    self._indexProject(arg, ctagsPath)
+                else:
+                    self._indexFile(arg, ctagsPath)
+            except OSError as ex:
+                self.status.emit('Failed to execute ctags "{}": {}'.format(ctagsPath, ex))
+
+    def _save(self):
+        if self._dirty:
+            saveIndex(self._projectPath, self._files)
+            self._dirty = False
+
+    def _mtime(self, relPath):
+        try:
+            return os.path.getmtime(os.path.join(self._projectPath, relPath))
+        except OSError:
+            return None
+
+    def _indexProject(self, relPaths, ctagsPath):
+        files = {}
+        toTag = []
+        for relPath in relPaths:
+            mtime = self._mtime(relPath)
+            entry = self._files.get(relPath)
+            if entry is not None and entry.mtime == mtime:
+                files[relPath] = entry
+            elif mtime is not None:
+                toTag.append((relPath, mtime))
+        total = sum(symbolCount(entry) for entry in files.values())
+        truncated = total > _MAX_SYMBOLS
+        self._dirty = self._dirty or len(files) != len(self._files) or bool(toTag)
+
+        batches = [toTag[i:i + _BATCH_SIZE] for i in range(0, len(toTag), _BATCH_SIZE)]
+        with concurrent.futures.ThreadPoolExecutor(_MAX_PROCESSES) as executor:
+            futures = [executor.submit(_tagBatch, ctagsPath, self._projectPath,
+                                       [relPath for relPath, mtime in batch])
+                       for batch in batches]
+            for batchIndex, (batch, future) in enumerate(zip(batches, futures)):
+                if self._stopEvent.is_set() or truncated:
+                    for notStarted in futures:
+                        notStarted.cancel()
+                    break
+                tagged = future.result()
+                for relPath, mtime in batch:
+                    entry = makeFileSymbols(mtime, tagged.get(relPath, []))
+                    total += symbolCount(entry)
+                    if total > _MAX_SYMBOLS:
+                        truncated = True
+                        break
+                    files[relPath] = entry
+                self.status.emit('Indexing symbols: {} of {} files'.format(
+                    min(len(toTag), (batchIndex + 1) * _BATCH_SIZE), len(toTag)))
+
+        self._files = files
+        self.indexed.emit(self._projectPath, dict(files), truncated)
+
+    def _indexFile(self, relPath, ctagsPath):
+        mtime = self._mtime(relPath)
+        entry = self._files.get(relPath)
+        if entry is not None and entry.mtime == mtime:
+            return
+        if mtime is None:
+            self._files.pop(relPath, None)
+            entry = None
+        else:
+            entry = makeFileSymbols(mtime, _tagBatch(ctagsPath, self._projectPath, [relPath]).get(relPath, []))
+            self._files[relPath] = entry
+        self._dirty = True
+        self.fileIndexed.emit(self._projectPath, relPath, entry)
+
+
+class SymbolIndex(QObject):
+    """Symbols of the current project.
+
+    Indexing starts on the first :meth:`start` call. Afterwards, the index is kept up to date
+    """
+    changed = pyqtSignal()
+    """
+    changed()
+
+    **Signal** emitted, when the index or its status changed
+    """
+
+    def __init__(self):
+        QObject.__init__(self)
+        self._files = None
+        self._status = 'Not indexed'
+        self._requested = False
+        self._thread = _IndexerThread()
+        self._thread.status.connect(self._onStatus)
+        self._thread.indexed.connect(self._onIndexed)
+        self._thread.fileIndexed.connect(self._onFileIndexed)
+
+        core.project().changed.connect(self._onProjectChanged)
+        core.project().filesReady.connect(self._onFilesReady)
+        core.workspace().modificationChanged.connect(self._onModificationChanged)
+
+    def terminate(self):
+        core.project().changed.disconnect(self._onProjectChanged)
+        core.project().filesReady.disconnect(self._onFilesReady)
+        core.workspace().modificationChanged.disconnect(self._onModificationChanged)
+        self._thread.stopAsync()
+        self._thread.wait()
+
+    def start(self):
+        """Start indexing the project, if not started yet
+        """
+        if self._requested:
+            return
+        self._requested = True
+        if core.project().files() is not None:
+            self._onFilesReady()
+        else:
+            core.project().startLoadingFiles()
+            self._setStatus(core.project().scanStatus())
+
+    def isReady(self):
+        return self._files is not None
+
+    def status(self):
+        return self._status
+
+    def entries(self):
+        """List of ``(relative path, FileSymbols)``. It doesn't change when the index does
+        """
+        return list(self._files.items()) if self._files is not None else []
+
+    def _setStatus(self, text):
+        self._status = text
+        self.changed.emit()
+
+    def _onProjectChanged(self, path):
+        self._files = None
+        self._requested = False
+        self._setStatus('Not indexed')
+
+    def _onFilesReady(self):
+        if self._requested:
+            self._thread.indexProject(core.project().path(), core.project().files(),
+                                      core.config()['Navigator']['CtagsPath'])
+            if self._files is None:
+                self._setStatus('Indexing symbols')
+
+    def _onModificationChanged(self, document, modified):
+        projectPath = core.project().path()
+        filePath = document.filePath()
+        if modified or not self._requested or filePath is None or projectPath is None:
+            return
+        relPath = os.path.relpath(filePath, projectPath)
+        if not relPath.startswith(os.pardir):
+            self._thread.indexFile(projectPath, relPath, core.config()['Navigator']['CtagsPath'])
+
+    def _onStatus(self, text):
+        self._setStatus(text)
+
+    def _onIndexed(self, projectPath, files, truncated):
+        if projectPath != core.project().path() or not self._requested:
+            return
+        self._files = files
+        count = sum(symbolCount(entry) for entry in files.values())
+        text = '{} symbols in {} files'.format(count, len(files))
+        if truncated:
+            text += '. Some files are not indexed, the project has too many symbols'
+        self._setStatus(text)
+
+    def _onFileIndexed(self, projectPath, relPath, entry):
+        if projectPath != core.project().path() or self._files is None:
+            return
+        if entry is None:
+            self._files.pop(relPath, None)
+        else:
+            self._files[relPath] = entry
+        self.changed.emit()
@@ -0,0 +1,97 @@
+"""Locator command, which goes to a symbol in the project
+"""
+
+import html
+import os.path
+
+from enki.core.core import core
+from enki.core.locator import AbstractCommand, AbstractCompleter, StatusCompleter
+
+from .symbol_index import findSymbols
+
+
+_MAX_COUNT = 32
+
+
+class SymbolCompleter(AbstractCompleter):
+
+    mustBeLoaded = True
+
+    def __init__(self, pattern, entries):
+        self._pattern = pattern
+        self._entries = entries
+        self._symbols = []
+
+    def load(self, stopEvent):
+        if self._pattern:
+            self._symbols = findSymbols(self._entries, self._pattern, _MAX_COUNT, stopEvent)
+
+    def rowCount(self):
+        return len(self._symbols)
+
+    def columnCount(self):
+        return 1
+
+    def text(self, row, column):
+        symbol = self._symbols[row]
+        return '<b>{}</b> <i>{}</i><br/>{}:{}'.format(html.escape(symbol.name),
+                                                      html.escape(symbol.kind),
+                                                      html.escape(symbol.filePath),
+                                                      symbol.line + 1)
+
+    def autoSelectItem(self):
+        return (0, 0) if self._symbols else None
+
+    def getFullText(self, row):
+        if self._symbols:
+            symbol = self._symbols[row]
+            return '{}:{}'.format(symbol.filePath, symbol.line + 1)
+        else:
+            return None
+
+
+class SymbolCommand(AbstractCommand):
+    command = 't'
+    signature = 't SYMBOL'
+    description = 'Go to a symbol in the project. Fuzzy match the name'
+
+    # SymbolIndex, set by the navigator plugin
+    symbolIndex = None
+
+    @staticmethod
+    def isAvailable():
+        return core.project().path() is not None and \
+            SymbolCommand.symbolIndex is not None
+
+    def __init__(self):
+        AbstractCommand.__init__(self)
+        self._pattern = ''
+        self._clickedLocation = None
+        self.symbolIndex.changed.connect(self.updateCompleter)
+        self.symbolIndex.start()
+
+    def terminate(self):
+        self.symbolIndex.changed.disconnect(self.updateCompleter)
+
+    def setArgs(self, args):
+        self._pattern = ''.join(args)
+
+    def completer(self):
+        if self.symbolIndex.isReady() and self._pattern:
+            return SymbolCompleter(self._pattern, self.symbolIndex.entries())
+        else:
+            return StatusCompleter("<i>{}</i>".format(html.escape(self.symbolIndex.status())))
+
+    def onItemClicked(self, fullText):
+        self._clickedLocation = fullText
+
+    def lineEditText(self):
+        return 't ' + self._pattern
+
+    def isReadyToExecute(self):
+        return self._clickedLocation is not None
+
+    def execute(self):
+        path, line = self._clickedLocation.rsplit(':', 1)
+        core.workspace().goTo(os.path.join(core.project().path(), path),
+                              line=int(line) - 1)
@@ -241,6 +241,12 @@ class SphinxSettingsWidget(QWidget):
                                          "Sphinx/BuildOnSave",
                                          {self.rbBuildOnlyOnSave: True,
                                           self.rbBuildOnFileChange: False}))
+        dialog.appendOption(CheckableOption(dialog, core.config(),
+                                            "Sphinx/Persistent",
+                                            self.cbSphinxPersistent))
+        dialog.appendOption(TextOption(dialog, core.config(),
+                                       "Sphinx/Jobs",
+                                       self.leSphinxJobs))
         dialog.appendOption(TextOption(dialog, core.config(),
                                        "Sphinx/ProjectPath",
                                        self.leSphinxProjectPath))
@@ -434,6 +440,8 @@ class Plugin(QObject):
         c.setdefault('Sphinx/ProjectPath', '')
         c.setdefault('Sphinx/SourcePath', '.')
         c.setdefault('Sphinx/BuildOnSave', False)
+        c.setdefault('Sphinx/Persistent', False)
+        c.setdefault('Sphinx/Jobs', '1')
         c.setdefault('Sphinx/OutputPath', os.path.join('_build',
                             'html'))
         c.setdefault('Sphinx/AdvancedMode', False)
@@ -472,7 +480,7 @@ class Plugin(QObject):
     def _canPreview(self, document):
         """Check if the given document can be shown in the Preview dock.
         """
-        if document is None:
+        if document is None or document.isLargeFile():
             return False
 
         if document.qutepart.language() in ('Markdown', 'reStructuredText') or \
@@ -16,6 +16,8 @@
 #
 # Library imports
 # ---------------
+import bisect
+import difflib
 # For debugging.
 import codecs
 import html
@@ -23,20 +25,12 @@ import os
 #
 # Third-party imports
 # -------------------
-import pkg_resources
-
-# The `regex <https://pypi.python.org/pypi/regex>`_ module supports approximate
-# matching. Make sure it is recent enough to be usable.
-import regex
+# NumPy fills the LCS table in refineSearchResult_ much faster. If it isn't
+# installed, a pure-Python implementation is used.
 try:
-  # Get the version of regex. See https://pythonhosted.org/setuptools/pkg_resources.html#distribution-attributes.
-  regexVersion = pkg_resources.get_distribution('regex').parsed_version
-  # Issues I filed before this make regex unusable. See #166, #167, andd #169 at
-  # https://bitbucket.org/mrabarnett/mrab-regex/issues. For version parse, see
-  # https://pythonhosted.org/setuptools/pkg_resources.html#parsing-utilities.
-  assert regexVersion >= pkg_resources.parse_version('2015.11.07')
-except AssertionError as ValueError:
-  raise ImportError
+    import numpy
+except ImportError:
+    numpy = None
 #
 # For debug
 # =========
@@ -110,65 +104,244 @@ def writeHtmlLog(htmlText):
     with codecs.open('approx_match_log.html', 'w', encoding='utf-8') as f:
         f.write(htmlText)
 #
-# findApproxText
-# ==============
-# This function performs a single approximate match using the regex_ library.
+# Approximate matching engine
+# ===========================
+# Searching the whole target text with a fuzzy regular expression is too slow:
+# it takes about 0.26 s per call on a preview.py-sized document. Instead, this
+# engine:
 #
-# Return value:
-#   - If there is no unique value, (None, 0, 0)
-#   - Otherwise, it returns (match, beginInTarget, endInTarget) where:
+# #. Builds an index of all q-grams (substrings of length q) of the target
+#    text. The index is cached, since the same target text is searched many
+#    times (once per cursor movement).
+# #. Uses the q-grams of the search text to vote for diagonals (the offset
+#    of the search text in the target text). Nearby votes form short
+#    candidate regions of the target text.
+# #. Computes the exact edit distance only within candidate regions, using
+#    Myers' bit-parallel algorithm.
+#
+# Per the `q-gram lemma <http://www.cs.helsinki.fi/u/ukkonen/TCS92.pdf>`_, an
+# occurrence of the search text with k errors shares at least ``grams - k*q``
+# q-grams with it. So, a region with ``votes`` votes can't contain a match with
+# less than ``ceil((grams - votes)/q)`` errors. This lower bound allows skipping
+# regions which can't affect the result. If the best match is so poor that
+# regions without votes might compete with it, the whole target text is
+# searched.
+#
+# The length of q-grams.
+Q = 3
+# q-grams which occur in the target text more often than this are ignored,
+# since they produce lots of candidates but carry little information.
+MAX_GRAM_OCCURRENCES = 200
 #
-#     match
-#       A regex_ match object.
+# The match object
+# ----------------
+# Results of the approximate match, mimicking the interface of a regex match
+# object.
+class ApproxMatch:
+    def __init__(self, start, end, cost):
+        self._start = start
+        self._end = end
+        # The edit distance between the search text and the matched text.
+        self.cost = cost
+
+    def start(self):
+        return self._start
+
+    def end(self):
+        return self._end
+#
+# The q-gram index
+# ----------------
+# Cache the index of the last target text. Strings are immutable, so the text
+# itself is a valid key.
+_indexCache = (None, None)
+
+def _targetIndex(targetText):
+    global _indexCache
+
+    cachedText, index = _indexCache
+    if cachedText is not targetText and cachedText != targetText:
+        index = {}
+        for i in range(len(targetText) - Q + 1):
+            gram = targetText[i:i + Q]
+            positions = index.get(gram)
+            if positions is None:
+                index[gram] = [i]
+            else:
+                positions.append(i)
+        _indexCache = (targetText, index)
+    return index
 #
-#     beginInTarget
-#       The index into the target string at which the approximate match begins.
+# Myers' algorithm
+# ----------------
+# Compute the edit distance between ``pattern`` and the best matching substring
+# of ``targetText[lo:hi]`` ending at each position, using the bit-parallel
+# algorithm from `G. Myers, A fast bit-vector algorithm for approximate string
+# matching based on dynamic programming
+# <http://www.gersteinlab.org/courses/452/09-spring/pdf/Myers.pdf>`_.
+#
+# Return value: (cost, end) of the best match, where end is the leftmost one
+# among equal costs. An empty match at ``lo`` costs ``len(pattern)``.
+def _bestMatchEnd(pattern, targetText, lo, hi):
+    m = len(pattern)
+    full = (1 << m) - 1
+    highBit = 1 << (m - 1)
+    peq = {}
+    for i, c in enumerate(pattern):
+        peq[c] = peq.get(c, 0) | (1 << i)
+
+    pv = full
+    mv = 0
+    score = m
+    bestCost, bestEnd = m, lo
+    for j in range(lo, hi):
+        eq = peq.get(targetText[j], 0)
+        xv = eq | mv
+        xh = (((eq & pv) + pv) ^ pv) | eq
+        ph = mv | (~(xh | pv) & full)
+        mh = pv & xh
+        if ph & highBit:
+            score += 1
+        elif mh & highBit:
+            score -= 1
+        # The match may start anywhere in the target text, so the top row of the
+        # dynamic programming table is all zeros: don't shift in a 1 here.
+        ph = (ph << 1) & full
+        mh = (mh << 1) & full
+        pv = mh | (~(xv | ph) & full)
+        mv = ph & xv
+        if score < bestCost:
+            bestCost, bestEnd = score, j + 1
+    return bestCost, bestEnd
+
+# Given the end of a match with the given cost, find its start by matching the
+# reversed pattern backwards from the end.
+def _matchStart(pattern, targetText, lo, end, cost):
+    # A match with ``cost`` errors is at most ``len(pattern) + cost`` long.
+    begin = max(lo, end - len(pattern) - cost)
+    reversedTarget = targetText[begin:end][::-1]
+    startCost, length = _bestMatchEnd(pattern[::-1], reversedTarget, 0,
+                                      len(reversedTarget))
+    assert startCost == cost
+    return end - length
+
+def _bestMatch(pattern, targetText, lo, hi):
+    cost, end = _bestMatchEnd(pattern, targetText, lo, hi)
+    return ApproxMatch(_matchStart(pattern, targetText, lo, end, cost), end, cost)
+#
+# Candidate regions
+# -----------------
+# Return (regions, grams), where regions is a list of (lowerBound, lo, hi)
+# tuples giving ranges of the target text which may contain a match, and grams
+# is the number of q-grams of the searchText used for voting.
+#
+# Diagonals are grouped into bins of width m. A match which starts in bin b has
+# at most m errors, so all its votes lie in bins b - 1, b and b + 1, and it ends
+# before the end of bin b + 2.
+def _candidateRegions(searchText, targetText):
+    m = len(searchText)
+    index = _targetIndex(targetText)
+
+    binVotes = {}
+    grams = 0
+    for i in range(m - Q + 1):
+        positions = index.get(searchText[i:i + Q])
+        if positions is not None and len(positions) > MAX_GRAM_OCCURRENCES:
+            continue
+        grams += 1
+        for p in positions or ():
+            b = (p - i) // m
+            binVotes[b] = binVotes.get(b, 0) + 1
+
+    candidateBins = set()
+    for b in binVotes:
+        candidateBins.update((b - 1, b, b + 1))
+    n = len(targetText)
+    regions = []
+    for b in candidateBins:
+        votes = binVotes.get(b - 1, 0) + binVotes.get(b, 0) + binVotes.get(b + 1, 0)
+        lo, hi = max(0, b * m), min(n, (b + 3) * m)
+        if lo < hi:
+            regions.append((_lowerBound(grams, votes), lo, hi))
+    return regions, grams
+
+def _lowerBound(grams, votes):
+    return max(0, -((votes - grams) // Q))
+#
+# findApproxText
+# ==============
+# This function performs a single approximate match.
 #
-#     endInTarget
-#       The index into the target string at which the approximate match ends.
+# Return value:
+#   - If there is no unique value, None.
+#   - Otherwise, an ApproxMatch_ object. Its ``start()`` and ``end()`` give the
+#     indices into the target string at which the approximate match begins and
+#     ends.
 def findApproxText(
   # Text to search for
   searchText,
   # Text in which to find the searchText
   targetText):
 
-    mo = regexFuzzySearch(searchText, targetText)
-    if mo:
-        # See if this match is unique enough by looking for the next best match
-        # by searching in the string before then the string after the match.
-        moPre = regexFuzzySearch(searchText, targetText[:mo.start()])
-        moPost = regexFuzzySearch(searchText, targetText[mo.end():])
+    m = len(searchText)
+    if m == 0:
+        return ApproxMatch(0, 0, 0)
+    n = len(targetText)
 
-        # Compute an error based on the fuzzyness. If there wasn't a match, use
-        # maximum error of moError + 6, so that the test below passes.
-        moError = sum(mo.fuzzy_counts)
-        moPreError = sum(moPre.fuzzy_counts) if moPre else moError*2
-        moPostError = sum(moPost.fuzzy_counts) if moPost else moError*2
+    # Short search strings don't have q-grams to vote with. Search everywhere.
+    if m < Q:
+        regions, grams = [(0, 0, n)], 0
+    else:
+        regions, grams = _candidateRegions(searchText, targetText)
+    # Any match outside of candidate regions has at least this many errors.
+    outsideBound = _lowerBound(grams, 0)
 
-        # Make sure the difference between the match and any other match is high
-        # enough to consider this match unique.
-        if moError*1.1 <= moPreError and moError*1.1 <= moPostError:
-            return mo
+    # Find the best match, computing only regions which can affect the result:
+    # either contain a better or an equally good but leftmost match, or a match
+    # which makes the best one not unique.
+    def canAffect(bound):
+        return best is None or bound <= best.cost or bound < best.cost * 1.1
 
-    # If a match couldn't be found or wasn't good enough, return a failure.
-    return None
+    best = None
+    computedRegions = []
+    for bound, lo, hi in sorted(regions):
+        if not canAffect(bound):
+            break
+        mo = _bestMatch(searchText, targetText, lo, hi)
+        computedRegions.append((lo, hi, mo))
+        if (best is None or mo.cost < best.cost or
+                (mo.cost == best.cost and mo.start() < best.start())):
+            best = mo
 
-# This helper function uses regex_ to perform a fuzzy search.
-def regexFuzzySearch(
-  # Text to search for. It is NOT treated as a regex.
-  searchText,
-  # Text in which to find the searchText
-  targetText):
+    # Matches outside of regions may be better or competing. Search everywhere.
+    if canAffect(outsideBound):
+        best = _bestMatch(searchText, targetText, 0, n)
+        computedRegions = [(0, n, best)]
 
-    # Escape any characters in searchText that would be treated as a regexp.
-    searchText = regex.escape(searchText)
-    # The regex_ library supports fuzzy matching. Quoting from the manual:
-    #
-    # - ``(item){e}`` means perform a fuzzy match of the given ``item``,
-    #   allowing insertions, deletions, or substitutions.
-    # - The BESTMATCH flag searches for the best possible match, rather than the
-    #   match found first.
-    return regex.search('(' + searchText + '){e}', targetText, regex.BESTMATCH)
+    # See if this match is unique enough by looking for the next best match
+    # in the string before then the string after the match. Deleting the whole
+    # search text always gives a match with m errors. The best match of a
+    # region which lies entirely before or after the match is already known.
+    preCost = postCost = m
+    for lo, hi, mo in computedRegions:
+        if mo.end() <= best.start():
+            preCost = min(preCost, mo.cost)
+        elif lo < best.start():
+            preCost = min(preCost,
+                          _bestMatchEnd(searchText, targetText, lo, best.start())[0])
+        if mo.start() >= best.end() and mo is not best:
+            postCost = min(postCost, mo.cost)
+        elif hi > best.end():
+            postCost = min(postCost,
+                           _bestMatchEnd(searchText, targetText, best.end(), hi)[0])
+
+    # Make sure the difference between the match and any other match is high
+    # enough to consider this match unique.
+    if best.cost * 1.1 <= preCost and best.cost * 1.1 <= postCost:
+        return best
+
+    # If a match couldn't be found or wasn't good enough, return a failure.
+    return None
 
 #
 # findApproxTextInTarget
@@ -228,7 +401,7 @@ def findApproxTextInTarget(
     searchPattern = searchText[begin:end]
     targetSubstring = targetText[mo.start():mo.end()]
     # Use the LCS_ algorithm to perform a more exact match. This algorithm
-    # runs in O(NM) time, compared to regex's compiled (and hopefully faster)
+    # runs in O(NM) time, compared to the approximate match engine's (much faster)
     # performance.
     relativeSearchAnchor = searchAnchor - begin
     offset, lcsString = refineSearchResult(searchPattern, relativeSearchAnchor,
@@ -250,6 +423,55 @@ def findApproxTextInTarget(
 
     return offset
 #
+# lcsTable
+# ========
+# Return a table whose entry ``[i][j]`` gives the length of the longest common
+# subsequence of ``searchText[:i]`` and ``targetText[:j]``.
+def lcsTable(searchText, targetText):
+    if numpy:
+        return _lcsTableNumpy(searchText, targetText)
+    return _lcsTablePython(searchText, targetText)
+
+def _lcsTablePython(searchText, targetText):
+    # Initialize the substring length table entries to 0.
+    lengths = [[0 for j in range(len(targetText) + 1)]
+               for i in range(len(searchText) + 1)]
+
+    for i, x in enumerate(searchText):
+        for j, y in enumerate(targetText):
+            # When characters match, increase the substring length. Otherwise,
+            # the use maximum substring length found thus far.
+            if x == y:
+                lengths[i + 1][j + 1] = lengths[i][j] + 1
+            else:
+                lengths[i + 1][j + 1] = max(lengths[i + 1][j], lengths[i][j + 1])
+    return lengths
+
+# Compute a row of the table at a time. Expanding ``lengths[i + 1][j]`` in the
+# recurrence above shows that row ``i + 1`` is the running maximum of
+# ``max(lengths[i][j + 1], lengths[i][j] + 1 if x == y else 0)``, which NumPy
+# computes without a Python loop over the targetText.
+def _lcsTableNumpy(searchText, targetText):
+    # The table entries can't exceed the length of the shorter string. Use the
+    # smallest type which holds them, since the table is quadratic in size.
+    # Computing a row adds one to the previous row, so the type must also hold
+    # the largest entry plus one.
+    dtype = numpy.uint16 if min(len(searchText), len(targetText)) < 2**16 - 1 else numpy.uint32
+    lengths = numpy.zeros((len(searchText) + 1, len(targetText) + 1), dtype)
+    target = numpy.array([ord(y) for y in targetText], numpy.uint32)
+    # Cache which characters of the targetText match a given character.
+    matches = {}
+
+    for i, x in enumerate(searchText):
+        match = matches.get(x)
+        if match is None:
+            match = matches[x] = (target == ord(x))
+        previousRow, row = lengths[i], lengths[i + 1]
+        numpy.maximum(previousRow[1:], (previousRow[:-1] + 1) * match, out=row[1:])
+        numpy.maximum.accumulate(row, out=row)
+    return lengths
+
+#
 # refineSearchResult
 # ==================
 # This function performs identically to findApproxTextInTarget_, but uses a more
@@ -283,24 +505,13 @@ def refineSearchResult(
     # So, a given x or y value refers to a table index or, equivalently, an
     # anchor to their right.
     #
-    # Initialize the substring length table entries to 0.
-    lengths = [[0 for j in range(len(targetText) + 1)]
-               for i in range(len(searchText) + 1)]
-
     # Determine the length of the longest common subsequence and store this in
     # the table.
-    for i, x in enumerate(searchText):
-        for j, y in enumerate(targetText):
-            # When characters match, increase the substring length. Otherwise,
-            # the use maximum substring length found thus far.
-            if x == y:
-                lengths[i + 1][j + 1] = lengths[i][j] + 1
-            else:
-                lengths[i + 1][j + 1] = max(lengths[i + 1][j], lengths[i][j + 1])
+    lengths = lcsTable(searchText, targetText)
 
     # If LCS fails to find a common subsequence, then set the offset to -1 and
     # inform ``findApproxTextInTarget`` that no match is found. This rarely
-    # happens since regex has preprocessed input string.
+    # happens since findApproxText has preprocessed input string.
     if lengths[-1][-1] == 0:
         return -1, ''
 
@@ -448,3 +659,203 @@ def refineSearchResult(
     #   targetText = 'ab', then x == 1 when y == 0, which is the beginning
     #   of the targetText.
     return y, lcsString
+#
+# PositionMap
+# ===========
+# Rather than performing an approximate match for every cursor movement, align
+# the source and target texts once, producing a monotonic, piecewise mapping
+# between them. Mapping a position is then a binary search over the matching
+# blocks.
+#
+# The alignment follows the patience diff approach:
+#
+# #. Find q-grams which occur exactly once in both texts. Their positions are
+#    anchors.
+# #. Keep the longest chain of anchors which appear in the same order in both
+#    texts; this discards spurious anchors.
+# #. Extend each anchor in both directions while characters match, producing
+#    a matching block.
+# #. Align the gaps between blocks recursively, using shorter q-grams, since
+#    more of them are unique within a gap. Small gaps are aligned by difflib.
+#
+# Gaps which are too large for difflib, yet have no anchors, are sampled while
+# the map is built: each sample is looked up with findApproxTextInTarget_ within
+# the gap and becomes a zero-length block. Positions in gaps are interpolated
+# between blocks, so mapping never searches.
+#
+# The length of q-grams used at the top level of the alignment.
+POSITION_MAP_GRAM_LENGTH = 12
+# Gaps aren't aligned with q-grams shorter than this; the position within such
+# a gap is interpolated instead.
+MIN_POSITION_MAP_GRAM_LENGTH = 3
+# Gaps where the product of source and target lengths is at most this are
+# aligned by difflib, which is quadratic but precise.
+MAX_DIFFLIB_AREA = 100000
+# The distance, in source characters, between samples of a gap which is too
+# large for difflib.
+GAP_SAMPLE_INTERVAL = 50
+
+class PositionMap:
+    def __init__(self,
+      # The source text, such as the text of a document.
+      sourceText,
+      # The target text, such as the plain text rendering of a web page.
+      targetText):
+
+        self.sourceText = sourceText
+        self.targetText = targetText
+        blocks = []
+        _alignRange(sourceText, 0, len(sourceText), targetText, 0,
+                    len(targetText), POSITION_MAP_GRAM_LENGTH, blocks)
+        # Each block is a (sourceStart, targetStart, length) tuple. Blocks are
+        # sorted and don't overlap in both the source and the target.
+        self._blocks = _sampleLargeGaps(sourceText, targetText, blocks)
+        self._sourceStarts = [block[0] for block in self._blocks]
+        self._targetStarts = [block[1] for block in self._blocks]
+
+    # True if this map was built for the given texts.
+    def matches(self, sourceText, targetText):
+        return self.sourceText == sourceText and self.targetText == targetText
+
+    # Return the index into the target text which corresponds to the given index
+    # into the source text, or -1 if the texts have nothing in common.
+    def sourceToTarget(self, sourceIndex):
+        return self._map(sourceIndex, self._sourceStarts, 0, len(self.sourceText),
+                         len(self.targetText))
+
+    # The reverse of sourceToTarget.
+    def targetToSource(self, targetIndex):
+        return self._map(targetIndex, self._targetStarts, 1, len(self.targetText),
+                         len(self.sourceText))
+
+    def _map(self, index, starts, side, fromLength, toLength):
+        if not self._blocks:
+            return -1
+
+        i = bisect.bisect_right(starts, index) - 1
+        # Return the corresponding position inside a matching block.
+        if i >= 0:
+            fromStart, length = self._blocks[i][side], self._blocks[i][2]
+            toStart = self._blocks[i][1 - side]
+            if index < fromStart + length:
+                return toStart + index - fromStart
+            fromLo, toLo = fromStart + length, toStart + length
+        else:
+            fromLo, toLo = 0, 0
+        # Otherwise, the index lies in a gap between blocks. Interpolate.
+        if i + 1 < len(self._blocks):
+            fromHi, toHi = self._blocks[i + 1][side], self._blocks[i + 1][1 - side]
+        else:
+            fromHi, toHi = fromLength, toLength
+        if fromHi == fromLo:
+            return toLo
+        return toLo + (min(index, fromHi) - fromLo) * (toHi - toLo) // (fromHi - fromLo)
+
+# Append matching blocks of ``a[aLo:aHi]`` and ``b[bLo:bHi]`` to ``blocks``.
+def _alignRange(a, aLo, aHi, b, bLo, bHi, gramLength, blocks):
+    if aLo >= aHi or bLo >= bHi:
+        return
+
+    if (aHi - aLo) * (bHi - bLo) <= MAX_DIFFLIB_AREA:
+        sm = difflib.SequenceMatcher(None, a[aLo:aHi], b[bLo:bHi], autojunk=False)
+        for i, j, size in sm.get_matching_blocks():
+            if size:
+                blocks.append((aLo + i, bLo + j, size))
+        return
+
+    if gramLength < MIN_POSITION_MAP_GRAM_LENGTH:
+        return
+
+    # Find anchors: q-grams which are unique in both ranges.
+    aGrams = _uniqueGrams(a, aLo, aHi, gramLength)
+    bGrams = _uniqueGrams(b, bLo, bHi, gramLength)
+    anchors = sorted((aIndex, bGrams[gram]) for gram, aIndex in aGrams.items()
+                     if aIndex >= 0 and bGrams.get(gram, -1) >= 0)
+
+    # Turn the ordered anchors into blocks, aligning the gaps between them.
+    prevA, prevB = aLo, bLo
+    for aIndex, bIndex in _longestIncreasingChain(anchors):
+        # Skip anchors which were absorbed by the previous block.
+        if aIndex < prevA or bIndex < prevB:
+            continue
+        start, bStart = aIndex, bIndex
+        while start > prevA and bStart > prevB and a[start - 1] == b[bStart - 1]:
+            start -= 1
+            bStart -= 1
+        end, bEnd = aIndex + gramLength, bIndex + gramLength
+        while end < aHi and bEnd < bHi and a[end] == b[bEnd]:
+            end += 1
+            bEnd += 1
+
+        _alignRange(a, prevA, start, b, prevB, bStart, gramLength // 2, blocks)
+        blocks.append((start, bStart, end - start))
+        prevA, prevB = end, bEnd
+    _alignRange(a, prevA, aHi, b, prevB, bHi, gramLength // 2, blocks)
+
+# Return ``blocks`` with zero-length blocks added to the gaps which are too
+# large for difflib. Each of them is a sample of the source gap, found in the
+# target gap by findApproxTextInTarget_.
+#
+# A sample lies in the target after the previous one, no further than the
+# distance between them plus the extra length of the target gap, with some
+# slack. Only this window is searched, so sampling costs linear time even if
+# the search can't rely on q-grams and scans its whole target text.
+def _sampleLargeGaps(sourceText, targetText, blocks):
+    sampledBlocks = []
+    sourceLo = targetLo = 0
+    # The last, empty block closes the gap at the end of the texts.
+    for block in blocks + [(len(sourceText), len(targetText), 0)]:
+        sourceHi, targetHi = block[0], block[1]
+        if (sourceHi - sourceLo) * (targetHi - targetLo) > MAX_DIFFLIB_AREA:
+            sourceGap = sourceText[sourceLo:sourceHi]
+            targetGap = targetText[targetLo:targetHi]
+            extraLength = max(0, len(targetGap) - len(sourceGap))
+            prevOffset = prevFound = 0
+            # The start of a gap after a block is already mapped by the block.
+            for offset in range(0 if sourceLo == 0 else GAP_SAMPLE_INTERVAL,
+                                len(sourceGap), GAP_SAMPLE_INTERVAL):
+                windowLength = 2 * (offset - prevOffset + GAP_SAMPLE_INTERVAL) + extraLength
+                found = findApproxTextInTarget(sourceGap, offset,
+                                               targetGap[prevFound:prevFound + windowLength])
+                if found >= 0:
+                    prevOffset, prevFound = offset, prevFound + found
+                    sampledBlocks.append((sourceLo + offset, targetLo + prevFound, 0))
+        sampledBlocks.append(block)
+        sourceLo, targetLo = block[0] + block[2], block[1] + block[2]
+    sampledBlocks.pop()
+    return sampledBlocks
+
+# Return a dict of {q-gram: index}, where the index is -1 for q-grams which
+# occur in ``text[lo:hi]`` more than once.
+def _uniqueGrams(text, lo, hi, gramLength):
+    grams = {}
+    for i in range(lo, hi - gramLength + 1):
+        gram = text[i:i + gramLength]
+        grams[gram] = -1 if gram in grams else i
+    return grams
+
+# Given a list of (a, b) pairs sorted by a, return the longest sub-list in
+# which b is increasing as well.
+def _longestIncreasingChain(pairs):
+    # tails[k] is the smallest b ending an increasing chain of length k + 1;
+    # tailIndices[k] is the index of that pair.
+    tails = []
+    tailIndices = []
+    predecessors = []
+    for index, (_, b) in enumerate(pairs):
+        k = bisect.bisect_left(tails, b)
+        if k == len(tails):
+            tails.append(b)
+            tailIndices.append(index)
+        else:
+            tails[k] = b
+            tailIndices[k] = index
+        predecessors.append(tailIndices[k - 1] if k else None)
+
+    chain = []
+    index = tailIndices[-1] if tailIndices else None
+    while index is not None:
+        chain.append(pairs[index])
+        index = predecessors[index]
+    chain.reverse()
+    return chain
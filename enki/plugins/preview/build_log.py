@@ -0,0 +1,176 @@
+# .. -*- coding: utf-8 -*-
+#
+# ***************************************************************
+# build_log.py - Collect build messages for the preview's log
+# ***************************************************************
+# A Sphinx build of a large project prints thousands of lines. Appending each
+# line to the log window as it arrives keeps the GUI thread busy redrawing the
+# log. So, the build thread writes its messages to a :class:`LogBuffer`
+# instead. The preview takes everything written since its last look a few
+# times a second and appends it to the log in one step.
+#
+# While messages are written, the buffer counts errors and warnings and
+# remembers where they occurred, so that the preview doesn't have to scan the
+# whole log after the build.
+#
+# Imports
+# =======
+# Library imports
+# ---------------
+import collections
+import re
+import threading
+#
+# Third-party imports
+# -------------------
+from PyQt5.QtCore import pyqtSignal, QObject
+#
+# Problems
+# ========
+# Common docutils error messages read::
+#
+#  <string>:1589: (ERROR/3) Unknown interpreted text role "ref".
+#
+#  X:\ode.py:docstring of sympy:5: (ERROR/3) Unexpected indentation.
+#
+# and common sphinx errors read::
+#
+#  X:\SVM_train.m.rst:2: SEVERE: Title overline & underline mismatch.
+#
+#  X:\indexs.rst:None: WARNING: image file not readable: a.jpg
+#
+#  X:\conf.py.rst:: WARNING: document isn't included in any toctree
+#
+#  In Sphinx 1.6.1:
+#  X:\file.rst: WARNING: document isn't included in any toctree
+#
+# Each error/warning occupies one line. The path is everything before the
+# position: for example, ``X:\SVM_train.m.rst``. The position can be a line
+# number, ``None`` or nothing, and the type is ``WARNING``, ``ERROR`` or
+# ``SEVERE``, optionally preceded by a parenthesis.
+_PROBLEM_RE = re.compile(r'^(?P<path>.*?):(?P<line>\d*|None|):? \(?(?P<kind>WARNING|ERROR|SEVERE)(?P<message>.*)$')
+# At most this many problems are kept for the index. All are counted.
+_MAX_PROBLEMS = 1000
+
+# A problem found in the log. ``filePath`` is the path as printed, for example
+# ``<string>`` for docutils input. ``line`` is a 0-based line number or None.
+Problem = collections.namedtuple('Problem', ['filePath', 'line', 'kind', 'text'])
+
+
+def parseProblem(line):
+    """Return the :class:`Problem` reported by a line of the log, or None.
+    """
+    match = _PROBLEM_RE.match(line)
+    if match is None:
+        return None
+    lineNumber = match.group('line')
+    return Problem(match.group('path'),
+                   int(lineNumber) - 1 if lineNumber.isdigit() and int(lineNumber) > 0 else None,
+                   'WARNING' if match.group('kind') == 'WARNING' else 'ERROR',
+                   line.strip())
+
+
+class ProblemCounter:
+    """Count errors and warnings in text written in pieces.
+    """
+    def __init__(self):
+        self.errors = 0
+        self.warnings = 0
+        self.problems = []
+        # The last incomplete line.
+        self._partialLine = ''
+
+    def add(self, text):
+        *lines, self._partialLine = (self._partialLine + text).split('\n')
+        for line in lines:
+            self._addLine(line)
+
+    def finish(self):
+        """Count the last line, even if it doesn't end with a newline.
+        """
+        if self._partialLine:
+            self._addLine(self._partialLine)
+            self._partialLine = ''
+
+    def _addLine(self, line):
+        problem = parseProblem(line)
+        if problem is None:
+            return
+        if problem.kind == 'WARNING':
+            self.warnings += 1
+        else:
+            self.errors += 1
+        if len(self.problems) < _MAX_PROBLEMS:
+            self.problems.append(problem)
+#
+# LogBuffer
+# =========
+# The buffer is a queue of operations on the log: ``(CLEAR, None)``,
+# ``(TEXT, text)`` and ``(ERROR, text)``. Errors are shown in red and searched
+# for problems.
+CLEAR, TEXT, ERROR = range(3)
+
+
+class LogBuffer(QObject):
+    """Messages written by any thread, waiting to be shown in the log.
+    """
+    # Emitted when the buffer becomes non-empty. Not emitted again until
+    # :meth:`take` empties it.
+    pending = pyqtSignal()
+
+    def __init__(self, parent=None):
+        QObject.__init__(self, parent)
+        self._lock = threading.Lock()
+        self._operations = []
+        # Counts the problems written since the last clear.
+        self._counter = ProblemCounter()
+        # True if error text was written since the last clear.
+        self._hasErrorText = False
+
+    def clear(self):
+        """Clear the log and the problem counts.
+        """
+        with self._lock:
+            # Nothing written before matters any more.
+            wasEmpty = not self._operations
+            self._operations = [(CLEAR, None)]
+            self._counter = ProblemCounter()
+            self._hasErrorText = False
+        if wasEmpty:
+            self.pending.emit()
+
+    def write(self, text, isError=False):
+        """Append ``text`` to the log. It should end with a newline.
+        """
+        if not text:
+            return
+        with self._lock:
+            wasEmpty = not self._operations
+            kind = ERROR if isError else TEXT
+            # Join consecutive writes, so that they are shown in one step.
+            if self._operations and self._operations[-1][0] == kind:
+                self._operations[-1] = (kind, self._operations[-1][1] + text)
+            else:
+                self._operations.append((kind, text))
+            if isError:
+                self._counter.add(text)
+                self._hasErrorText = True
+        if wasEmpty:
+            self.pending.emit()
+
+    def take(self):
+        """Return and remove the operations waiting to be shown.
+        """
+        with self._lock:
+            operations = self._operations
+            self._operations = []
+        return operations
+
+    def summary(self):
+        """Return ``(errors, warnings, problems, hasErrorText)`` for the
+        messages written since the last clear.
+        """
+        with self._lock:
+            self._counter.finish()
+            return (self._counter.errors, self._counter.warnings,
+                    list(self._counter.problems), self._hasErrorText)
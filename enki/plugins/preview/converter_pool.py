@@ -0,0 +1,365 @@
+# .. -*- coding: utf-8 -*-
+#
+# **************************************************************
+# converter_pool.py - Convert documents in worker processes
+# **************************************************************
+# Converting a large Markdown or reST document takes seconds. In a thread, the
+# conversion holds the GIL most of this time, so the GUI stutters. This module
+# runs conversions in a small pool of worker processes instead. The workers
+# live as long as the preview, so docutils and Python-Markdown are imported and
+# set up once per worker, not once per conversion.
+#
+# A conversion which is superseded by a newer one is cancelled: the caller stops
+# waiting for it at once, while its worker finishes the job and the result is
+# discarded. Killing the worker instead would lose its warm caches and cost a
+# respawn, which takes longer than most conversions.
+#
+# Imports
+# =======
+# Library imports
+# ---------------
+import copy
+import io
+import multiprocessing
+import os.path
+import sys
+import threading
+import traceback
+#
+# Local imports
+# -------------
+from .markdown_renderer import MarkdownRenderer
+#
+# How often, in seconds, a waiting conversion checks if it was cancelled.
+_CANCEL_POLL_INTERVAL = 0.05
+#
+# Converters
+# ==========
+# These run in the worker processes, or in the calling thread if workers can't
+# be started.
+#
+# Settings for docutils, or None if not created yet. Parsing the settings takes
+# longer than converting a short document, so this is done once.
+_reSTSettings = None
+
+
+def _getReSTSettings():
+    global _reSTSettings
+    if _reSTSettings is None:
+        import docutils.core
+        import docutils.writers.html4css1
+
+        docutilsHtmlWriterPath = os.path.abspath(os.path.dirname(
+          docutils.writers.html4css1.__file__))
+        settingsDict = {
+          # Make sure to use Unicode everywhere. This name comes from
+          # ``docutils.core.publish_string`` version 0.12, lines 392 and following.
+          'output_encoding': 'unicode',
+          # While ``unicode`` **should** work for ``input_encoding``, it doesn't if
+          # there's an ``.. include`` directive, since this encoding gets passed to
+          # ``docutils.io.FileInput.__init__``, in which line 236 of version 0.12
+          # tries to pass the ``unicode`` encoding to ``open``, producing:
+          #
+          # .. code:: python3
+          #    :number-lines:
+          #
+          #    File "...\python-3.4.4\lib\site-packages\docutils\io.py", line 236, in __init__
+          #      self.source = open(source_path, mode, **kwargs)
+          #    LookupError: unknown encoding: unicode
+          #
+          # So, use UTF-8 and encode the string first. Ugh.
+          'input_encoding' : 'utf-8',
+          # Don't stop processing, no matter what.
+          'halt_level'     : 5,
+          # On some Windows PC, docutils will complain that it can't find its
+          # template or stylesheet. On other Windows PCs with the same setup, it
+          # works fine. ??? So, specify a path to both here.
+          'template': (
+            os.path.join(docutilsHtmlWriterPath,
+                         docutils.writers.html4css1.Writer.default_template) ),
+          'stylesheet_dirs' : (
+            docutilsHtmlWriterPath,
+            os.path.join(os.path.abspath(os.path.dirname(
+              os.path.realpath(__file__))), 'rst_templates')),
+          'stylesheet_path' : 'default.css',
+          }
+        publisher = docutils.core.Publisher()
+        publisher.set_components('standalone', 'restructuredtext', 'html')
+        # Like ``publish_string``, propagate exceptions.
+        _reSTSettings = publisher.get_settings(traceback=True, **settingsDict)
+    return _reSTSettings
+
+
+def convertReST(text):
+    """Convert reST to HTML. Return ``(html, errString)``.
+    """
+    try:
+        import docutils.core
+    except ImportError:
+        return 'Restructured Text preview requires the <i>python-docutils</i> package.<br/>' \
+               'Install it with your package manager or see ' \
+               '<a href="http://pypi.python.org/pypi/docutils"/>this page.</a>', None
+
+    # docutils changes the settings it's given, so use a copy.
+    settings = copy.copy(_getReSTSettings())
+    # Capture errors to a string and return it.
+    errStream = io.StringIO()
+    settings.warning_stream = errStream
+    htmlString = docutils.core.publish_string(bytes(text, encoding='utf-8'),
+      writer_name='html', settings=settings)
+    errString = errStream.getvalue()
+    errStream.close()
+    return htmlString, errString
+
+
+class _Converter:
+    """Convert documents, keeping the state which speeds up later conversions.
+    """
+    def __init__(self):
+        self._markdownRenderer = MarkdownRenderer()
+
+    def convert(self, language, text, template):
+        if language == 'Markdown':
+            return self._markdownRenderer.render(template, text), None
+        else:
+            return convertReST(text)
+
+
+def _workerMain(connection):
+    """The main function of a worker process. Convert the jobs received from
+    ``connection`` until it is closed or receives None.
+    """
+    converter = _Converter()
+    # Import and set up the converters before the first job arrives.
+    try:
+        converter.convert('Markdown', '', '')
+        converter.convert('reStructuredText', '', '')
+    except Exception:
+        pass  # reported by the job which fails the same way
+    while True:
+        try:
+            job = connection.recv()
+        except EOFError:
+            break
+        if job is None:
+            break
+
+        try:
+            result = True, converter.convert(*job)
+        except Exception:
+            result = False, traceback.format_exc()
+        connection.send(result)
+#
+# ConverterPool
+# =============
+
+
+class ConversionCancelled(Exception):
+    """Raised by :meth:`ConverterPool.convert` if :meth:`ConverterPool.cancel`
+    or :meth:`ConverterPool.terminate` stopped the conversion.
+    """
+    pass
+
+
+class _Worker:
+    """A worker process and the pipe to it.
+    """
+    def __init__(self, context):
+        self.connection, childConnection = context.Pipe()
+        self.process = context.Process(target=_workerMain, args=(childConnection,),
+                                       name='enki-converter', daemon=True)
+        self.process.start()
+        # Otherwise, reading from the pipe wouldn't fail when the worker dies.
+        childConnection.close()
+        # Set when the job of the worker has been cancelled. Its result is
+        # discarded.
+        self.cancelled = threading.Event()
+        # Set when the worker has been killed by terminating the pool.
+        self.killed = False
+
+    def kill(self):
+        self.killed = True
+        self.process.terminate()
+
+    def close(self):
+        try:
+            self.connection.send(None)
+        except OSError:
+            pass  # already dead
+        self.process.join(1)
+        if self.process.is_alive():
+            self.process.terminate()
+        self.connection.close()
+
+
+class ConverterPool:
+    """Convert Markdown and reST in worker processes.
+
+    :meth:`convert` blocks until the result is ready, so call it from a thread
+    such as the ``RunLatest`` one. All other methods may be called from any
+    thread.
+    """
+    def __init__(self, size=2):
+        self._size = size
+        self._lock = threading.Lock()
+        # Workers waiting for a job. The last one used is at the end, so that it
+        # is reused while its caches are warm.
+        self._idle = []
+        self._busy = set()
+        # Workers finishing a cancelled job. They become idle when the result
+        # has been received and discarded.
+        self._draining = []
+        self._terminated = False
+        # Spawn rather than fork: forking a process running Qt threads isn't
+        # safe. A frozen application (see ``win/enki-all.spec``) has no Python
+        # interpreter to spawn, and would start another copy of Enki instead.
+        if getattr(sys, 'frozen', False):
+            self._context = None
+        else:
+            self._context = multiprocessing.get_context('spawn')
+        # Converts in the calling thread if worker processes can't be started.
+        self._localConverter = None
+        self._startWorkers()
+
+    def terminate(self):
+        """Stop all workers. Running conversions are cancelled.
+        """
+        with self._lock:
+            self._terminated = True
+            idle = self._idle
+            self._idle = []
+            draining = self._draining
+            self._draining = []
+            for worker in self._busy:
+                worker.kill()
+        for worker in idle:
+            worker.close()
+        # Their results are not needed.
+        for worker in draining:
+            worker.kill()
+            worker.process.join()
+            worker.connection.close()
+
+    def convert(self, language, text, template=''):
+        """Convert ``text`` written in ``language``, which is ``'Markdown'`` or
+        ``'reStructuredText'``. Return ``(html, errString)``.
+
+        Raise :class:`ConversionCancelled` if :meth:`cancel` or
+        :meth:`terminate` was called while converting.
+        """
+        worker, draining = self._takeWorker()
+        if worker is None:
+            return self._localConverter.convert(language, text, template)
+
+        try:
+            if draining:
+                # Discard the result of the cancelled job.
+                self._receive(worker)
+            worker.connection.send((language, text, template))
+            ok, result = self._receive(worker)
+        except (EOFError, OSError):
+            self._discardWorker(worker)
+            if worker.killed:
+                raise ConversionCancelled()
+            raise RuntimeError('The converter process exited with code {}'.format(worker.process.exitcode))
+
+        self._releaseWorker(worker)
+        if not ok:
+            raise RuntimeError('Conversion failed:\n' + result)
+        return result
+
+    def cancel(self):
+        """Cancel all running conversions. :meth:`convert` returns at once, the
+        workers finish the jobs and their results are discarded.
+        """
+        with self._lock:
+            for worker in self._busy:
+                worker.cancelled.set()
+
+    def _startWorkers(self):
+        """Start workers until the pool is full. Call with ``self._lock`` held,
+        or before other threads use the pool.
+        """
+        while (self._context is not None and not self._terminated and
+               len(self._idle) + len(self._busy) + len(self._draining) < self._size):
+            try:
+                self._idle.insert(0, _Worker(self._context))
+            except OSError:
+                # For example, the process limit is reached. Convert in the
+                # calling thread instead.
+                self._context = None
+                self._localConverter = _Converter()
+
+    def _takeWorker(self):
+        """Return ``(worker, draining)``. ``worker`` is None to convert in the
+        calling thread. If all workers are finishing cancelled jobs, the first of
+        them is returned and ``draining`` is True; the result of its cancelled
+        job must be received first.
+        """
+        with self._lock:
+            self._reclaimDrainedWorkers()
+            if not self._idle:
+                self._startWorkers()
+            draining = not self._idle and bool(self._draining)
+            if self._idle:
+                worker = self._idle.pop()
+            elif draining:
+                worker = self._draining.pop(0)
+            else:
+                if self._localConverter is None:
+                    self._localConverter = _Converter()
+                return None, False
+            worker.cancelled.clear()
+            self._busy.add(worker)
+            return worker, draining
+
+    def _receive(self, worker):
+        """Wait for a result from the busy ``worker``. Raise
+        :class:`ConversionCancelled` if its job is cancelled meanwhile.
+        """
+        while not worker.connection.poll(_CANCEL_POLL_INTERVAL):
+            if worker.cancelled.is_set():
+                self._drainWorker(worker)
+                raise ConversionCancelled()
+        return worker.connection.recv()
+
+    def _drainWorker(self, worker):
+        """The job of the busy ``worker`` has been cancelled. Let it finish.
+        """
+        with self._lock:
+            self._busy.discard(worker)
+            if not self._terminated:
+                self._draining.append(worker)
+
+    def _reclaimDrainedWorkers(self):
+        """Make workers, which have finished cancelled jobs, idle. Call with
+        ``self._lock`` held.
+        """
+        for worker in list(self._draining):
+            try:
+                if not worker.connection.poll():
+                    continue
+                worker.connection.recv()
+            except (EOFError, OSError):
+                # The worker died. :meth:`_startWorkers` replaces it.
+                self._draining.remove(worker)
+                worker.process.join()
+                worker.connection.close()
+                continue
+            self._draining.remove(worker)
+            self._idle.append(worker)
+
+    def _releaseWorker(self, worker):
+        with self._lock:
+            self._busy.discard(worker)
+            if not self._terminated:
+                self._idle.append(worker)
+                return
+        worker.close()
+
+    def _discardWorker(self, worker):
+        worker.process.join()
+        worker.connection.close()
+        with self._lock:
+            self._busy.discard(worker)
+            self._startWorkers()
@@ -0,0 +1,301 @@
+# .. -*- coding: utf-8 -*-
+#
+# ******************************************************************
+# dom_patch.py - Update the preview without reloading the web page
+# ******************************************************************
+# Calling ``setHtml`` for every rebuild throws away the page, then parses its
+# CSS and JavaScript again, including the scripts which PreviewSync injects, and
+# loses the scroll position. When only the body of the page changed, this
+# module sends the new body through the QWebChannel instead. A script in the
+# page then changes only the DOM nodes which differ.
+#
+# Pages loaded from a URL (Sphinx output) are always reloaded.
+#
+# Imports
+# =======
+# Library imports
+# ---------------
+import collections
+import json
+import re
+#
+# Third-party
+# -----------
+from PyQt5.QtCore import pyqtSignal, pyqtSlot, QObject
+from PyQt5.QtWebEngineWidgets import QWebEngineScript
+import sip
+#
+# Local
+# -----
+from .markdown_renderer import RenderedMarkdown, BLOCK_MARKER
+#
+# Pages
+# =====
+# A page is split into its body and everything else (the head). A new page can
+# be patched into the shown one only if the heads are the same. A Markdown page
+# keeps its blocks, so that only the changed blocks are sent.
+_Page = collections.namedtuple('_Page', ['filePath', 'head', 'body', 'blocks'])
+_BODY_START_RE = re.compile(r'<body\b[^>]*>', re.IGNORECASE)
+_BODY_END = '</body>'
+# Scripts inserted in a page don't run. For example, MathJax wouldn't typeset
+# inserted formulas. So, a page whose body contains scripts is reloaded.
+_SCRIPT_RE = re.compile(r'<script\b', re.IGNORECASE)
+
+
+def _parsePage(filePath, htmlText):
+    """Return a :class:`_Page` or None if the page has no body.
+    """
+    if isinstance(htmlText, RenderedMarkdown):
+        return _Page(filePath, htmlText.template, None, htmlText.blocks)
+
+    match = _BODY_START_RE.search(htmlText)
+    end = htmlText.rfind(_BODY_END)
+    if match is None or end < match.end():
+        return None
+    return _Page(filePath, htmlText[:match.end()] + htmlText[end:],
+                 htmlText[match.end():end], None)
+
+
+def _canPatch(shown, page):
+    """Check if the shown page can be changed to ``page`` by patching its body.
+    """
+    if shown is None or page is None or \
+       shown.filePath != page.filePath or shown.head != page.head or \
+       (shown.blocks is None) != (page.blocks is None):
+        return False
+    if page.blocks is None:
+        return not (_SCRIPT_RE.search(shown.body) or _SCRIPT_RE.search(page.body))
+    changed = set(shown.blocks).symmetric_difference(page.blocks)
+    return not any(_SCRIPT_RE.search(block) for block in changed)
+
+
+def _diffBlocks(old, new):
+    """Return ``(start, removeCount, added)``: replacing ``removeCount`` blocks
+    of ``old`` at index ``start`` by the ``added`` blocks produces ``new``.
+    """
+    start = 0
+    while start < min(len(old), len(new)) and old[start] == new[start]:
+        start += 1
+    end = 0
+    while end < min(len(old), len(new)) - start and old[-1 - end] == new[-1 - end]:
+        end += 1
+    return start, len(old) - end - start, new[start:len(new) - end]
+#
+# DomPatcher
+# ==========
+
+
+class DomPatcher(QObject):
+    """Update the body of the page shown by a QWebEnginePage.
+
+    The page pulls updates: Python asks the page to fetch an update, then the
+    page asks for the difference between what it shows and the latest HTML. So,
+    several quick updates are sent to the page as one.
+    """
+    # Emitted when the page has applied an update.
+    patched = pyqtSignal()
+    # Emitted when the page couldn't apply an update, so it must be reloaded.
+    reloadNeeded = pyqtSignal()
+
+    # The JavaScript side. It uses ``withWebChannel`` from PreviewSync, which
+    # runs in the same world.
+    _jsDomPatch = (
+        # Replace the children of ``oldParent`` by those of ``newParent``,
+        # keeping the nodes which didn't change.
+        'function enkiMorphChildren(oldParent, newParent) {'
+            'var oldNode = oldParent.firstChild;'
+            'var newNode = newParent.firstChild;'
+            'while (newNode) {'
+                'var nextNew = newNode.nextSibling;'
+                # Keep the highlight added by PreviewSync.
+                'if (oldNode && oldNode.id === "highlighter") {'
+                    'oldNode = oldNode.nextSibling;'
+                    'continue;'
+                '}'
+                'if (!oldNode) {'
+                    'oldParent.appendChild(newNode);'
+                '} else if (oldNode.isEqualNode(newNode)) {'
+                    'oldNode = oldNode.nextSibling;'
+                # A node was removed.
+                '} else if (oldNode.nextSibling && oldNode.nextSibling.isEqualNode(newNode)) {'
+                    'var removed = oldNode;'
+                    'oldNode = oldNode.nextSibling.nextSibling;'
+                    'oldParent.removeChild(removed);'
+                # A node was inserted.
+                '} else if (nextNew && nextNew.isEqualNode(oldNode)) {'
+                    'oldParent.insertBefore(newNode, oldNode);'
+                '} else if (oldNode.nodeType !== newNode.nodeType || oldNode.nodeName !== newNode.nodeName) {'
+                    'oldParent.replaceChild(newNode, oldNode);'
+                    'oldNode = newNode.nextSibling;'
+                '} else if (oldNode.nodeType === Node.ELEMENT_NODE) {'
+                    'enkiMorphAttributes(oldNode, newNode);'
+                    'enkiMorphChildren(oldNode, newNode);'
+                    'oldNode = oldNode.nextSibling;'
+                '} else {'
+                    'oldNode.nodeValue = newNode.nodeValue;'
+                    'oldNode = oldNode.nextSibling;'
+                '}'
+                'newNode = nextNew;'
+            '}'
+            'while (oldNode) {'
+                'var next = oldNode.nextSibling;'
+                'if (oldNode.id !== "highlighter") {'
+                    'oldParent.removeChild(oldNode);'
+                '}'
+                'oldNode = next;'
+            '}'
+        '}'
+
+        'function enkiMorphAttributes(oldElement, newElement) {'
+            'var i;'
+            'for (i = oldElement.attributes.length - 1; i >= 0; i--) {'
+                'var name = oldElement.attributes[i].name;'
+                'if (!newElement.hasAttribute(name)) {'
+                    'oldElement.removeAttribute(name);'
+                '}'
+            '}'
+            'for (i = 0; i < newElement.attributes.length; i++) {'
+                'var attribute = newElement.attributes[i];'
+                'if (oldElement.getAttribute(attribute.name) !== attribute.value) {'
+                    'oldElement.setAttribute(attribute.name, attribute.value);'
+                '}'
+            '}'
+        '}'
+
+        # Replace ``removeCount`` Markdown blocks at index ``start`` by the
+        # children of ``newBody``. Return false if the page doesn't contain the
+        # expected number of blocks, for example if the template rearranged it.
+        'function enkiPatchBlocks(start, removeCount, blockCount, newBody) {'
+            'var markers = [];'
+            'for (var node = document.body.firstChild; node; node = node.nextSibling) {'
+                'if (node.nodeType === Node.COMMENT_NODE && node.data === "%s") {'
+                    'markers.push(node);'
+                '}'
+            '}'
+            'if (markers.length !== blockCount) {'
+                'return false;'
+            '}'
+            'var end = markers[start + removeCount] || null;'
+            'var node = markers[start] || null;'
+            'while (node && node !== end) {'
+                'var next = node.nextSibling;'
+                'if (node.id !== "highlighter") {'
+                    'node.remove();'
+                '}'
+                'node = next;'
+            '}'
+            'while (newBody.firstChild) {'
+                'document.body.insertBefore(newBody.firstChild, end);'
+            '}'
+            'return true;'
+        '}'
+
+        'function enkiApplyUpdate(update) {'
+            'var newBody = document.createElement("body");'
+            'newBody.innerHTML = update.html;'
+            'if (update.blocks) {'
+                'return enkiPatchBlocks(update.blocks[0], update.blocks[1], update.blocks[2], newBody);'
+            '}'
+            'enkiMorphChildren(document.body, newBody);'
+            'return true;'
+        '}'
+
+        'function enkiPullUpdate() {'
+            'withWebChannel(function(channel) {'
+                'var domPatcher = channel.objects.domPatcher;'
+                'domPatcher.takeUpdate(function(update) {'
+                    'if (update) {'
+                        'var ok;'
+                        'try {'
+                            'ok = enkiApplyUpdate(JSON.parse(update));'
+                        '} catch (err) {'
+                            'ok = false;'
+                        '}'
+                        'domPatcher.updateApplied(ok);'
+                    '}'
+                '});'
+            '});'
+        '}') % BLOCK_MARKER
+
+    def __init__(self,
+      # The QWebEnginePage to update.
+      page,
+      # The QWebChannel of the page, or None if it has none. Without a channel,
+      # all updates reload the page.
+      channel,
+      # A function which runs a function after the page is loaded, such as
+      # ``AfterLoaded.afterLoaded``.
+      afterLoaded):
+
+        QObject.__init__(self)
+        self._page = page
+        self._channel = channel
+        self._afterLoaded = afterLoaded
+        # The page as it will be after applying updates already taken by the
+        # page, or None if it can't be patched.
+        self._shown = None
+        # The latest page passed to ``update``.
+        self._latest = None
+
+        if channel is not None:
+            script = QWebEngineScript()
+            script.setSourceCode(self._jsDomPatch)
+            script.setName('domPatch')
+            script.setWorldId(QWebEngineScript.ApplicationWorld)
+            script.setInjectionPoint(QWebEngineScript.DocumentCreation)
+            script.setRunsOnSubFrames(False)
+            page.scripts().insert(script)
+            channel.registerObject('domPatcher', self)
+
+    def terminate(self):
+        # Disconnect all signals.
+        sip.delete(self)
+
+    def update(self, filePath, htmlText, baseUrl):
+        """Show new HTML. Return True if the shown page will be patched, or
+        False if the caller must load the page.
+        """
+        page = None
+        if self._channel is not None and baseUrl.isEmpty():
+            page = _parsePage(filePath, htmlText)
+
+        if not _canPatch(self._shown, page):
+            self._shown = self._latest = page
+            return False
+
+        self._latest = page
+        self._afterLoaded(self._page.runJavaScript, 'enkiPullUpdate();',
+                          QWebEngineScript.ApplicationWorld)
+        return True
+
+    @pyqtSlot(result=str)
+    def takeUpdate(self):
+        """Called by the page. Return JSON describing the changes to make to the
+        shown page, or an empty string if nothing changed.
+        """
+        shown, latest = self._shown, self._latest
+        if shown is None or latest is None or shown is latest:
+            return ''
+        self._shown = latest
+
+        if latest.blocks is None:
+            if shown.body == latest.body:
+                return ''
+            return json.dumps({'html': latest.body})
+
+        start, removeCount, added = _diffBlocks(shown.blocks, latest.blocks)
+        if not removeCount and not added:
+            return ''
+        return json.dumps({'blocks': [start, removeCount, len(shown.blocks)],
+                           'html': ''.join('<!--{}-->{}'.format(BLOCK_MARKER, block)
+                                           for block in added)})
+
+    @pyqtSlot(bool)
+    def updateApplied(self, ok):
+        """Called by the page after applying an update.
+        """
+        if ok:
+            self.patched.emit()
+        else:
+            self._shown = self._latest = None
+            self.reloadNeeded.emit()
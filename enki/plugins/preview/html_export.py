@@ -0,0 +1,181 @@
+# .. -*- coding: utf-8 -*-
+#
+# ***************************************************************
+# html_export.py - Save the preview as a self-contained HTML file
+# ***************************************************************
+# The preview refers to images, stylesheets and scripts by paths relative to
+# the previewed document, or to the Sphinx output. A copy of its HTML saved
+# elsewhere loses them. So, :func:`exportHtml` copies the local files the page
+# refers to into a ``<name>_files`` directory next to the saved file, like a
+# browser's "Save page, complete", and rewrites the references.
+#
+# Nothing here uses Qt, so that the preview can run the export in a worker
+# thread.
+#
+# Imports
+# =======
+# Library imports
+# ---------------
+import os
+import os.path
+import re
+import shutil
+from urllib.parse import unquote, urlsplit
+#
+# Assets
+# ======
+# The attributes which load a file into the page: ``src`` of any element and
+# ``href`` of ``<link>`` elements, such as stylesheets and icons. Links to
+# other pages (``<a href=...>``) are left alone.
+_ASSET_RE = re.compile(r'''(?P<prefix><(?:link\b[^>]*?\bhref|[a-z][a-z0-9]*\b[^>]*?\bsrc)\s*=\s*)'''
+                       r'''(?P<quote>["'])(?P<url>.*?)(?P=quote)''', re.IGNORECASE | re.DOTALL)
+# ``url(...)`` in a stylesheet, for example a font.
+_CSS_URL_RE = re.compile(r'''url\(\s*(?P<quote>["']?)(?P<url>[^"')]+)(?P=quote)\s*\)''')
+
+
+def _localPath(url, baseDir):
+    """Return the absolute path of the local file a URL in the page refers to,
+    or None if it is remote, an anchor or data.
+    """
+    parts = urlsplit(url)
+    if parts.scheme == 'file':
+        path = unquote(parts.path)
+        # ``file:///C:/dir`` on Windows.
+        if re.match('^/[a-zA-Z]:', path):
+            path = path[1:]
+    elif parts.scheme or parts.netloc or not parts.path:
+        return None
+    else:
+        path = os.path.join(baseDir, unquote(parts.path))
+    path = os.path.normpath(path)
+    return path if os.path.isfile(path) else None
+
+
+def _copy(source, dest, copied):
+    """Copy ``source`` to ``dest`` once. Record it in ``copied``.
+    """
+    if dest in copied:
+        return
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    shutil.copyfile(source, dest)
+    copied.add(dest)
+
+
+def _isInside(path, dirPath):
+    """Check that ``path`` is ``dirPath`` or below it.
+    """
+    path = os.path.normcase(os.path.abspath(path))
+    dirPath = os.path.normcase(os.path.abspath(dirPath))
+    try:
+        return os.path.commonpath([path, dirPath]) == dirPath
+    except ValueError:
+        # On another drive.
+        return False
+
+
+def _outsideName(source, outside):
+    """Name of the copy of a file, which can't keep its place relative to the
+    base directory, at the top of the assets directory. Numbered to keep the
+    names apart. ``outside`` is ``{source path: name}``.
+    """
+    if source not in outside:
+        outside[source] = '{}_{}'.format(len(outside), os.path.basename(source))
+    return outside[source]
+
+
+def _copyCss(cssPath, destCssPath, assetsDir, copied, outside):
+    """Copy a stylesheet and the files it refers to. Files keep their place
+    relative to it, if it stays in ``assetsDir``. Others are put at the top of
+    ``assetsDir`` and the stylesheet copy refers to them there, so that no
+    file is written outside of ``assetsDir``.
+    """
+    if destCssPath in copied:
+        return
+    # ``surrogateescape`` writes back any bytes which aren't UTF-8 unchanged.
+    with open(cssPath, encoding='utf-8', errors='surrogateescape') as f:
+        css = f.read()
+    cssDir = os.path.dirname(cssPath)
+    destCssDir = os.path.dirname(destCssPath)
+
+    def replace(match):
+        url = match.group('url')
+        parts = urlsplit(url)
+        if parts.scheme or parts.netloc or os.path.isabs(parts.path):
+            return match.group(0)
+        source = _localPath(url, cssDir)
+        if source is None:
+            return match.group(0)
+        dest = os.path.normpath(os.path.join(destCssDir, unquote(parts.path)))
+        if _isInside(dest, assetsDir):
+            _copy(source, dest, copied)
+            return match.group(0)
+        dest = os.path.join(assetsDir, _outsideName(source, outside))
+        _copy(source, dest, copied)
+        newUrl = os.path.relpath(dest, destCssDir).replace(os.sep, '/')
+        if parts.query:
+            newUrl += '?' + parts.query
+        if parts.fragment:
+            newUrl += '#' + parts.fragment
+        return 'url({0}{1}{0})'.format(match.group('quote'), newUrl)
+
+    css = _CSS_URL_RE.sub(replace, css)
+    os.makedirs(destCssDir, exist_ok=True)
+    with open(destCssPath, 'w', encoding='utf-8', errors='surrogateescape') as f:
+        f.write(css)
+    copied.add(destCssPath)
+#
+# Export
+# ======
+
+
+def exportHtml(
+  # The HTML of the preview.
+  html,
+  # The directory relative URLs in the page refer to, or None if unknown.
+  baseDir,
+  # The file to write.
+  path):
+    """Write ``html`` to ``path`` with copies of the local files it refers to.
+    Return the number of files copied. Raises OSError on failure.
+    """
+    copied = set()
+    saveDir = os.path.dirname(os.path.abspath(path))
+    # If the file is saved where its relative references already work, there
+    # is nothing to copy.
+    if baseDir is not None and os.path.normcase(os.path.abspath(baseDir)) != os.path.normcase(saveDir):
+        assetsName = os.path.splitext(os.path.basename(path))[0] + '_files'
+        assetsDir = os.path.join(saveDir, assetsName)
+        # {source path: URL of its copy}
+        urls = {}
+        # {source path: name} of the copies at the top of the assets directory
+        outside = {}
+
+        def replace(match):
+            source = _localPath(match.group('url'), baseDir)
+            if source is None:
+                return match.group(0)
+            if source not in urls:
+                try:
+                    relPath = os.path.relpath(source, baseDir)
+                except ValueError:
+                    # On another drive.
+                    relPath = os.pardir
+                # Keep the layout of the files below the base directory, which
+                # relative references between them rely on. Put others at the
+                # top.
+                if relPath.startswith(os.pardir) or os.path.isabs(relPath):
+                    relPath = _outsideName(source, outside)
+                dest = os.path.join(assetsDir, relPath)
+                if source.lower().endswith('.css'):
+                    _copyCss(source, dest, assetsDir, copied, outside)
+                else:
+                    _copy(source, dest, copied)
+                urls[source] = '/'.join([assetsName] + relPath.split(os.sep))
+            return (match.group('prefix') + match.group('quote') + urls[source] +
+                    match.group('quote'))
+
+        html = _ASSET_RE.sub(replace, html)
+
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(html)
+    return len(copied)
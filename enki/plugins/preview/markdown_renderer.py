@@ -0,0 +1,228 @@
+# *********************************************************
+# markdown_renderer.py - Incremental Markdown to HTML rendering
+# *********************************************************
+# Rendering a long Markdown document after each typing pause is slow. However,
+# an edit usually changes only one paragraph. So, this module splits the
+# document into top-level blocks, renders each block separately and caches the
+# result. On the next render, only changed blocks are converted.
+#
+# The rendered HTML marks the start of each block with a comment, so that the
+# preview can replace changed blocks in the page instead of reloading it.
+#
+# Imports
+# =======
+# Library imports
+# ---------------
+import re
+#
+# Splitting
+# =========
+# Splitting must not change the resulting HTML. So, the document is split only
+# at a blank line which is followed by a line starting a new top-level
+# construct. Keeping lines together is always safe, so any doubtful case keeps
+# them in the same block.
+_FENCE_RE = re.compile(r'^ {0,3}(`{3,}|~{3,})')
+_LIST_RE = re.compile(r'^ {0,3}([*+-]|\d+\.)(\s|$)')
+_QUOTE_RE = re.compile(r'^ {0,3}>')
+_REFERENCE_RE = re.compile(r'^ {0,3}\[[^\]]+\]:')
+_HTML_BLOCK_RE = re.compile(r'^ {0,3}<(!--|/?([a-zA-Z][a-zA-Z0-9]*))')
+# Python-Markdown passes these tags through as raw HTML blocks, which end with
+# the matching closing tag, even if there are blank lines inside.
+_HTML_BLOCK_TAGS = {'address', 'blockquote', 'center', 'del', 'div', 'dl',
+                    'fieldset', 'figure', 'form', 'h1', 'h2', 'h3', 'h4', 'h5',
+                    'h6', 'hr', 'iframe', 'ins', 'math', 'noscript', 'ol', 'p',
+                    'pre', 'script', 'section', 'style', 'table', 'ul', 'video'}
+
+
+def splitBlocks(text):
+    """Split Markdown text into top-level blocks, which render the same way
+    separately and together.
+
+    Return ``(blocks, references)``. ``references`` is the text of all
+    reference-style link definitions; any block may use them.
+    """
+    blocks = []
+    references = []
+    current = []
+    hasContent = False
+    afterBlank = False
+    # The kind of the top-level construct being parsed: a list, a block quote
+    # or something else. Python-Markdown joins lists and quotes separated by
+    # blank lines.
+    kind = None
+    # Closing fence of a fenced code block, or None.
+    fence = None
+    # The string which ends a raw HTML block, or None.
+    htmlEnd = None
+
+    for line in text.split('\n'):
+        if fence is not None:
+            current.append(line)
+            match = _FENCE_RE.match(line)
+            if match and match.group(1).startswith(fence) and not line[match.end():].strip():
+                fence = None
+            continue
+
+        if htmlEnd is not None:
+            current.append(line)
+            if htmlEnd in line.lower():
+                htmlEnd = None
+            continue
+
+        if not line.strip():
+            current.append(line)
+            afterBlank = True
+            continue
+
+        indented = line.startswith(('    ', '\t'))
+        if _LIST_RE.match(line):
+            lineKind = 'list'
+        elif _QUOTE_RE.match(line):
+            lineKind = 'quote'
+        else:
+            lineKind = None
+
+        if afterBlank and not indented:
+            if hasContent and (lineKind is None or lineKind != kind):
+                blocks.append('\n'.join(current))
+                current = []
+                hasContent = False
+            kind = lineKind
+        elif not hasContent:
+            kind = lineKind
+        afterBlank = False
+
+        current.append(line)
+        hasContent = True
+        if indented:
+            continue
+
+        match = _FENCE_RE.match(line)
+        if match:
+            fence = match.group(1)
+            continue
+
+        if _REFERENCE_RE.match(line):
+            references.append(line)
+            continue
+
+        match = _HTML_BLOCK_RE.match(line)
+        if match:
+            if match.group(1) == '!--':
+                if '-->' not in line:
+                    htmlEnd = '-->'
+            elif match.group(2).lower() in _HTML_BLOCK_TAGS and not line.lstrip().startswith('</'):
+                closingTag = '</{}>'.format(match.group(2).lower())
+                if closingTag not in line.lower():
+                    htmlEnd = closingTag
+
+    if current:
+        blocks.append('\n'.join(current))
+    return blocks, '\n'.join(references)
+#
+# RenderedMarkdown
+# ================
+# The HTML of a Markdown document. The string itself is the whole page, so it
+# may be used like any other HTML. The blocks allow updating only the changed
+# parts of a page showing a previous rendering.
+BLOCK_MARKER = 'enki-block'
+
+
+class RenderedMarkdown(str):
+    def __new__(cls, template, blocks):
+        # The explicit ``<body>`` keeps block markers inside the body, even if
+        # the template only contains ``<head>`` elements such as ``<style>``.
+        self = str.__new__(cls, template + '<body>' +
+                           ''.join('<!--{}-->{}'.format(BLOCK_MARKER, block)
+                                   for block in blocks))
+        self.template = template
+        self.blocks = blocks
+        return self
+
+    # Pickling, used to return the HTML from a worker process, passes these
+    # arguments to ``__new__``.
+    def __getnewargs__(self):
+        return self.template, self.blocks
+#
+# MarkdownRenderer
+# ================
+
+
+class MarkdownRenderer:
+    """Render Markdown documents, reusing the HTML of blocks which haven't
+    changed since the previous call.
+
+    Not thread safe: use an instance from one thread at a time.
+    """
+
+    def __init__(self):
+        self._markdown = None
+        # {(references, block text): HTML}. Holds the blocks of the last
+        # rendered document only.
+        self._cache = {}
+
+    def render(self, template, text):
+        """Return HTML for the Markdown ``text``, prefixed with the ``template``.
+
+        Returns a :class:`RenderedMarkdown` instance, or a plain message if
+        Python-Markdown isn't installed.
+        """
+        md = self._getMarkdown()
+        if md is None:
+            return 'Markdown preview requires <i>python-markdown</i> package<br/>' \
+                   'Install it with your package manager or see ' \
+                   '<a href="http://packages.python.org/Markdown/install.html">installation instructions</a>'
+
+        blocks, references = splitBlocks(text)
+        cache = {}
+
+        def convert(key, text):
+            html = self._cache.get(key)
+            if html is None:
+                html = cache.get(key)
+            if html is None:
+                md.reset()
+                html = md.convert(text)
+            cache[key] = html
+            return html
+
+        renderedTemplate = convert((None, template), template)
+        renderedBlocks = [convert((references, block),
+                                  block + '\n\n' + references if references else block)
+                          for block in blocks]
+        self._cache = cache
+
+        return RenderedMarkdown(renderedTemplate, renderedBlocks)
+
+    def _getMarkdown(self):
+        """Create the Markdown converter once. Return None if Python-Markdown
+        isn't installed.
+        """
+        if self._markdown is None:
+            try:
+                import markdown
+            except ImportError:
+                return None
+
+            extensions = ['fenced_code', 'nl2br', 'tables', 'enki.plugins.preview.mdx_math']
+
+            # version 2.0 supports only extension names, not instances
+            if markdown.version_info[0] > 2 or \
+               (markdown.version_info[0] == 2 and markdown.version_info[1] > 0):
+
+                class _StrikeThroughExtension(markdown.Extension):
+                    """http://achinghead.com/python-markdown-adding-insert-delete.html
+                    Class is placed here, because depends on imported markdown, and markdown import is lazy
+                    """
+                    DEL_RE = r'(~~)(.*?)~~'
+
+                    def extendMarkdown(self, md, md_globals):
+                        # Create the del pattern
+                        delTag = markdown.inlinepatterns.SimpleTagPattern(self.DEL_RE, 'del')
+                        # Insert del pattern into markdown parser
+                        md.inlinePatterns.add('del', delTag, '>not_strong')
+
+                extensions.append(_StrikeThroughExtension())
+
+            self._markdown = markdown.Markdown(extensions=extensions)
+        return self._markdown
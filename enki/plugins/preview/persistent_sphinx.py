@@ -0,0 +1,270 @@
+# .. -*- coding: utf-8 -*-
+#
+# ***********************************************************************
+# persistent_sphinx.py - Build Sphinx projects in a long-lived process
+# ***********************************************************************
+# Running ``sphinx-build`` for every save pays for interpreter start-up,
+# importing Sphinx and its extensions and loading the pickled environment each
+# time. For a large project, this takes far longer than rebuilding the changed
+# document. This module keeps a Sphinx application alive in a worker process
+# instead. Each build reuses the loaded environment, then reports the exact
+# HTML file produced for the previewed document.
+#
+# This file is both the client, used by the preview, and the worker, run as a
+# script. The worker imports only the standard library and Sphinx, so that it
+# doesn't load Qt.
+#
+# The protocol is one JSON object per line. The client sends build requests to
+# the worker's stdin. The worker replies on stdout with any number of ``log``
+# messages followed by one ``done`` message. The protocol uses a private copy
+# of stdout. Anything Sphinx or its extensions print is sent as log messages.
+# Output written to the file descriptors directly, by subprocesses such as
+# graphviz or LaTeX or by C code, goes to the worker's stderr, which is
+# discarded. So, neither can break the protocol.
+#
+# Imports
+# =======
+# Library imports
+# ---------------
+import json
+import os
+import os.path
+import subprocess
+import sys
+import traceback
+#
+# Client
+# ======
+
+
+class SphinxUnavailable(Exception):
+    """The persistent process can't build. Use ``sphinx-build`` instead.
+    """
+    pass
+
+
+class PersistentSphinx:
+    """Build Sphinx projects in a worker process which keeps Sphinx loaded.
+
+    Not thread safe: use an instance from one thread at a time, except for
+    :meth:`terminate`.
+    """
+    def __init__(self):
+        self._popen = None
+
+    def terminate(self):
+        """Stop the worker process.
+        """
+        popen = self._popen
+        self._popen = None
+        if popen is not None:
+            popen.kill()
+            popen.wait()
+            popen.stdin.close()
+            popen.stdout.close()
+
+    def build(self,
+      # The directory containing ``conf.py``, used as the working directory.
+      projectPath,
+      # Absolute paths to the source, output and doctree directories.
+      sourcePath, outputPath, doctreePath,
+      # The document being previewed.
+      filePath,
+      # A function called with each line of the build log.
+      onLog,
+      # The number of processes Sphinx may use, like ``sphinx-build -j``.
+      parallel=1):
+        """Update the output of the project. Return ``(outputFile, warnings)``,
+        where ``outputFile`` is the HTML file built from ``filePath`` or None if
+        it isn't a document of the project.
+
+        Raises :class:`SphinxUnavailable` if the worker can't run Sphinx.
+        """
+        if getattr(sys, 'frozen', False):
+            raise SphinxUnavailable('The persistent Sphinx process requires a Python interpreter.')
+
+        request = json.dumps({'projectPath': projectPath,
+                              'sourcePath': sourcePath,
+                              'outputPath': outputPath,
+                              'doctreePath': doctreePath,
+                              'filePath': filePath,
+                              'parallel': parallel})
+        try:
+            popen = self._start()
+            popen.stdin.write(request + '\n')
+            popen.stdin.flush()
+            for line in popen.stdout:
+                message = json.loads(line)
+                if 'log' in message:
+                    onLog(message['log'])
+                elif 'unavailable' in message:
+                    self.terminate()
+                    raise SphinxUnavailable(message['unavailable'])
+                elif 'done' in message:
+                    return message['outputFile'], message['warnings']
+        except (OSError, ValueError) as ex:
+            self.terminate()
+            raise SphinxUnavailable('The persistent Sphinx process failed: {}'.format(ex))
+
+        # The worker exited while building. Start a new one next time.
+        self.terminate()
+        raise SphinxUnavailable('The persistent Sphinx process exited.')
+
+    def _start(self):
+        if self._popen is None or self._popen.poll() is not None:
+            self._popen = subprocess.Popen(
+                [sys.executable, os.path.abspath(__file__)],
+                stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL, universal_newlines=True,
+                # Sphinx and conf.py may print non-ASCII text.
+                env=dict(os.environ, PYTHONIOENCODING='utf-8'))
+        return self._popen
+#
+# Worker
+# ======
+# The worker runs this part as a script.
+
+
+class _LogStream:
+    """A file-like object which sends each line written to it as a log
+    message. ``\\r`` ends a line too, since Sphinx uses it to update progress
+    messages.
+    """
+    def __init__(self, send):
+        self._send = send
+        self._buffer = ''
+
+    def write(self, text):
+        self._buffer += text.replace('\r\n', '\n').replace('\r', '\n')
+        *lines, self._buffer = self._buffer.split('\n')
+        for line in lines:
+            self._send({'log': line})
+        return len(text)
+
+    def flush(self):
+        pass
+
+    def isatty(self):
+        return False
+
+    def flushLine(self):
+        """Send a partial line, if any.
+        """
+        if self._buffer:
+            self._send({'log': self._buffer})
+            self._buffer = ''
+
+
+class _Worker:
+    def __init__(self, send):
+        self._send = send
+        self._app = None
+        # The request fields and conf.py modification time the application
+        # was created for.
+        self._appKey = None
+        # The application keeps writing its warnings here.
+        self._warnings = _WarningStream()
+
+    def build(self, request):
+        from sphinx.application import Sphinx
+
+        os.chdir(request['projectPath'])
+        confPath = os.path.join(request['sourcePath'], 'conf.py')
+        try:
+            confTime = os.path.getmtime(confPath)
+        except OSError:
+            confTime = None
+        appKey = (request['sourcePath'], request['outputPath'],
+                  request['doctreePath'], request['parallel'], confTime)
+
+        for attempt in range(2):
+            # Send warnings of the last attempt only.
+            self._warnings.text = ''
+            if self._app is None or self._appKey != appKey:
+                self._app = None
+                # ``freshenv=False`` reuses the pickled environment the first
+                # time; later builds use the one in memory.
+                self._app = Sphinx(request['sourcePath'], request['sourcePath'],
+                                   request['outputPath'], request['doctreePath'],
+                                   'html', status=sys.stdout, warning=self._warnings,
+                                   freshenv=False, parallel=request['parallel'])
+                self._appKey = appKey
+            try:
+                # Like ``sphinx-build`` without file names: rebuild the
+                # documents which changed, reusing the loaded environment.
+                self._app.build()
+                break
+            except Exception as ex:
+                # Some extensions don't expect to be built twice. Try once more
+                # with a new application.
+                self._app = None
+                if attempt:
+                    raise
+                print('Retrying with a new Sphinx application after: {}'.format(ex))
+
+        return self._outputFile(request['filePath']), self._warnings.text
+
+    def _outputFile(self, filePath):
+        env = self._app.env
+        if hasattr(env, 'path2doc'):
+            docname = env.path2doc(filePath)
+        else:
+            relPath = os.path.relpath(filePath, self._app.srcdir)
+            docname = os.path.splitext(relPath)[0].replace(os.sep, '/')
+        if docname is None or docname not in env.found_docs:
+            return None
+        return os.path.abspath(self._app.builder.get_outfilename(docname))
+
+
+class _WarningStream:
+    def __init__(self):
+        self.text = ''
+
+    def write(self, text):
+        self.text += text
+        return len(text)
+
+    def flush(self):
+        pass
+
+    def isatty(self):
+        return False
+
+
+def _serve():
+    # Use a private copy of stdout for the protocol; everything else printed
+    # becomes a log message. Point file descriptor 1, inherited by
+    # subprocesses, to stderr.
+    protocol = os.fdopen(os.dup(sys.stdout.fileno()), 'w', encoding='utf-8')
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+
+    def send(message):
+        protocol.write(json.dumps(message) + '\n')
+        protocol.flush()
+
+    log = _LogStream(send)
+    sys.stdout = sys.stderr = log
+
+    try:
+        import sphinx.application
+        from sphinx.util.console import nocolor
+    except ImportError as ex:
+        send({'unavailable': 'Sphinx is not installed for {}: {}'.format(sys.executable, ex)})
+        return
+    # Like ``sphinx-build`` writing to a pipe, don't color the log.
+    nocolor()
+
+    worker = _Worker(send)
+    for line in sys.stdin:
+        request = json.loads(line)
+        try:
+            outputFile, warnings = worker.build(request)
+        except Exception:
+            outputFile = None
+            warnings = 'Sphinx build failed:\n' + traceback.format_exc()
+        log.flushLine()
+        send({'done': True, 'outputFile': outputFile, 'warnings': warnings})
+
+
+if __name__ == '__main__':
+    _serve()
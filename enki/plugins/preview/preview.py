@@ -6,20 +6,27 @@
 # =======
 # Library imports
 # ---------------
+import os
 import os.path
 import io
-import re
 import shutil
 import html
 import sys
 import shlex
 import codecs
+import fnmatch
+import functools
+import collections
+import signal
+import statistics
+import subprocess
+import threading
+import time
 from queue import Queue
 #
 # Third-party imports
 # -------------------
-from PyQt5.QtCore import (pyqtSignal, Qt, QThread, QTimer, QUrl,
-                          QEventLoop, QObject)
+from PyQt5.QtCore import pyqtSignal, Qt, QThread, QTimer, QUrl, QObject
 from PyQt5.QtWidgets import QFileDialog, QMessageBox, QWidget
 from PyQt5.QtGui import QDesktopServices, QIcon, QPalette, QWheelEvent
 from PyQt5.QtWebEngineWidgets import QWebEnginePage, QWebEngineView
@@ -33,8 +40,16 @@ from enki.widgets.dockwidget import DockWidget
 from enki.plugins.preview import isHtmlFile, canUseCodeChat, \
     sphinxEnabledForFile
 from .preview_sync import PreviewSync
+from .converter_pool import ConverterPool, ConversionCancelled
+from .render_cache import RenderCache, textHash
+from .markdown_renderer import RenderedMarkdown
+from .persistent_sphinx import PersistentSphinx, SphinxUnavailable
+from .dom_patch import DomPatcher
+from .build_log import LogBuffer, CLEAR, ERROR
+from .html_export import exportHtml
 from enki.lib.get_console_output import open_console_output
 from enki.lib.future import AsyncController, RunLatest
+from enki.lib.debounce import AdaptiveDebouncer
 
 
 # Attempt importing CodeChat; failing that, disable the CodeChat
@@ -50,6 +65,22 @@ else:
     import CodeChat.CodeToRest as CodeToRest
 
 
+# Total length of the HTML kept by the render cache, in characters.
+_RENDER_CACHE_BUDGET = 32 * 1024 * 1024
+# The log window keeps this many lines; older lines are dropped.
+_LOG_MAX_LINES = 20000
+# Build output is added to the log window at most this often.
+_LOG_FLUSH_INTERVAL_MS = 100
+# The number of Sphinx build durations kept per project.
+_BUILD_TIMES_KEPT = 50
+# Start ``sphinx-build`` in a new process group, so that cancelling a build
+# also stops the processes of a parallel build.
+if sys.platform.startswith('win'):
+    _NEW_PROCESS_GROUP = {'creationflags': subprocess.CREATE_NEW_PROCESS_GROUP}
+else:
+    _NEW_PROCESS_GROUP = {'start_new_session': True}
+
+
 # Global functions
 # ================
 def copyTemplateFile(errors, source, templateFileName, dest, newName=None):
@@ -71,6 +102,33 @@ def copyTemplateFile(errors, source, templateFileName, dest, newName=None):
             errors.append((sourcePath, dest, str(why)))
 
 
+def _killProcessGroup(popen):
+    """Kill a process started with ``_NEW_PROCESS_GROUP``, and its children.
+    """
+    try:
+        if sys.platform.startswith('win'):
+            # Sphinx doesn't build in parallel on Windows, so there are no
+            # children.
+            popen.kill()
+        else:
+            os.killpg(popen.pid, signal.SIGTERM)
+    except OSError:
+        pass  # already exited
+
+
+def _parallelJobs(jobs):
+    """Return the number of processes for the ``Sphinx/Jobs`` setting, which is
+    a number or ``auto``, like the ``-j`` option of ``sphinx-build``.
+    """
+    jobs = jobs.strip()
+    if jobs == 'auto':
+        return os.cpu_count() or 1
+    try:
+        return max(1, int(jobs))
+    except ValueError:
+        return 1
+
+
 def _checkModificationTime(sourceFile, outputFile, s):
     """Make sure the outputFile is newer than the sourceFile.
     Otherwise, return an error."""
@@ -91,90 +149,62 @@ def _checkModificationTime(sourceFile, outputFile, s):
 # ----------------
 # These functions and classes convert their input to HTML. They are executed in
 # a separate thread.
-def _convertMarkdown(text):
-    """Convert Markdown to HTML
+def _converterName(language, filePath):
+    """Return the name of the converter used to preview a document, or None if
+    it can't be previewed.
     """
-    try:
-        import markdown
-    except ImportError:
-        return 'Markdown preview requires <i>python-markdown</i> package<br/>' \
-               'Install it with your package manager or see ' \
-               '<a href="http://packages.python.org/Markdown/install.html">installation instructions</a>'
-
-    extensions = ['fenced_code', 'nl2br', 'tables', 'enki.plugins.preview.mdx_math']
-
-    # version 2.0 supports only extension names, not instances
-    if markdown.version_info[0] > 2 or \
-       (markdown.version_info[0] == 2 and markdown.version_info[1] > 0):
-
-        class _StrikeThroughExtension(markdown.Extension):
-            """http://achinghead.com/python-markdown-adding-insert-delete.html
-            Class is placed here, because depends on imported markdown, and markdown import is lazy
-            """
-            DEL_RE = r'(~~)(.*?)~~'
+    # For ReST, use docutils only if Sphinx isn't available.
+    if language == 'Markdown':
+        return 'Markdown'
+    elif language == 'reStructuredText' and not sphinxEnabledForFile(filePath):
+        return 'docutils'
+    elif filePath and sphinxEnabledForFile(filePath):  # Use Sphinx to generate the HTML if possible.
+        return 'Sphinx'
+    elif filePath and canUseCodeChat(filePath):  # Otherwise, fall back to using CodeChat+docutils.
+        return 'CodeChat'
+    else:
+        return None
+
+
+# Lexers used by CodeChat. Guessing a lexer runs the content checks of every
+# lexer matching the file name, which takes about as long as converting the
+# code to reST. If only one lexer matches, the guess doesn't depend on the
+# content, so the lexer is kept.
+#
+# {file name: frozenset of lexer classes, which match it}.
+_lexerClassesForName = {}
+# {lexer class: lexer}, for the names only one lexer class matches.
+_codeChatLexers = {}
 
-            def extendMarkdown(self, md, md_globals):
-                # Create the del pattern
-                delTag = markdown.inlinepatterns.SimpleTagPattern(self.DEL_RE, 'del')
-                # Insert del pattern into markdown parser
-                md.inlinePatterns.add('del', delTag, '>not_strong')
 
-        extensions.append(_StrikeThroughExtension())
+def _matchingLexerClasses(fileName):
+    """Return the lexer classes ``guess_lexer_for_filename`` picks from for a
+    file name.
+    """
+    if fileName not in _lexerClassesForName:
+        from pygments.lexers import _iter_lexerclasses
+        _lexerClassesForName[fileName] = frozenset(
+            lexerClass for lexerClass in _iter_lexerclasses()
+            if any(fnmatch.fnmatchcase(fileName, pattern)
+                   for pattern in list(lexerClass.filenames) + list(lexerClass.alias_filenames)))
+    return _lexerClassesForName[fileName]
+
+
+def _getCodeChatLexer(text, filePath):
+    """Return the Pygments lexer for a file previewed with CodeChat. It is the
+    lexer CodeChat guesses from the file name and content.
+    """
+    from CodeChat.SourceClassifier import get_lexer
 
-    return markdown.markdown(text, extensions)
+    lexerClasses = _matchingLexerClasses(os.path.basename(filePath))
+    if len(lexerClasses) != 1:
+        # For example, ``.v`` is Verilog or Coq. Only the content tells.
+        return get_lexer(filename=filePath, code=text)
 
-
-def _convertReST(text):
-    try:
-        import docutils.core
-        import docutils.writers.html4css1
-    except ImportError:
-        return 'Restructured Text preview requires the <i>python-docutils</i> package.<br/>' \
-               'Install it with your package manager or see ' \
-               '<a href="http://pypi.python.org/pypi/docutils"/>this page.</a>', None
-
-    errStream = io.StringIO()
-    docutilsHtmlWriterPath = os.path.abspath(os.path.dirname(
-      docutils.writers.html4css1.__file__))
-    settingsDict = {
-      # Make sure to use Unicode everywhere. This name comes from
-      # ``docutils.core.publish_string`` version 0.12, lines 392 and following.
-      'output_encoding': 'unicode',
-      # While ``unicode`` **should** work for ``input_encoding``, it doesn't if
-      # there's an ``.. include`` directive, since this encoding gets passed to
-      # ``docutils.io.FileInput.__init__``, in which line 236 of version 0.12
-      # tries to pass the ``unicode`` encoding to ``open``, producing:
-      #
-      # .. code:: python3
-      #    :number-lines:
-      #
-      #    File "...\python-3.4.4\lib\site-packages\docutils\io.py", line 236, in __init__
-      #      self.source = open(source_path, mode, **kwargs)
-      #    LookupError: unknown encoding: unicode
-      #
-      # So, use UTF-8 and encode the string first. Ugh.
-      'input_encoding' : 'utf-8',
-      # Don't stop processing, no matter what.
-      'halt_level'     : 5,
-      # Capture errors to a string and return it.
-      'warning_stream' : errStream,
-      # On some Windows PC, docutils will complain that it can't find its
-      # template or stylesheet. On other Windows PCs with the same setup, it
-      # works fine. ??? So, specify a path to both here.
-      'template': (
-        os.path.join(docutilsHtmlWriterPath,
-                     docutils.writers.html4css1.Writer.default_template) ),
-      'stylesheet_dirs' : (
-        docutilsHtmlWriterPath,
-        os.path.join(os.path.abspath(os.path.dirname(
-          os.path.realpath(__file__))), 'rst_templates')),
-      'stylesheet_path' : 'default.css',
-      }
-    htmlString = docutils.core.publish_string(bytes(text, encoding='utf-8'),
-      writer_name='html', settings_overrides=settingsDict)
-    errString = errStream.getvalue()
-    errStream.close()
-    return htmlString, errString
+    lexerClass, = lexerClasses
+    if lexerClass not in _codeChatLexers:
+        _codeChatLexers[lexerClass] = get_lexer(filename=filePath, code=text)
+    return _codeChatLexers[lexerClass]
 
 
 def _convertCodeChat(text, filePath):
@@ -183,7 +213,7 @@ def _convertCodeChat(text, filePath):
     errStream = io.StringIO()
     try:
         htmlString = CodeToRest.code_to_html_string(text, errStream,
-                                                    filename=filePath)
+                                                    lexer=_getCodeChatLexer(text, filePath))
     except KeyError:
         # Although the file extension may be in the list of supported
         # extensions, CodeChat may not support the lexer chosen by Pygments.
@@ -196,32 +226,81 @@ def _convertCodeChat(text, filePath):
     return filePath, htmlString, errString, QUrl()
 
 
+class LoggedText(str):
+    """The messages of a conversion which were written to the log while
+    converting, so they must not be shown again.
+    """
+    pass
+
+
 class SphinxConverter(QObject):
     """This class converts Sphinx input to HTML. It is run in a separate
     thread.
     """
-    # This signal clears the context of the log window.
-    logWindowClear = pyqtSignal()
+    def __init__(self, parent,
+      # The LogBuffer which receives the build output. ``convert`` returns the
+      # errors and warnings it wrote as a LoggedText.
+      logBuffer):
 
-    # This signal emits messages for the log window.
-    logWindowText = pyqtSignal(
-      # A string to append to the log window.
-      str)
-
-    def __init__(self, parent):
         super().__init__(parent)
+        self._log = logBuffer
         # Use an additional thread to process Sphinx output.
         self._ac = AsyncController('QThread', self)
         self._ac.defaultPriority = QThread.LowPriority
         self._SphinxInvocationCount = 1
+        self._persistentSphinx = PersistentSphinx()
+        # The running ``sphinx-build`` process, or None. ``cancel`` kills it
+        # from the GUI thread, so it is guarded by ``_lock``.
+        self._lock = threading.Lock()
+        self._popen = None
+        # {project path: durations of the last builds in seconds}, to show
+        # how much the incremental builds save.
+        self._buildTimes = {}
 
     def terminate(self):
         # Free resources.
+        self.cancel()
+        self._persistentSphinx.terminate()
         self._ac.terminate()
 
+    def cancel(self):
+        """Stop the running ``sphinx-build``, if any; its ``convert`` returns
+        None. Return True if a build was stopped. Called from the GUI thread.
+        """
+        with self._lock:
+            popen = self._popen
+            if popen is None:
+                return False
+            self._popen = None
+            popen.cancelled = True
+        _killProcessGroup(popen)
+        return True
+
+    def buildTimes(self, projectPath):
+        """Return the durations of the last builds of a project, in seconds,
+        the oldest first.
+        """
+        return list(self._buildTimes.get(projectPath, []))
+
     def convert(self, filePath):
+        """Build the project. Return ``(filePath, html, errString, baseUrl)``,
+        or None if the build was cancelled.
+        """
+        startTime = time.monotonic()
+        # Advanced mode runs a user-defined command line, which the persistent
+        # process can't emulate.
+        if core.config()['Sphinx']['Persistent'] and not core.config()['Sphinx']['AdvancedMode']:
+            result = self._convertPersistent(filePath)
+            if result is not None:
+                self._recordBuildTime(time.monotonic() - startTime)
+                return result
+
         # Run the builder.
         errString = self._runHtmlBuilder()
+        if errString is None:
+            self._log.write('Build cancelled.\n')
+            return None
+        self._recordBuildTime(time.monotonic() - startTime)
 
         # Look for the HTML output.
         #
@@ -245,9 +324,11 @@ class SphinxConverter(QObject):
                 if hfs:
                     html_file_suffix = hfs
         except:
-            errString = "Warning: assuming .html extension. Use " + \
-                "the conf.py template to set the extension.\n" + errString
-            pass
+            warning = "Warning: assuming .html extension. Use " + \
+                "the conf.py template to set the extension.\n"
+            self._log.write(warning, isError=True)
+            errString = warning + errString
+        errString = LoggedText(errString)
         # First place to look: file.html. For example, look for foo.py
         # in foo.py.html.
         htmlFile = htmlPath + html_file_suffix
@@ -264,6 +345,47 @@ class SphinxConverter(QObject):
             return (filePath, 'No preview for this type of file.<br>Expected ' +
                     htmlFile + " or " + htmlFileAlter, errString, QUrl())
 
+    def _recordBuildTime(self, duration):
+        projectPath = core.config()['Sphinx']['ProjectPath']
+        times = self._buildTimes.setdefault(projectPath,
+                                            collections.deque(maxlen=_BUILD_TIMES_KEPT))
+        times.append(duration)
+        self._log.write('\nBuilt in {:.2f} s. Last {} builds of this project: first {:.2f} s, '
+                        'median {:.2f} s.\n'.format(duration, len(times), times[0],
+                                                    statistics.median(times)))
+
+    def _convertPersistent(self, filePath):
+        """Build with the persistent Sphinx process. Return the same result as
+        ``convert``, or None if the process can't build.
+        """
+        projectPath = core.config()['Sphinx']['ProjectPath']
+        sourcePath = os.path.join(projectPath, core.config()['Sphinx']['SourcePath'])
+        outputPath = os.path.join(projectPath, core.config()['Sphinx']['OutputPath'])
+        # The same doctree directory as the command line built by _runHtmlBuilder.
+        doctreePath = os.path.join(projectPath, '_build', 'doctrees')
+
+        # Clear the log at the beginning of a Sphinx build.
+        self._log.clear()
+        self._log.write('{} : persistent Sphinx process\n\n\n'.format(projectPath))
+        try:
+            outputFile, errString = self._persistentSphinx.build(
+                projectPath, sourcePath, outputPath, doctreePath, filePath,
+                lambda line: self._log.write(line + '\n'),
+                _parallelJobs(core.config()['Sphinx']['Jobs']))
+        except SphinxUnavailable as ex:
+            self._log.write('{}\nRunning {} instead.\n\n'.format(
+                ex, core.config()['Sphinx']['Executable']))
+            return None
+        self._SphinxInvocationCount += 1
+        # The persistent process reports the warnings after the build.
+        self._log.write(errString, isError=True)
+        errString = LoggedText(errString)
+
+        if outputFile is None:
+            return (filePath, 'No preview for this type of file.<br>' + filePath +
+                    ' is not a document of the Sphinx project.', errString, QUrl())
+        return filePath, '', errString, QUrl.fromLocalFile(outputFile)
+
     def _runHtmlBuilder(self):
         # Build the commond line for Sphinx.
         if core.config()['Sphinx']['AdvancedMode']:
@@ -284,11 +406,15 @@ class SphinxConverter(QObject):
               core.config()['Sphinx']['SourcePath'],
               # Build directory
               core.config()['Sphinx']['OutputPath']]
+            jobs = core.config()['Sphinx']['Jobs'].strip()
+            if jobs and jobs != '1':
+                # Read and write documents in parallel processes.
+                htmlBuilderCommandLine[1:1] = ['-j', jobs]
 
         # Invoke it.
         try:
             # Clear the log at the beginning of a Sphinx build.
-            self.logWindowClear.emit()
+            self._log.clear()
 
             cwd = core.config()['Sphinx']['ProjectPath']
             # If the command line is already a string (advanced mode), just print it.
@@ -297,8 +423,7 @@ class SphinxConverter(QObject):
                 htmlBuilderCommandLineStr = htmlBuilderCommandLine
             else:
                 htmlBuilderCommandLineStr = ' '.join(htmlBuilderCommandLine)
-            self.logWindowText.emit('{} : {}\n\n'.format(cwd,
-                                                         htmlBuilderCommandLineStr))
+            self._log.write('{} : {}\n\n\n'.format(cwd, htmlBuilderCommandLineStr))
 
             # Sphinx will output just a carriage return (0x0D) to simulate a
             # single line being updated by build status and the build
@@ -308,22 +433,34 @@ class SphinxConverter(QObject):
             # treated as a separate line, providing immediate feedback on build
             # progress.
             popen = open_console_output(htmlBuilderCommandLine, cwd=cwd,
-                                        universal_newlines=True)
+                                        universal_newlines=True,
+                                        **_NEW_PROCESS_GROUP)
+            popen.cancelled = False
+            with self._lock:
+                self._popen = popen
             # Read are blocking; we can't read from both stdout and stderr in the
             # same thread without possible buffer overflows. So, use this thread to
             # read from and immediately report progress from stdout. In another
-            # thread, read all stderr and report that after the build finishes.
+            # thread, read and report stderr, then return all of it after the
+            # build finishes.
             q = Queue()
             self._ac.start(None, self._stderr_read, popen.stderr, q)
             self._popen_read(popen.stdout)
             # Wait until stderr has completed (stdout is already done).
             stderr_out = q.get()
+            popen.wait()
+            with self._lock:
+                if self._popen is popen:
+                    self._popen = None
+                if popen.cancelled:
+                    return None
         except OSError as ex:
-            return (
+            stderr_out = (
                 'Failed to execute HTML builder:\n'
                 '{}\n'.format(str(ex)) +
                 'Go to Settings -> Settings -> Sphinx to set HTML'
-                ' builder configurations.')
+                ' builder configurations.\n')
+            self._log.write(stderr_out, isError=True)
 
         return stderr_out
 
@@ -331,10 +468,10 @@ class SphinxConverter(QObject):
     # so that the user sees output as the build progresses, rather than only
     # producing output after the build is complete.
     def _popen_read(self, stdout):
-        # Read a line of stdout then report it to the user immediately.
+        # Read a line of stdout then pass it to the log, which shows it soon.
         s = stdout.readline()
         while s:
-            self.logWindowText.emit(s.rstrip('\n'))
+            self._log.write(s if s.endswith('\n') else s + '\n')
             s = stdout.readline()
         self._SphinxInvocationCount += 1
         # I would expect the following code to do the same thing. It doesn't:
@@ -345,12 +482,19 @@ class SphinxConverter(QObject):
         #    :linenos:
         #
         #    for s in stdout:
-        #        self.logWindowText.emit(s)
+        #        self._log.write(s)
 
-    # Runs in a separate thread to read stdout. It then exits the QEventLoop as
-    # a way to signal that stderr reads have completed.
+    # Runs in a separate thread to read stderr. Each line is counted and shown
+    # as it arrives. Putting all of stderr in ``q`` signals that stderr reads
+    # have completed.
     def _stderr_read(self, stderr, q):
-        q.put(stderr.read())
+        lines = []
+        s = stderr.readline()
+        while s:
+            lines.append(s)
+            self._log.write(s if s.endswith('\n') else s + '\n', isError=True)
+            s = stderr.readline()
+        q.put(''.join(lines))
 #
 # QWebEngineView tweak
 # ====================
@@ -423,6 +567,9 @@ class PreviewDock(DockWidget):
     """
     # Emitted when this window is closed.
     closed = pyqtSignal()
+    # Emitted with the path when saving the preview as HTML finished, whether
+    # it succeeded or not.
+    previewSaved = pyqtSignal(str)
 
     def __init__(self):
         DockWidget.__init__(self, core.mainWindow(), "Previe&w", QIcon(':/enkiicons/internet.png'), "Alt+W")
@@ -467,20 +614,48 @@ class PreviewDock(DockWidget):
         # Keep track of which Sphinx template copies we've already asked the user about.
         self._sphinxTemplateCheckIgnoreList = []
 
-        self._sphinxConverter = SphinxConverter(self)  # stopped
+        # Messages of the conversions, waiting to be shown in the log window.
+        self._logBuffer = LogBuffer(self)
+        self._logBuffer.pending.connect(self._onLogPending)
+        self._logFlushTimer = QTimer(self)
+        self._logFlushTimer.setSingleShot(True)
+        self._logFlushTimer.setInterval(_LOG_FLUSH_INTERVAL_MS)
+        self._logFlushTimer.timeout.connect(self._flushLog)
+        # The problems listed by ``cbProblems`` and the document whose
+        # conversion reported them.
+        self._problems = []
+        self._problemsFilePath = None
+
+        self._sphinxConverter = SphinxConverter(self, self._logBuffer)  # stopped
         self._runLatest = RunLatest('QThread', parent=self)
+        self._converterPool = ConverterPool()
+        # Writes the preview to a file for "Save as HTML".
+        self._saveController = AsyncController('QThread', self)
+        # Results of ``getHtml``, so that switching back to a document shows it
+        # without converting it again.
+        self._renderCache = RenderCache(_RENDER_CACHE_BUDGET)
 
         self._visiblePath = None
+        # The URL relative links in the preview refer to, or None.
+        self._visibleBaseUrl = None
 
         # If we update Preview on every key press, freezes are noticable (the
         # GUI thread draws the preview too slowly).
-        # This timer is used for drawing Preview 800 ms After user has stopped typing text
-        self._typingTimer = QTimer()
-        self._typingTimer.setInterval(800)
-        self._typingTimer.timeout.connect(self._scheduleDocumentProcessing)
+        # The Preview is drawn after user has stopped typing text. The pause
+        # grows with the time the conversion takes.
+        self._typingDebouncer = AdaptiveDebouncer('Preview', initialDelay=800, parent=self)
+        self._typingDebouncer.timeout.connect(self._scheduleDocumentProcessing)
 
         self.previewSync = PreviewSync(self)
 
+        # Updates the shown page instead of reloading it. Uses the web channel
+        # of the sync, if there is one.
+        self._domPatcher = DomPatcher(self._widget.webEngineView.page(),
+                                      getattr(self.previewSync, 'channel', None),
+                                      self._afterLoaded.afterLoaded)
+        self._domPatcher.patched.connect(self.previewSync.onPageContentsChanged)
+        self._domPatcher.reloadNeeded.connect(self._scheduleDocumentProcessing)
+
         self._applyJavaScriptEnabled(self._isJavaScriptEnabled())
 
         # Clear flags used to temporarily disable signals during
@@ -498,11 +673,6 @@ class PreviewDock(DockWidget):
         # changes the current font to red! So, save it here so that it will be
         # restored correctly on a ``_clear_log``.
         self._defaultLogFont = self._widget.teLog.currentCharFormat()
-        # The logWindowClear signal clears the log window.
-        self._sphinxConverter.logWindowClear.connect(self._clear_log)
-        # The logWindowText signal simply appends text to the log window.
-        self._sphinxConverter.logWindowText.connect(lambda s:
-                                           self._widget.teLog.appendPlainText(s))
 
     def _createWidget(self):
         widget = QWidget(self)
@@ -532,6 +702,9 @@ class PreviewDock(DockWidget):
         self.setFocusProxy(widget.webEngineView)
 
         widget.tbSave.clicked.connect(self.onPreviewSave)
+        widget.teLog.setMaximumBlockCount(_LOG_MAX_LINES)
+        widget.cbProblems.setVisible(False)
+        widget.cbProblems.activated[int].connect(self._onProblemActivated)
         # Add an attribute to ``widget`` denoting the splitter location.
         # This value will be overwritten when the user changes splitter location.
         widget.splitterErrorStateSize = (199, 50)
@@ -554,10 +727,14 @@ class PreviewDock(DockWidget):
     def terminate(self):
         """Uninstall themselves
         """
-        self._typingTimer.stop()
+        self._typingDebouncer.stop()
+        self._logFlushTimer.stop()
+        self._domPatcher.terminate()
         self.previewSync.terminate()
         self._sphinxConverter.terminate()
+        self._converterPool.terminate()
         self._runLatest.terminate()
+        self._saveController.terminate()
         self._afterLoaded.terminate()
         sip.delete(self)
 
@@ -573,6 +750,65 @@ class PreviewDock(DockWidget):
         self._widget.teLog.clear()
         self._widget.teLog.setCurrentCharFormat(self._defaultLogFont)
 
+    def _onLogPending(self):
+        """Messages were written to the log buffer. Show them soon, together
+        with the messages written meanwhile.
+        """
+        if not self._logFlushTimer.isActive():
+            self._logFlushTimer.start()
+
+    def _flushLog(self):
+        """Show the messages waiting in the log buffer.
+        """
+        self._logFlushTimer.stop()
+        for kind, text in self._logBuffer.take():
+            if kind == CLEAR:
+                self._clear_log()
+            else:
+                # Each message ends with a newline, but appending starts a new
+                # line anyway.
+                if text.endswith('\n'):
+                    text = text[:-1]
+                if kind == ERROR:
+                    # Since the error string might contain characters such as
+                    # ">" and "<", they need to be converted to "&gt;" and
+                    # "&lt;" such that they can be displayed correctly in the
+                    # log window as HTML strings. This step is handled by
+                    # ``html.escape``.
+                    self._widget.teLog.appendHtml("<pre><font color='red'>\n" +
+                                                  html.escape(text) +
+                                                  '</font></pre>')
+                else:
+                    self._widget.teLog.appendPlainText(text)
+        self._updateProblems()
+
+    def _updateProblems(self):
+        """List the problems found so far in ``cbProblems``.
+        """
+        problems = self._logBuffer.summary()[2]
+        if problems == self._problems:
+            return
+        self._problems = problems
+        cbProblems = self._widget.cbProblems
+        cbProblems.clear()
+        for problem in problems:
+            cbProblems.addItem(problem.text)
+        cbProblems.setVisible(bool(problems))
+
+    def _onProblemActivated(self, index):
+        """A problem was chosen in ``cbProblems``. Go to its location.
+        """
+        problem = self._problems[index]
+        filePath = problem.filePath
+        if filePath == '<string>':
+            # docutils and CodeChat convert the text of the document.
+            filePath = self._problemsFilePath
+        elif filePath and not os.path.isabs(filePath):
+            # Sphinx runs in the project directory.
+            filePath = os.path.join(core.config()['Sphinx']['ProjectPath'], filePath)
+        if filePath and os.path.isfile(filePath):
+            core.workspace().goTo(filePath, line=problem.line)
+
     def eventFilter(self, obj, ev):
         """Event filter for the web view
         Zooms the web view
@@ -645,7 +881,7 @@ class PreviewDock(DockWidget):
     def _onDocumentChanged(self, old, new):
         """Current document changed, update preview
         """
-        self._typingTimer.stop()
+        self._typingDebouncer.stop()
         if new is not None:
             if new.qutepart.language() == 'Markdown':
                 self._widget.cbTemplate.show()
@@ -720,8 +956,7 @@ class PreviewDock(DockWidget):
         """Text changed, update preview
         """
         if self.isVisible() and not self._ignoreTextChanges:
-            self._typingTimer.stop()
-            self._typingTimer.start()
+            self._typingDebouncer.restart()
 
     def show(self):
         """When shown, update document, if possible.
@@ -764,22 +999,38 @@ class PreviewDock(DockWidget):
             self._previewSave(path)
 
     def _previewSave(self, path):
-        qe = QEventLoop()
+        """Save the HTML of the preview, with copies of the local files it
+        refers to, to ``path``. The HTML is fetched and written in the
+        background; ``previewSaved`` is emitted when done.
+        """
+        # Relative URLs in the page refer to the directory of the previewed
+        # file or of the Sphinx output.
+        baseUrl = self._visibleBaseUrl
+        baseDir = os.path.dirname(baseUrl.toLocalFile()) if baseUrl is not None and baseUrl.isLocalFile() else None
 
-        def callback(text):
-            try:
-                with open(path, 'w', encoding='utf-8') as openedFile:
-                    openedFile.write(text)
-            except (OSError, IOError) as ex:
-                QMessageBox.critical(self, "Failed to save HTML", str(ex))
-            qe.quit()
+        def onHtml(html):
+            self._saveController.start(functools.partial(self._onPreviewSaved, path),
+                                       exportHtml, html, baseDir, path)
 
+        core.mainWindow().appendMessage('Saving the preview to {}...'.format(path), 2000)
         # The preview selection is an extra ``div`` inserted by the sync code.
         # Remove it before saving the file.
         self.previewSync.clearHighlight()
-        self._afterLoaded.afterLoaded(self._widget.webEngineView.page().toHtml, callback)
-        # Wait for the callback to complete.
-        qe.exec_()
+        self._afterLoaded.afterLoaded(self._widget.webEngineView.page().toHtml, onHtml)
+
+    def _onPreviewSaved(self, path, future):
+        """Report the result of ``exportHtml``.
+        """
+        try:
+            copiedCount = future.result
+        except OSError as ex:
+            core.mainWindow().appendMessage('Failed to save HTML to {}: {}'.format(path, ex))
+        else:
+            message = 'Saved the preview to {}'.format(path)
+            if copiedCount:
+                message += ' with {} linked file(s)'.format(copiedCount)
+            core.mainWindow().appendMessage(message, 3000)
+        self.previewSaved.emit(path)
 
     # HTML generation
     #----------------
@@ -794,7 +1045,7 @@ class PreviewDock(DockWidget):
         if self.isHidden():
             return
 
-        self._typingTimer.stop()
+        self._typingDebouncer.stop()
 
         document = core.workspace().currentDocument()
         if document is not None:
@@ -806,9 +1057,10 @@ class PreviewDock(DockWidget):
             sphinxCanProcess = sphinxEnabledForFile(document.filePath())
             # Determine if we're in the middle of a build.
             currentlyBuilding = self._widget.prgStatus.text() == 'Building...'
+            template = ''
 
             if language == 'Markdown':
-                text = self._getCurrentTemplate() + text
+                template = self._getCurrentTemplate()
                 # Hide the progress bar, since processing is usually short and
                 # Markdown produces no errors or warnings to display in the
                 # progress bar. See https://github.com/bjones1/enki/issues/36.
@@ -870,9 +1122,12 @@ class PreviewDock(DockWidget):
             saveThenBuild = (sphinxCanProcess and internallyModified and
                              not externallyModified and not buildOnSave)
             # If Sphinx is currently building, don't autosave -- this can
-            # cause Sphinx to miss changes on its next build. Instead, wait
-            # until Sphinx completes, then do a save and build.
-            if saveThenBuild and currentlyBuilding:
+            # cause Sphinx to miss changes on its next build. Instead, stop
+            # the build, then save and build. If it can't be stopped, wait
+            # until Sphinx completes, then do a save and build. Builds of the
+            # persistent process aren't stopped, since that would unload the
+            # environment which makes them fast.
+            if saveThenBuild and currentlyBuilding and not self._sphinxConverter.cancel():
                 self._rebuildNeeded = True
                 saveThenBuild = False
             else:
@@ -905,26 +1160,50 @@ class PreviewDock(DockWidget):
             if ((not sphinxCanProcess) or
                     (sphinxCanProcess and not internallyModified) or
                     saveThenBuild):
-                # Build the HTML in a separate thread.
-                self._runLatest.start(self._setHtmlFuture, self.getHtml,
-                                language, text, document.filePath())
+                # A conversion still running is out of date; stop it.
+                self._converterPool.cancel()
+                if sphinxCanProcess:
+                    self._sphinxConverter.cancel()
+                cacheKey = self._renderCacheKey(language, text, document.filePath(), template)
+                cached = self._renderCache.get(cacheKey) if cacheKey else None
+                if cached is not None:
+                    self._runLatest.future.cancel(True)
+                    self._typingDebouncer.jobCancelled()
+                    self._setHtml(*cached)
+                else:
+                    # Build the HTML in a separate thread.
+                    job = self._typingDebouncer.jobStarted()
+                    self._runLatest.start(functools.partial(self._setHtmlFuture, cacheKey=cacheKey, job=job),
+                                          self.getHtml, language, text, document.filePath(), template)
             # Warn.
             if (sphinxCanProcess and internallyModified and
                     externallyModified and not buildOnSave):
                 core.mainWindow().appendMessage('Warning: file modified externally. Auto-save disabled.')
 
-    def getHtml(self, language, text, filePath):
+    def _renderCacheKey(self, language, text, filePath, template):
+        """Return the key of the render cache for a document, or None if its
+        HTML must not be cached. Sphinx output depends on other files, so it
+        isn't cached.
+        """
+        converter = _converterName(language, filePath)
+        if converter not in ('Markdown', 'docutils', 'CodeChat'):
+            return None
+        return converter, filePath, template, textHash(text)
+
+    def getHtml(self, language, text, filePath, template=''):
         """Get HTML for document. This is run in a separate thread.
         """
-        if language == 'Markdown':
-            return filePath, _convertMarkdown(text), None, QUrl()
-        # For ReST, use docutils only if Sphinx isn't available.
-        elif language == 'reStructuredText' and not sphinxEnabledForFile(filePath):
-            htmlUnicode, errString = _convertReST(text)
+        converter = _converterName(language, filePath)
+        if converter in ('Markdown', 'docutils'):
+            try:
+                htmlUnicode, errString = self._converterPool.convert(language, text, template)
+            except ConversionCancelled:
+                # A newer conversion replaces this one.
+                return None
             return filePath, htmlUnicode, errString, QUrl()
-        elif filePath and sphinxEnabledForFile(filePath):  # Use Sphinx to generate the HTML if possible.
+        elif converter == 'Sphinx':
             return self._sphinxConverter.convert(filePath)
-        elif filePath and canUseCodeChat(filePath):  # Otherwise, fall back to using CodeChat+docutils.
+        elif converter == 'CodeChat':
             return _convertCodeChat(text, filePath)
         else:
             return filePath, 'No preview for this type of file', None, QUrl()
@@ -992,14 +1271,23 @@ class PreviewDock(DockWidget):
 
         return errors
 
-    def _setHtmlFuture(self, future):
-        """Receives a future and unpacks the result, calling _setHtml."""
+    def _setHtmlFuture(self, future, cacheKey=None, job=None):
+        """Receives a future and unpacks the result, calling _setHtml.
+        Caches the result under ``cacheKey``, if given.
+        ``job`` is the id of the job given by the typing debouncer.
+        """
+        self._typingDebouncer.jobFinished(job)
+        if future.result is None:  # cancelled
+            return
         filePath, htmlText, errString, baseUrl = future.result
+        if cacheKey is not None:
+            # Markdown keeps each block in addition to the whole page.
+            size = len(htmlText) * (2 if isinstance(htmlText, RenderedMarkdown) else 1) + len(errString or '')
+            self._renderCache.put(cacheKey, future.result, size)
         self._setHtml(filePath, htmlText, errString, baseUrl)
 
-    def _setHtml(self, filePath, htmlText, errString, baseUrl):
-        """Set HTML to the view and restore scroll bars position.
-        Called by the thread.
+    def _loadHtml(self, filePath, htmlText, baseUrl):
+        """Load the HTML or the URL into the view and restore scroll bars position.
         """
         self._saveScrollPos()
         self._visiblePath = filePath
@@ -1010,9 +1298,8 @@ class PreviewDock(DockWidget):
         # the QWebEngineView steals the focus on a call to ``setHtml``. Disable
         # it to prevent this. Another approach:  disable `QWebEngineSettings::FocusOnNavigationEnabled <http://doc.qt.io/qt-5/qwebenginesettings.html#WebAttribute-enum>`_, which is enabled by default. However, since this was added in Qt 5.8 (PyQt 5.8 was `released in 15-Feb-2017 <https://www.riverbankcomputing.com/news>`_, it's too early to rely on it. TODO: use this after PyQt 5.9 is released?
         self._widget.webEngineView.setEnabled(False)
+        self._visibleBaseUrl = QUrl.fromLocalFile(filePath) if baseUrl.isEmpty() else baseUrl
         if baseUrl.isEmpty():
-            # Clear the log, then update it with build content.
-            self._widget.teLog.clear()
             self._widget.webEngineView.setHtml(htmlText,
                                          baseUrl=QUrl.fromLocalFile(filePath))
         else:
@@ -1021,92 +1308,36 @@ class PreviewDock(DockWidget):
         # Re-enable it after updating the HTML.
         self._widget.webEngineView.setEnabled(True)
 
-        # If there were messages from the conversion process, extract a count of
-        # errors and warnings from these messages.
-        if errString:
+    def _setHtml(self, filePath, htmlText, errString, baseUrl):
+        """Set HTML to the view and restore scroll bars position.
+        Called by the thread.
+        """
+        # The page keeps its scroll position if it's patched.
+        if not self._domPatcher.update(filePath, htmlText, baseUrl):
+            self._loadHtml(filePath, htmlText, baseUrl)
+
+        # Sphinx writes its messages to the log while building. The messages of
+        # other conversions replace the log.
+        if not isinstance(errString, LoggedText):
+            self._logBuffer.clear()
+            if errString:
+                self._logBuffer.write(errString if errString.endswith('\n') else errString + '\n',
+                                      isError=True)
+        self._problemsFilePath = filePath
+        self._flushLog()
+        errNum, warningNum, _, hasErrorText = self._logBuffer.summary()
+
+        # If there were messages from the conversion process, show the count of
+        # errors and warnings the log buffer found in these messages.
+        if hasErrorText:
             # If there are errors/warnings, expand log window to make it visible
             if self._widget.splitterNormState:
                 self._widget.splitterNormStateSize = self._widget.splitter.sizes()
                 self._widget.splitterNormState = False
             self._widget.splitter.setSizes(self._widget.splitterErrorStateSize)
 
-            # This code parses the error string to determine get the number of
-            # warnings and errors. Common docutils error messages read::
-            #
-            #  <string>:1589: (ERROR/3) Unknown interpreted text role "ref".
-            #
-            #  X:\ode.py:docstring of sympy:5: (ERROR/3) Unexpected indentation.
-            #
-            # and common sphinx errors read::
-            #
-            #  X:\SVM_train.m.rst:2: SEVERE: Title overline & underline mismatch.
-            #
-            #  X:\indexs.rst:None: WARNING: image file not readable: a.jpg
-            #
-            #  X:\conf.py.rst:: WARNING: document isn't included in any toctree
-            #
-            #  In Sphinx 1.6.1:
-            #  X:\file.rst: WARNING: document isn't included in any toctree
-            #
-            # Each error/warning occupies one line. The following `regular
-            # expression
-            # <https://docs.python.org/2/library/re.html#regular-expression-syntax>`_
-            # is designed to find the error position (1589/None) and message
-            # type (ERROR/WARNING/SEVERE). Extra spaces are added to show which
-            # parts of the example string it matches. For more details about
-            # Python regular expressions, refer to the
-            # `re docs <https://docs.python.org/2/library/re.html>`_.
-            #
-            # Examining this expression one element at a time::
-            #
-            #   <string>:1589:        (ERROR/3)Unknown interpreted text role "ref".
-            errPosRe = ':(\d*|None|):? '
-            # Find the first occurence of a pair of colons, or just a single colon.
-            # Between them there can be numbers or "None" or nothing. For example,
-            # this expression matches the string ":1589:" or string ":None:" or
-            # string "::" or the string ":". Next::
-            #
-            #   <string>:1589:        (ERROR/3)Unknown interpreted text role "ref".
-            errTypeRe = '\(?(WARNING|ERROR|SEVERE)'
-            # Next match the error type, which can
-            # only be "WARNING", "ERROR" or "SEVERE". Before this error type the
-            # message may optionally contain one left parenthesis.
-            #
-            errEolRe = '.*$'
-            # Since one error message occupies one line, a ``*``
-            # quantifier is used along with end-of-line ``$`` to make sure only
-            # the first match is used in each line.
-            #
-            # TODO: Is this necesary? Is there any case where omitting this
-            # causes a failure?
-            regex = re.compile(errPosRe + errTypeRe + errEolRe,
-                               # The message usually contain multiple lines; search each line
-                               # for errors and warnings.
-                               re.MULTILINE)
-            # Use findall to return all matches in the message, not just the
-            # first.
-            result = regex.findall(errString)
-
-            # The variable ``result`` now contains a list of tuples, where each
-            # tuples contains the two matched groups (line number, error_string).
-            # For example::
-            #
-            #  [('1589', 'ERROR')]
-            #
-            # Therefeore, the second element of each tuple, represented as x[1],
-            # is the error_string. The next two lines of code will collect all
-            # ERRORs/SEVEREs and WARNINGs found in the error_string separately.
-            errNum = sum([x[1] == 'ERROR' or x[1] == 'SEVERE' for x in result])
-            warningNum = [x[1] for x in result].count('WARNING')
             # Report these results this to the user.
             status = 'Error(s): {}, warning(s): {}'.format(errNum, warningNum)
-            # Since the error string might contain characters such as ">" and "<",
-            # they need to be converted to "&gt;" and "&lt;" such that
-            # they can be displayed correctly in the log window as HTML strings.
-            # This step is handled by ``html.escape``.
-            self._widget.teLog.appendHtml("<pre><font color='red'>\n" +
-                                          html.escape(errString) +
-                                          '</font></pre>')
             # Update the progress bar.
             color = 'red' if errNum else '#FF9955' if warningNum else None
             self._setHtmlProgress(status, color)
@@ -28,12 +28,11 @@ import sip
 from enki.core.core import core
 from enki.lib.future import RunLatest
 
-# If regex isn't installed or is too old, this import will fail. In this case,
-# disable the sync feature.
+# If this import fails, disable the sync feature.
 try:
-    from .approx_match import findApproxTextInTarget
+    from .approx_match import PositionMap
 except ImportError as e:
-    findApproxTextInTarget = None
+    PositionMap = None
 #
 # CallbackManager
 # ===============
@@ -163,7 +162,7 @@ class PreviewSync(QObject):
 
         QObject.__init__(self)
         # Only set up sync if fuzzy matching is available.
-        if not findApproxTextInTarget:
+        if not PositionMap:
             return
 
         # Gather into one variable all the JavaScript needed for PreviewSync.
@@ -178,8 +177,11 @@ class PreviewSync(QObject):
     def terminate(self):
         # Uninstall the text-to-web sync only if it was installed in the first
         # place (it depends on TRE).
-        if findApproxTextInTarget:
+        if PositionMap:
             self._cursorMovementTimer.stop()
+            page = self._dock._widget.webEngineView.page()
+            page.loadStarted.disconnect(self._onLoadStarted)
+            page.loadFinished.disconnect(self._onLoadFinished)
             # Shut down the background sync. If a sync was already in progress,
             # then discard its output.
             self._runLatest.future.cancel(True)
@@ -334,12 +336,26 @@ class PreviewSync(QObject):
             '}'
         '}'
 
-        # Given text to find, place a highlight on the last line containing the
-        # text.
+        # The plain text of the page, saved by ``fetchPagePlainText``. Indices
+        # passed to ``highlightFind`` refer to this text.
+        'var pagePlainText = "";'
+
+        # Save then return the plain text of the page. Python calls this once
+        # per page load or patch and aligns the document's text with the
+        # result.
+        'function fetchPagePlainText() {'
+            'pagePlainText = document.body ? document.body.innerText : "";'
+            'return pagePlainText;'
+        '}'
+
+        # Given an index into ``pagePlainText``, place a highlight on the last
+        # line containing the text before it.
         'function highlightFind('
-          # The text to find, typically consisting of all text in the web page
-          # from its beginning to the point to be found.
-          'txt) {'
+          # The index of the point to be found.
+          'index) {'
+            # The text to find: all text in the web page from its beginning to
+            # the point to be found.
+            'var txt = pagePlainText.substr(0, index);'
 
             # Clear the current selection, so that a find will start at the
             # beginning of the page.
@@ -490,16 +506,18 @@ class PreviewSync(QObject):
     ##========================================================
     # A single click in the preview pane should move the text pane's cursor to the
     # corresponding location. Likewise, movement of the text pane's cursor should
-    # select the corresponding text in the preview pane. To do so, an approximate
-    # search for text surrounding the current cursor or click location perfomed on
-    # text in the other pane provides the corresponding location in the other pane
-    # to highlight.
+    # select the corresponding text in the preview pane. To do so, the text of
+    # the document is aligned with the plain text rendering of the preview pane
+    # once per render, producing a PositionMap. Looking up the current cursor or
+    # click location in this map provides the corresponding location in the
+    # other pane to highlight. The map is rebuilt only when the text or the
+    # rendering changes.
     #
-    # Bugs / to-do items
-    ##------------------
-    # #. I call ``toPlainText()`` several times. In the past, this was quite slow
-    #    in a ``QTextEdit``. Check performance and possibly cache this value; it
-    #    should be easy to update by adding a few lines to _setHtml().
+    # Fetching the plain text of the preview requires a round trip to the web
+    # engine process. So, it's fetched once when a page finishes loading or is
+    # patched, then reused by all syncs until the page changes again. The
+    # JavaScript side keeps the same text, so a sync sends it only an index
+    # into that text, instead of the text preceding the cursor.
     #
     # Preview-to-text sync
     ##--------------------
@@ -618,17 +636,29 @@ class PreviewSync(QObject):
         # _`Bug 2`: Since ``qt`` may not be defined (Qt 5.7.0 doesn't provide the
         # ``qt`` object to JavaScript when loading per https://bugreports.qt.io/browse/QTBUG-53411),
         # wrap it in a try/except block.
-        'function init_qwebchannel() {'
-            # Switch event listeners, part 1/2 -- now that this init is done, don't call it again.
-            'window.removeEventListener("click", init_qwebchannel);'
+        #
+        # Other scripts in this world (see dom_patch.py) also use the channel,
+        # so ``withWebChannel`` creates it once, then passes it to all callers.
+        'var webChannel = null;'
+        'var webChannelWaiting = null;'
+        'function withWebChannel(func) {'
+            'if (webChannel) {'
+                'func(webChannel);'
+                'return;'
+            '}'
+            'if (webChannelWaiting) {'
+                'webChannelWaiting.push(func);'
+                'return;'
+            '}'
+            'webChannelWaiting = [func];'
             'try {'
                 'new QWebChannel(qt.webChannelTransport, function(channel) {'
+                    'webChannel = channel;'
                     # Save a reference to the previewSync object.
                     'window.previewSync = channel.objects.previewSync;'
-                    # Switch event listeners, part 2/2 -- Invoke the usual onclick handler. This will only be run if the QWebChannel init succeeds.
-                    'window.addEventListener("click", window_onclick);'
-                    # Now that the QWebChannel is ready, use it to handle the click.
-                    'window_onclick();'
+                    'var waiting = webChannelWaiting;'
+                    'webChannelWaiting = null;'
+                    'waiting.forEach(function(f) { f(channel); });'
                 '});'
             '} catch (err) {'
                 # Re-throw unrecognized errors. When ``qt`` isn't defined,
@@ -637,12 +667,24 @@ class PreviewSync(QObject):
                 'throw err;' #if (!(err instanceof ReferenceError)) throw err;'
             '}'
         '}'
+        'function init_qwebchannel() {'
+            # Switch event listeners, part 1/2 -- now that this init is done, don't call it again.
+            'window.removeEventListener("click", init_qwebchannel);'
+            'withWebChannel(function(channel) {'
+                # Switch event listeners, part 2/2 -- Invoke the usual onclick handler. This will only be run if the QWebChannel init succeeds.
+                'window.addEventListener("click", window_onclick);'
+                # Now that the QWebChannel is ready, use it to handle the click.
+                'window_onclick();'
+            '});'
+        '}'
         # Set up the sync system after a click. This works around `bug 1`_. See https://developer.mozilla.org/en-US/docs/Web/API/EventTarget/addEventListener.
         'window.addEventListener("click", init_qwebchannel);'
     )
 
     def _initPreviewToTextSync(self):
         """Initialize the system per items 1, 2, and 4 above."""
+        # The map between the text and the ``textContent`` of the preview.
+        self._previewToTextMap = None
         # When a web page finishes loading, reinsert our JavaScript.
         page = self._dock._widget.webEngineView.page()
 
@@ -680,9 +722,29 @@ class PreviewSync(QObject):
         self._onWebviewClick_(tc, webIndex)
         # Get the qutepart text.
         qp = core.workspace().currentDocument().qutepart
-        # Perform an approximate match between the clicked webpage text and the
-        # qutepart text.
-        textIndex = findApproxTextInTarget(tc, webIndex, qp.text)
+        qp_text = qp.text
+        # Align the clicked webpage text with the qutepart text, unless this was
+        # already done for the current text and rendering. The page's
+        # ``textContent`` differs from its plain text, so this map is separate
+        # from the text-to-preview map. Like that map, it's built in a separate
+        # thread.
+        if self._previewToTextMap and self._previewToTextMap.matches(qp_text, tc):
+            self._moveTextPaneToWebIndex(webIndex)
+        else:
+            self._runLatest.start(self._haveClickMap,
+                # Build the map, returning it and the index clicked.
+                lambda: (PositionMap(qp_text, tc), webIndex))
+
+    def _haveClickMap(self, future):
+        self._previewToTextMap, webIndex = future.result
+        # If the text was edited after the click, its indices no longer refer
+        # to the text the map was built for. Ignore the click.
+        qp = core.workspace().currentDocument().qutepart
+        if self._previewToTextMap.sourceText == qp.text:
+            self._moveTextPaneToWebIndex(webIndex)
+
+    def _moveTextPaneToWebIndex(self, webIndex):
+        textIndex = self._previewToTextMap.targetToSource(webIndex)
         # Move the cursor to textIndex in qutepart, assuming corresponding text
         # was found.
         if textIndex >= 0:
@@ -720,15 +782,16 @@ class PreviewSync(QObject):
     ##--------------------
     # The opposite direction is easier, since all the work can be done in Python.
     # When the cursor moves in the text pane, find its matching location in the
-    # preview pane using an approximate match. Select several characters before and
+    # preview pane using a PositionMap. Select several characters before and
     # after the matching point to make the location more visible, since the preview
     # pane lacks a cursor. Specifically:
     #
     # #. initTextToPreviewSync sets up a timer and connects the _onCursorPositionChanged method.
     # #. _onCursorPositionChanged is called each time the cursor moves. It starts or
     #    resets a short timer. The timer's expiration calls syncTextToWeb.
-    # #. syncTextToWeb performs the approximate match, then calls moveWebPaneToIndex
-    #    to sync the web pane with the text pane.
+    # #. syncTextToWeb looks up the cursor position in the map, building the map
+    #    in a separate thread if the text or the rendering changed, then calls
+    #    moveWebPaneToIndex to sync the web pane with the text pane.
     # #. moveWebToPane uses QWebFrame.find to search for the text under the anchor
     #    then select (or highlight) it.
 
@@ -745,8 +808,20 @@ class PreviewSync(QObject):
         # disabling this sync. Otherwise, that sync would trigger this sync,
         # which is unnecessary.
         self._previewToTextSyncRunning = False
-        # Run the approximate match in a separate thread. Cancel it if the
-        # document changes.
+        # The map between the text and the ``toPlainText()`` of the preview.
+        self._textToPreviewMap = None
+        # The plain text of the preview, or None if it isn't known yet.
+        self._pagePlainText = None
+        # The CallbackFuture of a pending ``fetchPagePlainText()`` request, or
+        # None.
+        self._pagePlainTextFuture = None
+        # True to sync when the pending ``fetchPagePlainText()`` request
+        # completes.
+        self._syncAfterPlainText = False
+        page = self._dock._widget.webEngineView.page()
+        page.loadStarted.connect(self._onLoadStarted)
+        page.loadFinished.connect(self._onLoadFinished)
+        # Build the map in a separate thread. Cancel it if the document changes.
         self._runLatest = RunLatest('QThread', self)
         self._runLatest.ac.defaultPriority = QThread.LowPriority
         core.workspace().currentDocumentChanged.connect(self._onDocumentChanged)
@@ -755,6 +830,12 @@ class PreviewSync(QObject):
         self._runLatest.future.cancel(True)
         self._callbackManager.skipAllCallbacks()
         self._cursorMovementTimer.stop()
+        self._textToPreviewMap = None
+        self._previewToTextMap = None
+        # Skipping all callbacks above discarded the ``fetchPagePlainText()`` request
+        # and the sync waiting for it.
+        self._pagePlainTextFuture = None
+        self._syncAfterPlainText = False
 
     def _onCursorPositionChanged(self):
         """Called when the cursor position in the text pane changes. It (re)schedules
@@ -775,59 +856,88 @@ class PreviewSync(QObject):
         switching windows, for example).
         """
         # Only run this if we TRE is installed.
-        if not findApproxTextInTarget:
+        if not PositionMap:
             return
         # Stop the timer; the next cursor movement will restart it.
         self._cursorMovementTimer.stop()
-        # Get a plain text rendering of the web view. Continue execution in a callback.
-        qp = core.workspace().currentDocument().qutepart
-        qp_text = qp.text
-        self._dock._widget.webEngineView.page().toPlainText(
-            self._callbackManager.callback(self._havePlainText))
-
-    # Perform an approximate match in a separate thread, then update
-    # the cursor based on the match results.
+        # Get a plain text rendering of the web view. If it's not available,
+        # continue execution when it arrives.
+        if self._pagePlainText is None:
+            self._syncAfterPlainText = True
+            self._requestPagePlainText()
+        else:
+            self._havePlainText(self._pagePlainText)
+
+    # The contents of the page changed without reloading it. Fetch its new plain
+    # text, then sync.
+    def onPageContentsChanged(self):
+        if PositionMap:
+            self._onLoadStarted()
+            self.syncTextToPreview()
+
+    # The page is changing; discard its plain text.
+    def _onLoadStarted(self):
+        self._pagePlainText = None
+        if self._pagePlainTextFuture:
+            self._pagePlainTextFuture.skipCallback()
+            self._pagePlainTextFuture = None
+
+    # Fetch the plain text of the new page once, for use by all later syncs.
+    def _onLoadFinished(self, ok):
+        self._requestPagePlainText()
+
+    def _requestPagePlainText(self):
+        if self._pagePlainTextFuture is None:
+            self._pagePlainTextFuture = CallbackFuture(self._callbackManager,
+                                                       self._onPagePlainText)
+            self._dock._widget.webEngineView.page().runJavaScript(
+                'fetchPagePlainText();', QWebEngineScript.ApplicationWorld,
+                self._pagePlainTextFuture.callback())
+
+    def _onPagePlainText(self, html_text):
+        self._pagePlainTextFuture = None
+        self._pagePlainText = html_text
+        if self._syncAfterPlainText:
+            self._syncAfterPlainText = False
+            self._havePlainText(html_text)
+
+    # Look up the cursor position in the map, then update the preview based on
+    # the result. If the text or the rendering changed, build a new map in a
+    # separate thread first.
     def _havePlainText(self, html_text):
-        # Performance notes: findApproxTextInTarget is REALLY slow. Scrolling
-        # through preview.py with profiling enabled produced::
-        #
-        #  Output from Enki:
-        #         41130 function calls in 3.642 seconds
-        #
-        #   Ordered by: standard name
-        #
-        #   ncalls  tottime  percall  cumtime  percall filename:lineno(function)
-        #       13    0.000    0.000    0.000    0.000 __init__.py:406(text)
-        #       13    0.000    0.000    3.398    0.261 approx_match.py:138(findApproxText)
-        #       13    0.000    0.000    3.432    0.264 approx_match.py:175(findApproxTextInTarget)
-        #       13    0.029    0.002    0.034    0.003 approx_match.py:252(refineSearchResult)
-        #       26    0.000    0.000    0.000    0.000 core.py:177(workspace)
-        #       ...snip lots more 0.000 or very small times...
-        #
-        # Therefore, finding ways to make this faster or run it in another
-        # thread should significantly improve the GUI's responsiveness.
+        # Performance notes: findApproxTextInTarget, which used to run for each
+        # cursor movement, was REALLY slow, taking about 0.26 s per call when
+        # scrolling through preview.py. Building the map takes about half of
+        # that, but only once per render; each lookup is a binary search.
         qp = core.workspace().currentDocument().qutepart
         qp_text = qp.text
         qp_position = qp.textCursor().position()
-        self._runLatest.start(self._movePreviewPaneToIndex,
-            # Call findApproxTextInTarget, returning the index and the HTML text searched.
-            lambda: (findApproxTextInTarget(qp_text, qp_position, html_text), html_text))
+        if self._textToPreviewMap and self._textToPreviewMap.matches(qp_text, html_text):
+            self._movePreviewPaneToIndex(self._textToPreviewMap.sourceToTarget(qp_position))
+        else:
+            self._runLatest.start(self._havePositionMap,
+                # Build the map, returning it and the cursor position to look up.
+                lambda: (PositionMap(qp_text, html_text), qp_position))
+
+    def _havePositionMap(self, future):
+        self._textToPreviewMap, qp_position = future.result
+        # The page changed while the map was built, so its indices don't refer
+        # to the text the JavaScript side has now. The change started another
+        # sync.
+        if self._textToPreviewMap.targetText != self._pagePlainText:
+            return
+        self._movePreviewPaneToIndex(self._textToPreviewMap.sourceToTarget(qp_position))
 
-    def _movePreviewPaneToIndex(self, future):
+    def _movePreviewPaneToIndex(self, webIndex):
         """Highlights webIndex in the preview pane, per item 4 above.
 
         Params:
 
         - webIndex - The index to move the cursor / highlight to in the preview
           pane.
-        - txt - The text of the webpage, returned by mainFrame.toPlainText().
         """
-        # Retrieve the return value from findApproxTextInTarget.
-        webIndex, txt = future.result
-
         view = self._dock._widget.webEngineView
         page = view.page()
-        ft = txt[:webIndex]
 
         def callback(found):
             if found:
@@ -836,7 +946,7 @@ class PreviewSync(QObject):
                 self.textToPreviewSynced.emit()
 
         if webIndex >= 0:
-            self._dock._afterLoaded.afterLoaded(lambda: page.runJavaScript('highlightFind({});'.format(repr(ft)), QWebEngineScript.ApplicationWorld, self._callbackManager.callback(callback)))
+            self._dock._afterLoaded.afterLoaded(lambda: page.runJavaScript('highlightFind({});'.format(webIndex), QWebEngineScript.ApplicationWorld, self._callbackManager.callback(callback)))
         else:
             self.clearHighlight()
 
@@ -0,0 +1,74 @@
+# .. -*- coding: utf-8 -*-
+#
+# ****************************************************
+# render_cache.py - Remember recently rendered pages
+# ****************************************************
+# Switching to a document which was previewed before would convert it again,
+# although neither its text nor the conversion settings changed. This cache
+# keeps the most recently used conversion results, so they can be shown at
+# once.
+#
+# Imports
+# =======
+# Library imports
+# ---------------
+import collections
+import hashlib
+#
+# RenderCache
+# ===========
+
+
+def textHash(text):
+    """Return a short digest of ``text``, used in cache keys instead of the
+    text itself.
+    """
+    return hashlib.sha1(text.encode('utf-8', 'surrogatepass')).digest()
+
+
+class RenderCache:
+    """A least recently used cache, limited by the total size of its values
+    rather than by their number.
+    """
+    def __init__(self,
+      # The maximum total size of the cached values.
+      budget):
+
+        self._budget = budget
+        self._size = 0
+        # {key: (value, size)}, the most recently used last.
+        self._entries = collections.OrderedDict()
+
+    def get(self, key):
+        """Return the value cached for ``key``, or None.
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        self._entries.move_to_end(key)
+        return entry[0]
+
+    def put(self, key, value, size):
+        """Cache ``value``, which takes ``size`` units of the budget. Values
+        larger than the budget aren't cached.
+        """
+        self.remove(key)
+        if size > self._budget:
+            return
+        self._entries[key] = (value, size)
+        self._size += size
+        while self._size > self._budget:
+            oldKey, (oldValue, oldSize) = self._entries.popitem(last=False)
+            self._size -= oldSize
+
+    def remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._size -= entry[1]
+
+    def clear(self):
+        self._entries.clear()
+        self._size = 0
+
+    def __len__(self):
+        return len(self._entries)
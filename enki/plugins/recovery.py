@@ -0,0 +1,443 @@
+"""
+recovery --- Autosave modified documents and restore them after a crash
+=======================================================================
+
+Text of modified documents is periodically written to the recovery journal in the config directory.
+The writer thread keeps a copy of the text of every opened document. The GUI thread copies the whole text
+only when a document is opened. Then it passes only the edits, so that snapshots never block typing.
+Applying the edits, compression and writing are done by the thread.
+
+Every Enki instance writes own journal directory and removes it when terminated normally.
+The directory name is unique, since a restarted instance may get the PID of the crashed one.
+Journals of crashed instances are offered for recovery with File -> Recover unsaved documents.
+"""
+
+import os
+import os.path
+import gzip
+import json
+import queue
+import shutil
+import time
+import uuid
+import collections
+
+from PyQt5.QtCore import pyqtSignal, QThread, QTimer
+from PyQt5.QtGui import QTextCursor
+
+from enki.core.core import core
+from enki.core.defines import CONFIG_DIR
+
+
+_RECOVERY_DIR = os.path.join(CONFIG_DIR, 'recovery')
+_ALIVE_FILE_NAME = 'alive'
+_JOURNAL_SUFFIX = '.json.gz'
+
+_IDLE_TIMEOUT_MS = 1000  # do not copy text, while user is typing
+_HEARTBEAT_INTERVAL_MS = 30 * 1000
+_STALE_TIMEOUT_SEC = 4 * _HEARTBEAT_INTERVAL_MS / 1000  # instance which doesn't update alive file has crashed
+
+_RECOVER_ACTION_PATH = 'mFile/aRecoverUnsaved'
+
+# Edits queued for a document copy before the thread applies them
+_MAX_PENDING_EDITS = 1000
+
+
+def _touch(path):
+    with open(path, 'a'):
+        os.utime(path, None)
+
+
+def _plainText(selectedText):
+    """Convert QTextCursor.selectedText() like QTextDocument.toPlainText() does
+    """
+    return selectedText.replace('\u2029', '\n').replace('\u2028', '\n').replace('\xa0', ' ')
+
+
+def _applyEdits(text, edits):
+    for position, charsRemoved, added in edits:
+        # Replacing the whole document reports one more char than it contains. Slicing clamps it
+        text = text[:position] + added + text[position + charsRemoved:]
+    return text
+
+
+def _readJournal(path):
+    """Read journal file. Return dictionary or None on error
+    """
+    try:
+        with gzip.open(path, 'rt', encoding='utf8') as journalFile:
+            return json.load(journalFile)
+    except (OSError, IOError, ValueError, EOFError):
+        return None
+
+
+class _JournalWriterThread(QThread):
+    """Thread keeps copies of the documents text, compresses and writes snapshots of documents.
+    Tasks are executed in the same order as they have been queued
+    """
+    _Open = collections.namedtuple("Open", ["journalPath", "text"])
+    _Edit = collections.namedtuple("Edit", ["journalPath", "position", "charsRemoved", "added"])
+    _Write = collections.namedtuple("Write", ["journalPath", "filePath", "length"])
+    _Remove = collections.namedtuple("Remove", ["journalPath"])
+    _Close = collections.namedtuple("Close", ["journalPath"])
+    _Heartbeat = collections.namedtuple("Heartbeat", ["dirPath"])
+    _RemoveDir = collections.namedtuple("RemoveDir", ["dirPath"])
+
+    # The copy of the text doesn't match the document. Journal path. Emitted from the thread
+    textMismatch = pyqtSignal(str)
+
+    def __init__(self):
+        QThread.__init__(self)
+        self._queue = queue.Queue()
+        # {journal path: [text, list of edits not applied yet]}
+        self._texts = {}
+        self.start(QThread.LowPriority)
+
+    def open(self, journalPath, text):
+        """Start keeping a copy of the document text
+        """
+        self._queue.put(self._Open(journalPath, text))
+
+    def edit(self, journalPath, position, charsRemoved, added):
+        """Apply the change to the copy of the document text
+        """
+        self._queue.put(self._Edit(journalPath, position, charsRemoved, added))
+
+    def write(self, journalPath, filePath, length):
+        """Write snapshot of the document. ``length`` is the document length, to check the copy
+        """
+        self._queue.put(self._Write(journalPath, filePath, length))
+
+    def remove(self, journalPath):
+        """Remove snapshot of the document
+        """
+        self._queue.put(self._Remove(journalPath))
+
+    def close(self, journalPath):
+        """Remove snapshot and the copy of the document text
+        """
+        self._queue.put(self._Close(journalPath))
+
+    def heartbeat(self, dirPath):
+        """Update the alive file. Shows that the instance is still running
+        """
+        self._queue.put(self._Heartbeat(dirPath))
+
+    def removeDir(self, dirPath):
+        """Remove journal directory, after the queued tasks are done
+        """
+        self._queue.put(self._RemoveDir(dirPath))
+
+    def stopAsync(self):
+        self._queue.put(None)
+
+    def run(self):
+        """Thread function
+        """
+        while True:  # exits with break
+            task = self._queue.get()
+            if task is None:  # None is a quit command
+                break
+
+            try:
+                if isinstance(task, self._Open):
+                    self._texts[task.journalPath] = [task.text, []]
+                elif isinstance(task, self._Edit):
+                    self._edit(task)
+                elif isinstance(task, self._Write):
+                    self._writeSync(task)
+                elif isinstance(task, (self._Remove, self._Close)):
+                    if isinstance(task, self._Close):
+                        self._texts.pop(task.journalPath, None)
+                    if os.path.exists(task.journalPath):
+                        os.unlink(task.journalPath)
+                elif isinstance(task, self._Heartbeat):
+                    if not os.path.isdir(task.dirPath):
+                        os.makedirs(task.dirPath)
+                    _touch(os.path.join(task.dirPath, _ALIVE_FILE_NAME))
+                elif isinstance(task, self._RemoveDir):
+                    shutil.rmtree(task.dirPath, ignore_errors=True)
+            except (OSError, IOError):
+                pass  # autosave is not so important to disturb user with errors
+
+    def _edit(self, task):
+        entry = self._texts.get(task.journalPath)
+        if entry is not None:
+            entry[1].append((task.position, task.charsRemoved, task.added))
+            if len(entry[1]) >= _MAX_PENDING_EDITS:
+                entry[0] = _applyEdits(*entry)
+                entry[1] = []
+
+    def _writeSync(self, task):
+        entry = self._texts.get(task.journalPath)
+        if entry is None:
+            return
+        entry[0] = _applyEdits(*entry)
+        entry[1] = []
+        if len(entry[0]) != task.length:
+            self.textMismatch.emit(task.journalPath)
+            return
+
+        dirPath = os.path.dirname(task.journalPath)
+        if not os.path.isdir(dirPath):
+            os.makedirs(dirPath)
+
+        tmpPath = task.journalPath + '.tmp'
+        with gzip.open(tmpPath, 'wt', encoding='utf8', compresslevel=1) as journalFile:
+            json.dump({'filePath': task.filePath,
+                       'time': time.time(),
+                       'text': entry[0]},
+                      journalFile)
+        os.replace(tmpPath, task.journalPath)
+
+
+class Plugin:
+    """Plugin interface
+    """
+
+    def __init__(self):
+        core.config().setdefault('Recovery', {})
+        core.config().setdefault('Recovery/Enabled', True)
+        core.config().setdefault('Recovery/IntervalSec', 30)
+
+        self._dirPath = os.path.join(_RECOVERY_DIR, '{}-{}'.format(os.getpid(), uuid.uuid4().hex))
+        self._journalNames = {}  # document: journal file name. Kept while the document is opened
+        self._contentsChangeSlots = {}  # document: slot connected to its contentsChange
+        self._nextJournalIndex = 0
+        self._dirtyDocuments = set()
+        self._snapshotDue = False
+        self._staleDirs = []
+        self._recoverAction = None
+
+        self._thread = _JournalWriterThread()
+        self._thread.textMismatch.connect(self._onTextMismatch)
+
+        self._intervalTimer = QTimer(core)
+        self._intervalTimer.timeout.connect(self._onIntervalTimeout)
+
+        self._idleTimer = QTimer(core)
+        self._idleTimer.setSingleShot(True)
+        self._idleTimer.setInterval(_IDLE_TIMEOUT_MS)
+        self._idleTimer.timeout.connect(self._onIdleTimeout)
+
+        self._heartbeatTimer = QTimer(core)
+        self._heartbeatTimer.setInterval(_HEARTBEAT_INTERVAL_MS)
+        self._heartbeatTimer.timeout.connect(self._onHeartbeatTimeout)
+
+        core.workspace().documentOpened.connect(self._onDocumentOpened)
+        core.workspace().textChanged.connect(self._onTextChanged)
+        core.workspace().modificationChanged.connect(self._onModificationChanged)
+        core.workspace().documentClosed.connect(self._onDocumentClosed)
+        core.uiSettingsManager().dialogAccepted.connect(self._applySettings)
+
+        for document in core.workspace().documents():
+            self._onDocumentOpened(document)
+
+        self._applySettings()
+        self._findStaleJournals()
+
+    def terminate(self):
+        """Explicitly called destructor
+        """
+        core.workspace().documentOpened.disconnect(self._onDocumentOpened)
+        core.workspace().textChanged.disconnect(self._onTextChanged)
+        core.workspace().modificationChanged.disconnect(self._onModificationChanged)
+        core.workspace().documentClosed.disconnect(self._onDocumentClosed)
+        core.uiSettingsManager().dialogAccepted.disconnect(self._applySettings)
+        for document, slot in self._contentsChangeSlots.items():
+            document.qutepart.document().contentsChange.disconnect(slot)
+        self._contentsChangeSlots = {}
+
+        self._intervalTimer.stop()
+        self._idleTimer.stop()
+        self._heartbeatTimer.stop()
+
+        self._thread.stopAsync()
+        self._thread.wait()
+
+        if self._recoverAction is not None:
+            core.actionManager().removeAction(_RECOVER_ACTION_PATH)
+
+        # Normal termination. User has already decided what to do with unsaved documents
+        shutil.rmtree(self._dirPath, ignore_errors=True)
+
+    def _applySettings(self):
+        if core.config()['Recovery']['Enabled']:
+            self._intervalTimer.setInterval(core.config()['Recovery']['IntervalSec'] * 1000)
+            self._intervalTimer.start()
+            self._heartbeatTimer.start()
+            self._thread.heartbeat(self._dirPath)
+        else:
+            self._intervalTimer.stop()
+            self._heartbeatTimer.stop()
+            self._idleTimer.stop()
+            for document in list(self._journalNames.keys()):
+                self._removeJournal(document)
+            self._dirtyDocuments.clear()
+
+    def _journalPath(self, document):
+        if document not in self._journalNames:
+            self._journalNames[document] = '{}{}'.format(self._nextJournalIndex, _JOURNAL_SUFFIX)
+            self._nextJournalIndex += 1
+        return os.path.join(self._dirPath, self._journalNames[document])
+
+    def _removeJournal(self, document):
+        self._dirtyDocuments.discard(document)
+        if document in self._journalNames:
+            self._thread.remove(self._journalPath(document))
+
+    def _onDocumentOpened(self, document):
+        if document in self._contentsChangeSlots:
+            return
+
+        def slot(position, charsRemoved, charsAdded):
+            self._onContentsChange(document, position, charsRemoved, charsAdded)
+
+        self._thread.open(self._journalPath(document), document.qutepart.text)
+        document.qutepart.document().contentsChange.connect(slot)
+        self._contentsChangeSlots[document] = slot
+
+    def _onContentsChange(self, document, position, charsRemoved, charsAdded):
+        """Pass the edit to the thread. Costs as much as the added text, not the whole text
+        """
+        qtDocument = document.qutepart.document()
+        end = min(position + charsAdded, qtDocument.characterCount() - 1)
+        if end > position:
+            cursor = QTextCursor(qtDocument)
+            cursor.setPosition(position)
+            cursor.setPosition(end, QTextCursor.KeepAnchor)
+            added = _plainText(cursor.selectedText())
+        else:
+            added = ''
+        self._thread.edit(self._journalPath(document), position, charsRemoved, added)
+
+    def _onTextMismatch(self, journalPath):
+        """Copy of the text in the thread is broken. Copy the whole text
+        """
+        for document, name in self._journalNames.items():
+            if os.path.join(self._dirPath, name) == journalPath:
+                self._thread.open(journalPath, document.qutepart.text)
+                if document.qutepart.document().isModified():
+                    self._thread.write(journalPath, document.filePath(),
+                                       document.qutepart.document().characterCount() - 1)
+                break
+
+    def _onTextChanged(self, document):
+        self._dirtyDocuments.add(document)
+        if self._intervalTimer.isActive():
+            self._idleTimer.start()  # restart
+
+    def _onModificationChanged(self, document, modified):
+        if not modified:  # saved or undone to the saved state
+            self._removeJournal(document)
+
+    def _onDocumentClosed(self, document):
+        self._dirtyDocuments.discard(document)
+        slot = self._contentsChangeSlots.pop(document, None)
+        if slot is not None:
+            document.qutepart.document().contentsChange.disconnect(slot)
+        if document in self._journalNames:
+            self._thread.close(self._journalPath(document))
+            del self._journalNames[document]
+
+    def _onIntervalTimeout(self):
+        self._snapshotDue = True
+        if not self._idleTimer.isActive():
+            self._snapshot()
+
+    def _onIdleTimeout(self):
+        if self._snapshotDue:
+            self._snapshot()
+
+    def _onHeartbeatTimeout(self):
+        self._thread.heartbeat(self._dirPath)
+
+    def _snapshot(self):
+        """Ask the thread to write documents, changed since the last snapshot.
+        The thread has the text already
+        """
+        self._snapshotDue = False
+        for document in self._dirtyDocuments:
+            if document.qutepart.document().isModified():
+                self._thread.write(self._journalPath(document),
+                                   document.filePath(),
+                                   document.qutepart.document().characterCount() - 1)
+        self._dirtyDocuments.clear()
+
+    def _findStaleJournals(self):
+        """Find journals of crashed Enki instances. Offer to recover it
+        """
+        self._staleDirs = []
+        if not os.path.isdir(_RECOVERY_DIR):
+            return
+
+        now = time.time()
+        for name in os.listdir(_RECOVERY_DIR):
+            dirPath = os.path.join(_RECOVERY_DIR, name)
+            if dirPath == self._dirPath or not os.path.isdir(dirPath):
+                continue
+
+            alivePath = os.path.join(dirPath, _ALIVE_FILE_NAME)
+            try:
+                if now - os.path.getmtime(alivePath) < _STALE_TIMEOUT_SEC:
+                    continue  # another instance is running
+            except OSError:
+                pass  # no alive file. Broken directory
+
+            if any(fileName.endswith(_JOURNAL_SUFFIX) for fileName in os.listdir(dirPath)):
+                self._staleDirs.append(dirPath)
+            else:
+                shutil.rmtree(dirPath, ignore_errors=True)
+
+        if self._staleDirs and self._recoverAction is None:
+            self._recoverAction = core.actionManager().addAction(_RECOVER_ACTION_PATH,
+                                                                 'Recover unsaved documents')
+            self._recoverAction.triggered.connect(self._onRecoverTriggered)
+            core.mainWindow().appendMessage('Enki has not been closed correctly. '
+                                            'Unsaved documents can be recovered with '
+                                            'File -> Recover unsaved documents')
+
+    def _onRecoverTriggered(self):
+        """Open documents from the journals of crashed instances.
+        Journals are removed after the recovered documents have been journaled by this instance
+        """
+        for dirPath in self._staleDirs:
+            for fileName in sorted(os.listdir(dirPath)):
+                if not fileName.endswith(_JOURNAL_SUFFIX):
+                    continue
+
+                journal = _readJournal(os.path.join(dirPath, fileName))
+                if journal is None:
+                    continue
+
+                document = self._openRecoveredDocument(journal['filePath'], journal['text'])
+                if document is not None:
+                    self._thread.write(self._journalPath(document), document.filePath(),
+                                       document.qutepart.document().characterCount() - 1)
+
+            self._thread.removeDir(dirPath)
+
+        self._staleDirs = []
+        core.actionManager().removeAction(_RECOVER_ACTION_PATH)
+        self._recoverAction = None
+
+    def _openRecoveredDocument(self, filePath, text):
+        """Open the file and set the recovered text. Return the document, or None, if nothing is recovered.
+        Text of already opened file is not overwritten, the recovered text is opened as a new document
+        """
+        openedDocument = core.workspace().findDocumentForPath(filePath) if filePath is not None else None
+        if openedDocument is not None:
+            if openedDocument.qutepart.text == text:
+                return None
+            core.mainWindow().appendMessage('{} is already opened. '
+                                            'Recovered text is opened as a new document'.format(filePath))
+            document = core.workspace().createEmptyNotSavedDocument()
+        elif filePath is not None and os.path.isfile(filePath):
+            document = core.workspace().openFile(filePath)
+        else:
+            document = core.workspace().createEmptyNotSavedDocument(filePath)
+
+        if document is not None:
+            document.qutepart.text = text
+            document.qutepart.document().setModified(True)  # setting the text doesn't mark it modified
+        return document
@@ -420,6 +420,10 @@ class Controller(QObject):
             else:
                 self._searchInFileStartPoint = cursor.selectionStart()
 
+        if core.workspace().currentDocument().isLargeFile():
+            self._searchLargeFile(regExp, forward)
+            return
+
         match, matches = self._searchInText(regExp, qutepart.text, self._searchInFileStartPoint, forward)
         if match:
             selectionStart, selectionEnd = match.start(), match.start() + len(match.group(0))
@@ -432,10 +436,27 @@ class Controller(QObject):
             self._widget.setState(self._widget.Bad)
             qutepart.resetSelection()
 
+    def _searchLargeFile(self, regExp, forward):
+        """Search in the memory mapped file of a document in the large file mode.
+        qutepart.text contains only loaded part of such file
+        """
+        document = core.workspace().currentDocument()
+        found = document.searchInLargeFile(regExp, self._searchInFileStartPoint, forward)
+        if found is not None:
+            document.qutepart.absSelectedPosition = found
+            self._searchInFileLastCursorPos = found[1]
+            self._widget.setState(self._widget.Good)
+        else:
+            self._widget.setState(self._widget.Bad)
+            document.qutepart.resetSelection()
+
     def _onReplaceFileOne(self, replaceText):
         """Do one replacement in the file
         """
         self._widget.updateComboBoxes()
+        if core.workspace().currentDocument().isLargeFile():
+            self._widget.setState(self._widget.Bad)  # read-only
+            return
 
         qpart = core.workspace().currentDocument().qutepart
         regExp = self._widget.getRegExp()
@@ -461,6 +482,9 @@ class Controller(QObject):
         """Do all replacements in the file
         """
         self._widget.updateComboBoxes()
+        if core.workspace().currentDocument().isLargeFile():
+            self._widget.setState(self._widget.Bad)  # read-only
+            return
 
         qpart = core.workspace().currentDocument().qutepart
         regExp = self._widget.getRegExp()
@@ -135,7 +135,6 @@ if __name__ == '__main__':
           install_requires=[
               'qutepart',
               'Markdown',
-              'regex==2016.10.22',
               'CodeChat',
               'Sphinx',
               'flake8',
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+# .. -*- coding: utf-8 -*-
+#
+# ****************************************************************************
+# benchmark_approx_match.py - Time findApproxTextInTarget against regex search
+# ****************************************************************************
+# ``findApproxText`` used to run a fuzzy ``BESTMATCH`` search of the `regex
+# <https://pypi.python.org/pypi/regex>`_ package over the whole target text,
+# then twice more to check that the match is unique. This script times
+# ``findApproxTextInTarget`` with the current q-gram indexed search and with
+# that former search on the same inputs, then reports both timings and the
+# speedup. Run it from any directory::
+#
+#    python3 tests/benchmark_approx_match.py
+#
+# The former search needs ``regex``, which Enki doesn't depend on anymore. Its
+# time grows exponentially with the length of the text searched for, so a
+# single lookup may take hours. It runs in a worker process which is given
+# ``REGEX_TIMEOUT`` seconds per lookup; if a lookup times out, the reported
+# speedup is a lower bound. The inputs are generated from a fixed seed and are
+# as large as ``preview.py``, so every run times the same input.
+#
+# Imports
+# =======
+# Library imports
+# ---------------
+import multiprocessing
+import os.path
+import random
+import re
+import string
+import sys
+import time
+#
+# Third-party imports
+# -------------------
+try:
+    import regex
+except ImportError:
+    regex = None
+#
+# Local application imports
+# -------------------------
+sys.path.insert(0, os.path.join(os.path.abspath(os.path.dirname(__file__)), ".."))
+from enki.plugins.preview import approx_match
+#
+# Inputs
+# ======
+# The length of the source text, about the size of ``preview.py``.
+SOURCE_LENGTH = 60000
+#
+# The number of positions looked up.
+LOOKUPS = 10
+#
+# The seed of the generated text and positions.
+SEED = 1
+#
+# The number of distinct words in the generated text.
+VOCABULARY_SIZE = 3000
+#
+# Seconds a lookup with the former search may take.
+REGEX_TIMEOUT = 60
+
+
+# Return a literate source text, with comments and code, and its rendering:
+# comment markers are dropped and runs of spaces are collapsed. Like in natural
+# language, word frequencies follow Zipf's law.
+def makeTexts(rand):
+    vocabulary = [''.join(rand.choice(string.ascii_lowercase) for i in range(rand.randint(2, 10)))
+                  for i in range(VOCABULARY_SIZE)]
+    weights = [1 / (rank + 1) for rank in range(VOCABULARY_SIZE)]
+    lines = []
+    length = 0
+    while length < SOURCE_LENGTH:
+        words = ' '.join(rand.choices(vocabulary, weights, k=rand.randint(3, 10)))
+        if rand.random() < 0.5:
+            line = '# ' + words
+        else:
+            line = '    ' * rand.randint(0, 3) + words.replace(' ', '_', 1) + '(self)'
+        lines.append(line)
+        length += len(line) + 1
+    sourceText = '\n'.join(lines)
+    targetText = re.sub(r'^# ?', '', sourceText, flags=re.M)
+    targetText = re.sub(' +', ' ', targetText)
+    return sourceText, targetText
+#
+# The former search
+# =================
+# This is ``findApproxText`` before the q-gram index replaced it.
+def regexFindApproxText(searchText, targetText):
+    mo = regexFuzzySearch(searchText, targetText)
+    if mo:
+        # See if this match is unique enough by looking for the next best match
+        # by searching in the string before then the string after the match.
+        moPre = regexFuzzySearch(searchText, targetText[:mo.start()])
+        moPost = regexFuzzySearch(searchText, targetText[mo.end():])
+
+        moError = sum(mo.fuzzy_counts)
+        moPreError = sum(moPre.fuzzy_counts) if moPre else moError*2
+        moPostError = sum(moPost.fuzzy_counts) if moPost else moError*2
+
+        if moError*1.1 <= moPreError and moError*1.1 <= moPostError:
+            return mo
+    return None
+
+
+def regexFuzzySearch(searchText, targetText):
+    return regex.search('(' + regex.escape(searchText) + '){e}', targetText, regex.BESTMATCH)
+#
+# Main
+# ====
+
+
+# Return the results of looking up all ``positions`` and the time per lookup.
+def timeLookups(sourceText, targetText, positions):
+    start = time.perf_counter()
+    results = [approx_match.findApproxTextInTarget(sourceText, position, targetText)
+               for position in positions]
+    return results, (time.perf_counter() - start) / len(positions)
+
+
+# Look up a position with the former search. Runs in the worker process.
+def regexLookup(sourceText, position, targetText):
+    approx_match.findApproxText = regexFindApproxText
+    start = time.perf_counter()
+    result = approx_match.findApproxTextInTarget(sourceText, position, targetText)
+    return result, time.perf_counter() - start
+
+
+def main():
+    rand = random.Random(SEED)
+    sourceText, targetText = makeTexts(rand)
+    positions = [rand.randrange(len(sourceText)) for i in range(LOOKUPS)]
+    print('Source text: {} characters, target text: {} characters, {} lookups'.format(
+        len(sourceText), len(targetText), LOOKUPS))
+
+    results, indexedTime = timeLookups(sourceText, targetText, positions)
+    print('q-gram index: {:10.1f} ms per lookup'.format(indexedTime * 1000))
+
+    if regex is None:
+        print('Install regex to time the former search.')
+        return
+
+    regexResults = []
+    regexTime = 0
+    # Leaving the block terminates a worker stuck in a lookup which timed out.
+    with multiprocessing.Pool(1) as pool:
+        for position in positions:
+            try:
+                result, lookupTime = pool.apply_async(
+                    regexLookup, (sourceText, position, targetText)).get(REGEX_TIMEOUT)
+            except multiprocessing.TimeoutError:
+                print('regex:        a lookup timed out after {} s'.format(REGEX_TIMEOUT))
+                print('Speedup: more than {:.0f}x'.format(REGEX_TIMEOUT / indexedTime))
+                return
+            regexResults.append(result)
+            regexTime += lookupTime
+    regexTime /= len(positions)
+    print('regex:        {:10.1f} ms per lookup'.format(regexTime * 1000))
+    print('Speedup: {:.1f}x. Same results: {} of {}'.format(
+        regexTime / indexedTime,
+        sum(result == regexResult for result, regexResult in zip(results, regexResults)),
+        LOOKUPS))
+
+
+if __name__ == '__main__':
+    main()
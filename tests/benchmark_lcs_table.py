@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+# .. -*- coding: utf-8 -*-
+#
+# *************************************************************************
+# benchmark_lcs_table.py - Time the Python and NumPy LCS table computation
+# *************************************************************************
+# ``refineSearchResult`` fills an LCS table for each match which
+# ``findApproxTextInTarget`` refines. This script times both implementations
+# of ``lcsTable`` on the same inputs and reports the speedup. Run it from any
+# directory::
+#
+#    python3 tests/benchmark_lcs_table.py
+#
+# The texts are generated from a fixed seed, so every run times the same input.
+# Wall-clock timings depend on the machine and its load, which is why this is a
+# script to read, not a unit test to pass or fail.
+#
+# Imports
+# =======
+# Library imports
+# ---------------
+import os.path
+import random
+import sys
+import timeit
+#
+# Local application imports
+# -------------------------
+sys.path.insert(0, os.path.join(os.path.abspath(os.path.dirname(__file__)), ".."))
+from enki.plugins.preview import approx_match
+#
+# Inputs
+# ======
+# Lengths of the search text. ``findApproxTextInTarget`` searches 60 to 90
+# characters; the longer texts show how the implementations scale.
+LENGTHS = (60, 90, 500, 2000)
+#
+# The seed of the generated texts.
+SEED = 1
+#
+# Words of the generated texts.
+WORDS = ('the', 'preview', 'document', 'text', 'cursor', 'position', 'of',
+         'a', 'web', 'page', 'is', 'mapped', 'to', 'in', 'and', 'code', '#',
+         '``', '*', '_', 'def', 'return', '=', '(', ')', ':')
+
+
+# Return a search text of the given length and a target text made from it like
+# a rendering: markup is dropped and some characters differ.
+def makeTexts(length, rand):
+    words = []
+    while sum(len(word) + 1 for word in words) < length:
+        words.append(rand.choice(WORDS))
+    searchText = ' '.join(words)[:length]
+    targetText = ''.join(c for c in searchText if c not in '#`*_')
+    targetText = ''.join(c.upper() if rand.random() < 0.05 else c for c in targetText)
+    return searchText, targetText
+#
+# Main
+# ====
+
+
+def main():
+    if approx_match.numpy is None:
+        print('NumPy is not installed; only the Python implementation is available.')
+        return
+
+    rand = random.Random(SEED)
+    print('{:>8} {:>12} {:>12} {:>8}'.format('length', 'Python, ms', 'NumPy, ms', 'speedup'))
+    for length in LENGTHS:
+        searchText, targetText = makeTexts(length, rand)
+        assert (approx_match._lcsTableNumpy(searchText, targetText).tolist() ==
+                approx_match._lcsTablePython(searchText, targetText))
+
+        # Fewer runs for longer texts, since the Python table is quadratic.
+        number = max(1, 2000 // length)
+        pythonTime, numpyTime = [
+            min(timeit.repeat(lambda: impl(searchText, targetText), number=number, repeat=5)) / number
+            for impl in (approx_match._lcsTablePython, approx_match._lcsTableNumpy)]
+        print('{:>8} {:>12.3f} {:>12.3f} {:>7.1f}x'.format(
+            length, pythonTime * 1000, numpyTime * 1000, pythonTime / numpyTime))
+
+
+if __name__ == '__main__':
+    main()
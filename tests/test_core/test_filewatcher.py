@@ -10,6 +10,9 @@ import base
 
 from PyQt5.QtTest import QTest
 
+from enki.core.core import core
+import enki.core.filewatcher
+
 
 @unittest.skipIf(os.environ.get('TRAVIS_OS_NAME', None) == 'osx', "Fails on OSX. TODO Check why??????")
 class Test(base.TestCase):
@@ -94,6 +97,44 @@ class Test(base.TestCase):
         self._doc1.saveFile()
         self._sleepAndCheck(0, False, False, False, False)
 
+    @base.inMainLoop
+    def test_5(self):
+        # many events are coalesced to one notification per file
+        received = core.fileWatcher().eventsReceived()
+        handled = core.fileWatcher().eventsHandled()
+        for i in range(10):
+            with open(self._doc1.filePath(), 'w') as file_:
+                file_.write('new text {}'.format(i))
+        self._sleepAndCheck(0.1, True, False, False, False)
+
+        self.assertGreater(core.fileWatcher().eventsReceived(), received)
+        self.assertEqual(core.fileWatcher().eventsHandled() - handled, 1)
+
+    @base.inMainLoop
+    def test_6(self):
+        # a burst of events within the debounce window is dispatched to a client once
+        watcher = core.fileWatcher()
+        path = self._doc2.filePath()
+        notifications = []
+
+        class Client:
+            def onFileChanged(self, exists):
+                notifications.append(exists)
+
+        client = Client()
+        watcher.watch(path, client)
+        try:
+            handled = watcher.eventsHandled()
+            for i in range(10):
+                watcher._onFileChanged(path)
+            self.assertEqual(notifications, [])
+
+            QTest.qWait(enki.core.filewatcher._DEBOUNCE_TIMEOUT_MSEC * 3)
+            self.assertEqual(watcher.eventsHandled() - handled, 1)
+            self.assertEqual(notifications, [True])
+        finally:
+            watcher.unwatch(path, client)
+
 
 if __name__ == '__main__':
     unittest.main()
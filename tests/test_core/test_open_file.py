@@ -4,11 +4,15 @@ import unittest
 import os.path
 import sys
 import os
+import re
 
 sys.path.insert(0, os.path.join(os.path.abspath(os.path.dirname(__file__)), ".."))
 import base
 
+from PyQt5.QtTest import QTest
+
 import enki.core.workspace
+import enki.core.document
 from enki.core.core import core
 
 
@@ -21,6 +25,85 @@ class Test(base.TestCase):
         self.assertTrue(doc is doc2)
 
 
+class LargeFile(base.TestCase):
+
+    def setUp(self):
+        base.TestCase.setUp(self)
+        self._oldLargeFileSize = enki.core.workspace._LARGE_FILE_SIZE
+        self._oldChunkSize = enki.core.document._LARGE_FILE_CHUNK_SIZE
+        enki.core.workspace._LARGE_FILE_SIZE = 100
+        enki.core.document._LARGE_FILE_CHUNK_SIZE = 100
+
+    def tearDown(self):
+        enki.core.workspace._LARGE_FILE_SIZE = self._oldLargeFileSize
+        enki.core.document._LARGE_FILE_CHUNK_SIZE = self._oldChunkSize
+        base.TestCase.tearDown(self)
+
+    def test_1(self):
+        # Large file is opened read-only and loaded by chunks
+        lines = ['line {}'.format(i) for i in range(100)]
+        document = self.createFile('big.log', '\n'.join(lines) + '\n')
+        self.assertTrue(document.isLargeFile())
+        self.assertTrue(document.qutepart.isReadOnly())
+        self.assertIsNone(document.qutepart.language())
+        self.assertLess(len(document.qutepart.lines), len(lines))
+        self.assertEqual(document.qutepart.lines[0], 'line 0')
+
+    def test_2(self):
+        # Search loads the text on demand
+        lines = ['line {}'.format(i) for i in range(100)]
+        document = self.createFile('big.log', '\n'.join(lines) + '\n')
+        regExp = re.compile('line 98')
+        start, end = document.searchInLargeFile(regExp, 0, True)
+        self.assertEqual(document.qutepart.text[start:end], 'line 98')
+
+        # backward search wraps
+        start, end = document.searchInLargeFile(re.compile('line 1'), 0, False)
+        self.assertEqual(document.qutepart.text[start:end], 'line 1')
+        self.assertEqual(document.qutepart.text[start:start + 7], 'line 19')
+
+    def test_3(self):
+        # Small files are opened as usually
+        document = self.createFile('small.log', 'text')
+        self.assertFalse(document.isLargeFile())
+
+    def test_4(self):
+        # Search keeps the flags of the regular expression and works with not ASCII text
+        lines = ['строка {}'.format(i) for i in range(100)] + ['СТРОКА 100']
+        document = self.createFile('big.log', '\n'.join(lines) + '\n')
+        start, end = document.searchInLargeFile(re.compile('строка 100', re.IGNORECASE), 0, True)
+        self.assertEqual(document.qutepart.text[start:end], 'СТРОКА 100')
+
+        start, end = document.searchInLargeFile(re.compile(r'^\w+ 9$', re.MULTILINE), 0, True)
+        self.assertEqual(document.qutepart.text[start:end], 'строка 9')
+
+        # a match may span chunks. The 2nd chunk ends with 'строка 13'
+        start, end = document.searchInLargeFile(re.compile('13.строка', re.DOTALL), 0, True)
+        self.assertEqual(document.qutepart.text[start:end], '13\nстрока')
+
+    @base.inMainLoop
+    def test_5(self):
+        # Mapped file follows every external change. Appended text is loaded, truncated file is reloaded
+        lines = ['line {}'.format(i) for i in range(100)]
+        document = self.createFile('big.log', '\n'.join(lines) + '\n')
+        while document._loadNextChunk() is not None:
+            pass
+
+        for i in range(2):
+            with open(document.filePath(), 'a') as file_:
+                file_.write('appended {}\n'.format(i))
+            QTest.qWait(500)
+            document._ensureLoaded(os.path.getsize(document.filePath()) - 1)
+            self.assertEqual(document.qutepart.lines[-1], 'appended {}'.format(i))
+
+        with open(document.filePath(), 'w') as file_:
+            file_.write('short\n')
+        QTest.qWait(500)
+        self.assertEqual(document.qutepart.text, 'short')
+        start, end = document.searchInLargeFile(re.compile('short'), 0, True)
+        self.assertEqual((start, end), (0, 5))
+
+
 class OpenFail(base.TestCase):
 
     def _runTest(self, filePath, expectedTitle):
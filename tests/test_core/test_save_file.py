@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+
+import unittest
+import unittest.mock
+import os.path
+import sys
+import stat
+
+sys.path.insert(0, os.path.join(os.path.abspath(os.path.dirname(__file__)), ".."))
+
+import base
+
+import enki.core.document
+from enki.core.core import core
+
+
+class Test(base.TestCase):
+    CREATE_NOT_SAVED_DOCUMENT = False
+
+    def _readFile(self, path):
+        with open(path, 'rb') as file_:
+            return file_.read()
+
+    def test_1(self):
+        # Saved text is the same as textForSaving(), written by chunks
+        oldChunkSize = enki.core.document._SAVE_CHUNK_SIZE
+        enki.core.document._SAVE_CHUNK_SIZE = 5
+        try:
+            doc = self.createFile('file1.txt', 'asdf')
+            doc.qutepart.text = 'line 1\nline 2\n\nline 4 is long'
+            doc.qutepart.eol = '\r\n'
+            doc.saveFile()
+        finally:
+            enki.core.document._SAVE_CHUNK_SIZE = oldChunkSize
+
+        self.assertEqual(self._readFile(doc.filePath()),
+                         doc.qutepart.textForSaving().encode('utf8'))
+        self.assertFalse(doc.isExternallyModified())
+
+    def test_2(self):
+        # No temporary files are left, permissions are preserved
+        doc = self.createFile('file1.sh', 'asdf')
+        os.chmod(doc.filePath(), 0o751)
+        doc.qutepart.text = 'new text'
+        doc.saveFile()
+
+        self.assertEqual(stat.S_IMODE(os.stat(doc.filePath()).st_mode), 0o751)
+        self.assertEqual(sorted(os.listdir(self.TEST_FILE_DIR)),
+                         sorted([os.path.basename(self.EXISTING_FILE), 'file1.sh']))
+
+    @unittest.skipUnless(hasattr(os, 'symlink'), "Symlinks are not supported")
+    def test_3(self):
+        # Symlink is not replaced with a file
+        targetPath = os.path.join(self.TEST_FILE_DIR, 'target.txt')
+        with open(targetPath, 'w') as file_:
+            file_.write('asdf')
+        linkPath = os.path.join(self.TEST_FILE_DIR, 'link.txt')
+        os.symlink(targetPath, linkPath)
+
+        doc = self.createFile('link.txt', 'asdf')
+        doc.qutepart.text = 'new text'
+        doc.saveFile()
+
+        self.assertTrue(os.path.islink(linkPath))
+        self.assertEqual(self._readFile(targetPath), b'new text\n')
+
+    def test_4(self):
+        # A new file gets the default mode. The process umask is never changed, other threads may create files
+        path = os.path.join(self.TEST_FILE_DIR, 'new.txt')
+        core.workspace().createEmptyNotSavedDocument(path)
+        doc = core.workspace().currentDocument()
+        doc.qutepart.text = 'new text'
+        with unittest.mock.patch('os.umask') as umask:
+            doc.saveFile()
+            umask.assert_not_called()
+
+        self.assertEqual(stat.S_IMODE(os.stat(path).st_mode),
+                         0o666 & ~enki.core.document._umask())
+
+    @unittest.skipUnless(hasattr(os, 'link'), "Hard links are not supported")
+    def test_5(self):
+        # File with hard links is written in place, links are not broken
+        doc = self.createFile('file1.txt', 'asdf')
+        linkPath = os.path.join(self.TEST_FILE_DIR, 'link.txt')
+        os.link(doc.filePath(), linkPath)
+        doc.qutepart.text = 'new text'
+        doc.saveFile()
+
+        self.assertTrue(os.path.samefile(doc.filePath(), linkPath))
+        self.assertEqual(self._readFile(linkPath), b'new text\n')
+
+    def test_6(self):
+        # File is written in place, if a temporary file can't be created in the directory
+        doc = self.createFile('file1.txt', 'asdf')
+        inode = os.stat(doc.filePath()).st_ino
+        doc.qutepart.text = 'new text'
+        with unittest.mock.patch('tempfile.mkstemp', side_effect=PermissionError('Permission denied')):
+            doc.saveFile()
+
+        self.assertEqual(os.stat(doc.filePath()).st_ino, inode)
+        self.assertEqual(self._readFile(doc.filePath()), b'new text\n')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+# .. -*- coding: utf-8 -*-
+#
+# *********************************************
+# test_debounce.py - Unit tests for debounce.py
+# *********************************************
+# Imports
+# =======
+import sys
+import os.path
+sys.path.insert(0, os.path.join(os.path.abspath(os.path.dirname(__file__)),
+                                ".."))
+from base import WaitForSignal
+#
+# Library imports
+# ---------------
+import unittest
+#
+# Local imports
+# -------------
+from enki.lib.debounce import AdaptiveDebouncer
+#
+# Unit tests
+# ==========
+
+
+class TestAdaptiveDebouncer(unittest.TestCase):
+    # The timeout is emitted after the initial delay.
+    def test_1(self):
+        d = AdaptiveDebouncer('test', initialDelay=50)
+        with WaitForSignal(d.timeout, 1000):
+            d.restart()
+
+    # A stopped debouncer doesn't emit the timeout.
+    def test_2(self):
+        d = AdaptiveDebouncer('test', initialDelay=50)
+        with WaitForSignal(d.timeout, 200, assertIfNotRaised=False) as w:
+            d.restart()
+            d.stop()
+        self.assertEqual(w.numEmitted, 0)
+
+    # The delay follows the processing time, within the limits.
+    def test_3(self):
+        d = AdaptiveDebouncer('test', initialDelay=800, minDelay=100, maxDelay=1000)
+        d._measure(0.001)
+        self.assertEqual(d.delay(), 100)
+        d._measure(10)
+        self.assertEqual(d.delay(), 1000)
+
+        d = AdaptiveDebouncer('test', initialDelay=800, minDelay=100, maxDelay=1000)
+        d._measure(0.2)
+        self.assertEqual(d.delay(), 400)
+
+    # A pause which ends while a job runs starts the next job when the running one finishes.
+    def test_4(self):
+        d = AdaptiveDebouncer('test', initialDelay=50)
+        job = d.jobStarted()
+        with WaitForSignal(d.timeout, 200, assertIfNotRaised=False) as w:
+            d.restart()
+        self.assertEqual(w.numEmitted, 0)
+        self.assertTrue(d.isJobRunning())
+
+        with WaitForSignal(d.timeout, 1000):
+            d.jobFinished(job)
+        self.assertFalse(d.isJobRunning())
+        self.assertIsNotNone(d.averageProcessingTime())
+
+    # Results of replaced jobs are ignored.
+    def test_5(self):
+        d = AdaptiveDebouncer('test', initialDelay=50)
+        oldJob = d.jobStarted()
+        d.jobStarted()
+        d.jobFinished(oldJob)
+        self.assertTrue(d.isJobRunning())
+        d.jobCancelled()
+        self.assertFalse(d.isJobRunning())
+        self.assertIsNone(d.averageProcessingTime())
+#
+# Main
+# ====
+if __name__ == '__main__':
+    unittest.main()
@@ -10,6 +10,8 @@
 # Library imports
 # ---------------
 import unittest
+import unittest.mock
+import random
 import os.path
 import sys
 #
@@ -23,6 +25,8 @@ import base
 from enki.plugins.preview.approx_match import findApproxTextInTarget as f
 from enki.plugins.preview.approx_match import findApproxText as g
 from enki.plugins.preview.approx_match import refineSearchResult as lcs
+from enki.plugins.preview.approx_match import PositionMap
+from enki.plugins.preview import approx_match
 #
 # Tests for findApproxText
 # ==========================
@@ -37,6 +41,21 @@ class TestFindApproxText(unittest.TestCase):
         self.assertTrue(mo)
         self.assertEqual(mo.start(), 3)
         self.assertEqual(mo.end(), 4)
+
+    # Find a match with errors in a long text with many repeated fragments.
+    def test_2(self):
+        filler = 'def foo(self, bar):\n    return bar\n' * 500
+        targetText = filler + 'def approximatelyMatch(self, bat):\n' + filler
+        mo = g(searchText='def approximateMatch(self, bar):',
+               targetText=targetText)
+        self.assertTrue(mo)
+        self.assertEqual(mo.start(), len(filler))
+        self.assertEqual(mo.cost, 3)
+
+    # A match which isn't better than others isn't unique.
+    def test_3(self):
+        self.assertIsNone(g(searchText='abcdef',
+                            targetText='abcxef ==== abxdef'))
 #
 # Tests for findApproxTextInTarget
 # ================================
@@ -377,6 +396,87 @@ Text after block 1,2, and 3""")[0]
                     targetText='bqwc?xyzaad')[0]
         # The expected targetText index is between ``bqwc?xyza`` and ``d``.
         self.assertIn(index, (8, 9, 10))
+
+    # The NumPy and pure-Python LCS tables must be identical.
+    @base.requiresModule('numpy')
+    def test_17(self):
+        searchText = 'Once upon a time, there lived'
+        targetText = 'Once upon a time------------, lived'
+        self.assertEqual(approx_match._lcsTableNumpy(searchText, targetText).tolist(),
+                         approx_match._lcsTablePython(searchText, targetText))
+#
+# Tests for PositionMap
+# =====================
+
+
+class TestPositionMap(unittest.TestCase):
+    # Map positions between a text and its rendering, which drops markup.
+    def test_1(self):
+        pm = PositionMap('One *two* three', '\nOne two three\n')
+        self.assertEqual(pm.sourceToTarget(0), 1)
+        self.assertEqual(pm.sourceToTarget(5), 5)
+        self.assertEqual(pm.sourceToTarget(15), 14)
+        self.assertEqual(pm.targetToSource(1), 0)
+        self.assertEqual(pm.targetToSource(8), 9)
+
+    # Texts which have nothing in common can't be mapped.
+    def test_2(self):
+        self.assertEqual(PositionMap('abc', '').sourceToTarget(1), -1)
+        self.assertEqual(PositionMap('abc', 'xyz').targetToSource(1), -1)
+
+    # Long texts are aligned using unique anchors, even if they contain
+    # repeated fragments.
+    def test_3(self):
+        source = ''.join('Paragraph number {}: *some* text.\n\n'.format(i)
+                         for i in range(1000))
+        target = ''.join('Paragraph number {}: some text.\n'.format(i)
+                         for i in range(1000))
+        pm = PositionMap(source, target)
+        sourceIndex = source.index('number 567:')
+        targetIndex = target.index('number 567:')
+        self.assertEqual(pm.sourceToTarget(sourceIndex), targetIndex)
+        self.assertEqual(pm.targetToSource(targetIndex), sourceIndex)
+
+    # The map knows which texts it was built for.
+    def test_4(self):
+        pm = PositionMap('abc', 'abc')
+        self.assertTrue(pm.matches('abc', 'abc'))
+        self.assertFalse(pm.matches('abc', 'abcd'))
+
+    # Positions in a large gap without anchors are searched for, not
+    # interpolated. Every third character of the rendering differs, so the
+    # texts have no common q-grams.
+    def test_5(self):
+        rand = random.Random(1)
+        text = ''.join(rand.choice('abcdefgh') for i in range(400))
+        end = ' The end of the document.'
+        source = text + end
+        target = ('QRSTUVWXYZ' * 20 +
+                  ''.join(c.upper() if i % 3 == 2 else c for i, c in enumerate(text)) +
+                  end)
+        pm = PositionMap(source, target)
+        for sourceIndex in (50, 200, 350):
+            self.assertAlmostEqual(pm.sourceToTarget(sourceIndex), 200 + sourceIndex,
+                                   delta=2)
+            self.assertAlmostEqual(pm.targetToSource(200 + sourceIndex), sourceIndex,
+                                   delta=2)
+
+    # Large gaps are searched while the map is built, so lookups don't search.
+    def test_6(self):
+        rand = random.Random(1)
+        text = ''.join(rand.choice('abcdefgh') for i in range(2000))
+        source = text + ' The end of the document.'
+        target = ('QRSTUVWXYZ' * 20 +
+                  ''.join(c.upper() if i % 3 == 2 else c for i, c in enumerate(text)) +
+                  ' The end of the document.')
+        pm = PositionMap(source, target)
+        with unittest.mock.patch.object(approx_match, 'findApproxTextInTarget',
+                                        side_effect=AssertionError('searched')):
+            for sourceIndex in range(0, 2000, 97):
+                self.assertAlmostEqual(pm.sourceToTarget(sourceIndex), 200 + sourceIndex,
+                                       delta=2)
+                self.assertAlmostEqual(pm.targetToSource(200 + sourceIndex), sourceIndex,
+                                       delta=2)
 #
 # Main
 # ====
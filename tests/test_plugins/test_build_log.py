@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+# .. -*- coding: utf-8 -*-
+#
+# *********************************
+# test_build_log.py - Unit testing
+# *********************************
+#
+# Imports
+# =======
+# Library imports
+# ---------------
+import unittest
+import os.path
+import sys
+#
+# Local application imports
+# -------------------------
+# Insert path to base before importing.
+sys.path.insert(0, os.path.join(os.path.abspath(os.path.dirname(__file__)), ".."))
+import base
+# Base will insert path to enki, so its modules that we want to test can now be
+# imported.
+from enki.plugins.preview.build_log import (parseProblem, Problem, ProblemCounter,
+                                            LogBuffer, CLEAR, TEXT, ERROR)
+#
+# Tests
+# =====
+class TestParseProblem(unittest.TestCase):
+    # docutils messages.
+    def test_1(self):
+        self.assertEqual(parseProblem('<string>:1589: (ERROR/3) Unknown interpreted text role "ref".'),
+                         Problem('<string>', 1588, 'ERROR',
+                                 '<string>:1589: (ERROR/3) Unknown interpreted text role "ref".'))
+        self.assertEqual(parseProblem(r'X:\ode.py:docstring of sympy:5: (ERROR/3) Unexpected indentation.').filePath,
+                         r'X:\ode.py:docstring of sympy')
+
+    # Sphinx messages, with and without a line number.
+    def test_2(self):
+        problem = parseProblem(r'X:\SVM_train.m.rst:2: SEVERE: Title overline & underline mismatch.')
+        self.assertEqual((problem.filePath, problem.line, problem.kind),
+                         (r'X:\SVM_train.m.rst', 1, 'ERROR'))
+        problem = parseProblem(r'X:\indexs.rst:None: WARNING: image file not readable: a.jpg')
+        self.assertEqual((problem.filePath, problem.line, problem.kind),
+                         (r'X:\indexs.rst', None, 'WARNING'))
+        problem = parseProblem("/a/file.rst: WARNING: document isn't included in any toctree")
+        self.assertEqual((problem.filePath, problem.line, problem.kind),
+                         ('/a/file.rst', None, 'WARNING'))
+
+    # Other lines aren't problems.
+    def test_3(self):
+        self.assertIsNone(parseProblem('building [html]: targets for 1 source files'))
+        self.assertIsNone(parseProblem(''))
+
+
+class TestProblemCounter(unittest.TestCase):
+    # Lines split between writes are counted once.
+    def test_1(self):
+        counter = ProblemCounter()
+        counter.add('a.rst:1: WARN')
+        counter.add('ING: x\nb.rst:2: (ERROR/3) y\nc.rst:3: SEVERE: z')
+        self.assertEqual((counter.errors, counter.warnings), (1, 1))
+        counter.finish()
+        self.assertEqual((counter.errors, counter.warnings), (2, 1))
+        self.assertEqual([problem.filePath for problem in counter.problems],
+                         ['a.rst', 'b.rst', 'c.rst'])
+
+
+class TestLogBuffer(unittest.TestCase):
+    # Consecutive writes of the same kind are joined; only errors are counted.
+    def test_1(self):
+        buffer = LogBuffer()
+        buffer.write('one\n')
+        buffer.write('two\n')
+        buffer.write('a.rst:1: WARNING: x\n', isError=True)
+        buffer.write('a.rst:1: WARNING: not an error\n')
+        self.assertEqual(buffer.take(), [(TEXT, 'one\ntwo\n'),
+                                         (ERROR, 'a.rst:1: WARNING: x\n'),
+                                         (TEXT, 'a.rst:1: WARNING: not an error\n')])
+        self.assertEqual(buffer.take(), [])
+        errors, warnings, problems, hasErrorText = buffer.summary()
+        self.assertEqual((errors, warnings, len(problems), hasErrorText), (0, 1, 1, True))
+
+    # Clearing drops the waiting text and the counts.
+    def test_2(self):
+        buffer = LogBuffer()
+        buffer.write('a.rst:1: (ERROR/3) x\n', isError=True)
+        buffer.clear()
+        buffer.write('new\n')
+        self.assertEqual(buffer.take(), [(CLEAR, None), (TEXT, 'new\n')])
+        self.assertEqual(buffer.summary(), (0, 0, [], False))
+
+    # The pending signal is emitted only when the buffer becomes non-empty.
+    def test_3(self):
+        buffer = LogBuffer()
+        emitted = []
+        buffer.pending.connect(lambda: emitted.append(True))
+        buffer.write('one\n')
+        buffer.write('two\n', isError=True)
+        self.assertEqual(len(emitted), 1)
+        buffer.take()
+        buffer.write('three\n')
+        self.assertEqual(len(emitted), 2)
+#
+# Main
+# ====
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# .. -*- coding: utf-8 -*-
+#
+# ***************************************
+# test_converter_pool.py - Unit testing
+# ***************************************
+#
+# Imports
+# =======
+# Library imports
+# ---------------
+import unittest
+import os.path
+import sys
+import threading
+import time
+#
+# Local application imports
+# -------------------------
+# Insert path to base before importing.
+sys.path.insert(0, os.path.join(os.path.abspath(os.path.dirname(__file__)), ".."))
+import base
+# Base will insert path to enki, so its modules that we want to test can now be
+# imported.
+from enki.plugins.preview.converter_pool import ConverterPool, ConversionCancelled
+from enki.plugins.preview.markdown_renderer import RenderedMarkdown
+#
+# Tests
+# =====
+class TestConverterPool(unittest.TestCase):
+    def setUp(self):
+        self.pool = ConverterPool()
+
+    def tearDown(self):
+        self.pool.terminate()
+
+    # Markdown is returned with its blocks.
+    @base.requiresModule('markdown')
+    def test_1(self):
+        htmlText, errString = self.pool.convert('Markdown', 'One\n\nTwo', '<style></style>')
+        self.assertIsInstance(htmlText, RenderedMarkdown)
+        self.assertEqual(htmlText.template, '<style></style>')
+        self.assertEqual(len(htmlText.blocks), 2)
+        self.assertIsNone(errString)
+
+    # reST errors are returned.
+    @base.requiresModule('docutils')
+    def test_2(self):
+        htmlText, errString = self.pool.convert('reStructuredText', 'Some *text')
+        self.assertIn('Some', htmlText)
+        self.assertIn('WARNING', errString)
+
+    # Cancelling stops waiting for a running conversion at once. The workers
+    # aren't restarted, and the pool keeps working.
+    @base.requiresModule('docutils')
+    def test_3(self):
+        self.pool.convert('reStructuredText', 'Text')
+        pids = sorted(worker.process.pid for worker in self.pool._idle)
+        results = []
+
+        def convert():
+            try:
+                self.pool.convert('reStructuredText', '\n\n'.join(['Para *x*'] * 50000))
+            except ConversionCancelled:
+                results.append('cancelled')
+            else:
+                results.append('done')
+
+        thread = threading.Thread(target=convert)
+        thread.start()
+        time.sleep(0.5)
+        self.pool.cancel()
+        thread.join(1)
+        self.assertEqual(results, ['cancelled'])
+
+        htmlText, errString = self.pool.convert('reStructuredText', 'Text')
+        self.assertIn('Text', htmlText)
+        workers = self.pool._idle + list(self.pool._busy) + self.pool._draining
+        self.assertEqual(sorted(worker.process.pid for worker in workers), pids)
+
+    # Conversions work after terminating, in the calling thread.
+    @base.requiresModule('docutils')
+    def test_4(self):
+        self.pool.terminate()
+        htmlText, errString = self.pool.convert('reStructuredText', 'Text')
+        self.assertIn('Text', htmlText)
+#
+# Main
+# ====
+if __name__ == '__main__':
+    unittest.main()
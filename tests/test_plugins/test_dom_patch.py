@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+# .. -*- coding: utf-8 -*-
+#
+# **********************************
+# test_dom_patch.py - Unit testing
+# **********************************
+#
+# Imports
+# =======
+# Library imports
+# ---------------
+import unittest
+import os.path
+import sys
+#
+# Local application imports
+# -------------------------
+# Insert path to base before importing.
+sys.path.insert(0, os.path.join(os.path.abspath(os.path.dirname(__file__)), ".."))
+import base
+# Base will insert path to enki, so its modules that we want to test can now be
+# imported.
+from enki.plugins.preview.dom_patch import _parsePage, _canPatch, _diffBlocks
+from enki.plugins.preview.markdown_renderer import RenderedMarkdown
+#
+# Tests
+# =====
+class TestDomPatch(unittest.TestCase):
+    # A page is split into its head and body.
+    def test_1(self):
+        page = _parsePage('a.rst', '<html><head></head><body class="x">text</body></html>')
+        self.assertEqual(page.head, '<html><head></head><body class="x"></body></html>')
+        self.assertEqual(page.body, 'text')
+        self.assertIsNone(page.blocks)
+
+    # A page without a body can't be patched.
+    def test_2(self):
+        self.assertIsNone(_parsePage('a.rst', 'Install docutils'))
+
+    # Markdown pages keep their blocks.
+    def test_3(self):
+        page = _parsePage('a.md', RenderedMarkdown('<style></style>', ['<p>a</p>']))
+        self.assertEqual(page.head, '<style></style>')
+        self.assertEqual(page.blocks, ['<p>a</p>'])
+
+    # Pages of the same file with the same head can be patched.
+    def test_4(self):
+        old = _parsePage('a.rst', '<head>h</head><body>one</body>')
+        self.assertTrue(_canPatch(old, _parsePage('a.rst', '<head>h</head><body>two</body>')))
+        self.assertFalse(_canPatch(old, _parsePage('b.rst', '<head>h</head><body>two</body>')))
+        self.assertFalse(_canPatch(old, _parsePage('a.rst', '<head>g</head><body>two</body>')))
+        self.assertFalse(_canPatch(None, old))
+
+    # Inserted scripts don't run, so bodies with scripts aren't patched.
+    def test_5(self):
+        old = _parsePage('a.rst', '<body>one</body>')
+        self.assertFalse(_canPatch(old, _parsePage('a.rst', '<body><SCRIPT></script></body>')))
+        old = _parsePage('a.md', RenderedMarkdown('', ['<script></script>', 'a']))
+        self.assertTrue(_canPatch(old, _parsePage('a.md', RenderedMarkdown('', ['<script></script>', 'b']))))
+        self.assertFalse(_canPatch(old, _parsePage('a.md', RenderedMarkdown('', ['a']))))
+
+    # Only the changed blocks are replaced.
+    def test_6(self):
+        self.assertEqual(_diffBlocks(['a', 'b', 'c'], ['a', 'x', 'y', 'c']), (1, 1, ['x', 'y']))
+        self.assertEqual(_diffBlocks(['a', 'b'], ['a', 'b']), (2, 0, []))
+        self.assertEqual(_diffBlocks(['a', 'a'], ['a']), (1, 1, []))
+        self.assertEqual(_diffBlocks([], ['a']), (0, 0, ['a']))
+#
+# Main
+# ====
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+# .. -*- coding: utf-8 -*-
+#
+# **********************************
+# test_html_export.py - Unit testing
+# **********************************
+#
+# Imports
+# =======
+# Library imports
+# ---------------
+import unittest
+import os.path
+import sys
+import shutil
+import tempfile
+#
+# Local application imports
+# -------------------------
+# Insert path to base before importing.
+sys.path.insert(0, os.path.join(os.path.abspath(os.path.dirname(__file__)), ".."))
+import base
+# Base will insert path to enki, so its modules that we want to test can now be
+# imported.
+from enki.plugins.preview.html_export import exportHtml
+#
+# Tests
+# =====
+class TestExportHtml(unittest.TestCase):
+    def setUp(self):
+        self.tempDir = tempfile.mkdtemp()
+        self.baseDir = os.path.join(self.tempDir, 'doc')
+        self.saveDir = os.path.join(self.tempDir, 'saved')
+        os.makedirs(os.path.join(self.baseDir, '_static', 'fonts'))
+        os.makedirs(self.saveDir)
+        self._write(os.path.join(self.baseDir, 'image.png'), 'png')
+        self._write(os.path.join(self.baseDir, '_static', 'style.css'),
+                    "@font-face { src: url('fonts/a.woff'); }")
+        self._write(os.path.join(self.baseDir, '_static', 'fonts', 'a.woff'), 'woff')
+        self._write(os.path.join(self.tempDir, 'outside.js'), 'js')
+
+    def tearDown(self):
+        shutil.rmtree(self.tempDir)
+
+    def _write(self, path, text):
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(text)
+
+    def _read(self, path):
+        with open(path, encoding='utf-8') as f:
+            return f.read()
+
+    # Local files are copied next to the saved file and their references
+    # rewritten; other references are kept.
+    def test_1(self):
+        html = ('<link rel="stylesheet" href="_static/style.css">'
+                '<img src="image.png"><script src="../outside.js"></script>'
+                '<img src="http://example.com/a.png"><a href="image.png">link</a>')
+        path = os.path.join(self.saveDir, 'page.html')
+        self.assertEqual(exportHtml(html, self.baseDir, path), 4)
+        saved = self._read(path)
+        self.assertIn('href="page_files/_static/style.css"', saved)
+        self.assertIn('src="page_files/image.png"', saved)
+        self.assertIn('src="page_files/0_outside.js"', saved)
+        self.assertIn('src="http://example.com/a.png"', saved)
+        self.assertIn('<a href="image.png">', saved)
+        filesDir = os.path.join(self.saveDir, 'page_files')
+        self.assertEqual(self._read(os.path.join(filesDir, '_static', 'fonts', 'a.woff')), 'woff')
+        self.assertEqual(self._read(os.path.join(filesDir, '0_outside.js')), 'js')
+
+    # Saving next to the previewed file copies nothing.
+    def test_2(self):
+        html = '<img src="image.png">'
+        path = os.path.join(self.baseDir, 'page.html')
+        self.assertEqual(exportHtml(html, self.baseDir, path), 0)
+        self.assertEqual(self._read(path), html)
+        self.assertFalse(os.path.exists(os.path.join(self.baseDir, 'page_files')))
+
+    # Files a stylesheet refers to with ``../`` are never written outside of
+    # the assets directory, and existing files there are kept.
+    def test_4(self):
+        os.makedirs(os.path.join(self.tempDir, 'css'))
+        os.makedirs(os.path.join(self.tempDir, 'img'))
+        self._write(os.path.join(self.tempDir, 'css', 'style.css'),
+                    "a { background: url(../img/x.png); } b { background: url('../../up.png#f'); }")
+        self._write(os.path.join(self.tempDir, 'img', 'x.png'), 'x')
+        self._write(os.path.join(os.path.dirname(self.tempDir), 'up.png'), 'up')
+        self.addCleanup(os.remove, os.path.join(os.path.dirname(self.tempDir), 'up.png'))
+        os.makedirs(os.path.join(self.saveDir, 'img'))
+        self._write(os.path.join(self.saveDir, 'img', 'x.png'), 'user file')
+
+        html = '<link rel="stylesheet" href="../css/style.css">'
+        path = os.path.join(self.saveDir, 'page.html')
+        self.assertEqual(exportHtml(html, self.baseDir, path), 3)
+        self.assertIn('href="page_files/0_style.css"', self._read(path))
+        filesDir = os.path.join(self.saveDir, 'page_files')
+        self.assertEqual(sorted(os.listdir(filesDir)), ['0_style.css', '1_x.png', '2_up.png'])
+        self.assertEqual(self._read(os.path.join(filesDir, '0_style.css')),
+                         "a { background: url(1_x.png); } b { background: url('2_up.png#f'); }")
+        self.assertEqual(self._read(os.path.join(self.saveDir, 'img', 'x.png')), 'user file')
+        self.assertEqual(sorted(os.listdir(self.saveDir)), ['img', 'page.html', 'page_files'])
+
+    # Write errors are raised.
+    def test_3(self):
+        with self.assertRaises(OSError):
+            exportHtml('', None, os.path.join(self.tempDir, 'missing', 'page.html'))
+#
+# Main
+# ====
+if __name__ == '__main__':
+    unittest.main()
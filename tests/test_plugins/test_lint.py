@@ -1,8 +1,10 @@
 #!/usr/bin/env python3
 
 import unittest
+import unittest.mock
 import os.path
 import sys
+import tempfile
 
 sys.path.insert(0, os.path.join(os.path.abspath(os.path.dirname(__file__)), ".."))
 
@@ -13,6 +15,8 @@ from PyQt5.QtTest import QTest
 
 from enki.core.core import core
 from enki.plugins.lint.settings_widget import _getFlake8Version
+from enki.plugins.lint.linters import Linter, Flake8, ShellCheck
+from enki.plugins.lint import lint_cache
 
 
 class Test(base.TestCase):
@@ -102,5 +106,107 @@ class Test(base.TestCase):
                                                             {1: ('w', 'W293 blank line contains whitespace')}))
 
 
+class Linters(unittest.TestCase):
+    def test_1(self):
+        """ flake8 output is parsed """
+        output = ("/a/b.py:1:1: F821 undefined name 'asdf'\n"
+                  "/a/b.py:1:5: E225 missing whitespace around operator\n"
+                  "/a/b.py:3:1: W391 blank line at end of file\n"
+                  "/a/b.py:4:1: C901 'main' is too complex (11)\n"
+                  "/a/b.py:5:1: X100 unknown message\n")
+        with unittest.mock.patch('enki.plugins.lint.linters.get_console_output',
+                                 return_value=(output, '')) as getOutput:
+            results = Flake8().lint('/a/b.py', ('/a', (), 'flake8', 79, ''), b'asdf\n')
+        command = getOutput.call_args[0][0]
+        self.assertEqual(command[-2:], ['--stdin-display-name=/a/b.py', '-'])
+        self.assertEqual(getOutput.call_args[1], {'cwd': '/a', 'input': b'asdf\n'})
+        self.assertEqual(results, {0: ('e', "F821 undefined name 'asdf'"),
+                                   2: ('w', 'W391 blank line at end of file'),
+                                   3: ('n', "C901 'main' is too complex (11)")})
+
+    def test_2(self):
+        """ shellcheck output is parsed """
+        output = ("-:2:6: warning: foo is referenced but not assigned. [SC2154]\n"
+                  "-:3:1: error: Couldn't parse this function. [SC1073]\n"
+                  "-:4:3: note: Double quote to prevent globbing. [SC2086]\n")
+        with unittest.mock.patch('enki.plugins.lint.linters.get_console_output',
+                                 return_value=(output, '')) as getOutput:
+            results = ShellCheck().lint('/a/b.sh', ('/a', (), 'shellcheck'), b'echo $foo\n')
+        self.assertEqual(getOutput.call_args[0][0], ['shellcheck', '--format=gcc', '--shell=bash', '-'])
+        self.assertEqual(results, {1: ('w', 'foo is referenced but not assigned. [SC2154]'),
+                                   2: ('e', "Couldn't parse this function. [SC1073]"),
+                                   3: ('n', 'Double quote to prevent globbing. [SC2086]')})
+
+    def test_3(self):
+        """ flake8 output for several files is split by file """
+        output = ("/a/b.py:1:1: F821 undefined name 'asdf'\n"
+                  "/a/c.py:3:1: W391 blank line at end of file\n")
+        with unittest.mock.patch('enki.plugins.lint.linters.get_console_output',
+                                 return_value=(output, '')) as getOutput:
+            results = Flake8().lintFiles(['/a/b.py', '/a/c.py', '/a/d.py'], ('/a', (), 'flake8', 79, ''))
+        self.assertEqual(getOutput.call_args[0][0][-4:], ['--jobs=1', '/a/b.py', '/a/c.py', '/a/d.py'])
+        self.assertEqual(results, {'/a/b.py': {0: ('e', "F821 undefined name 'asdf'")},
+                                   '/a/c.py': {2: ('w', 'W391 blank line at end of file')},
+                                   '/a/d.py': {}})
+
+    def test_4(self):
+        """ Settings change when a configuration file in the directory or a parent changes """
+        with tempfile.TemporaryDirectory() as dirPath:
+            subDir = os.path.join(dirPath, 'sub')
+            os.mkdir(subDir)
+            filePath = os.path.join(subDir, 'a.py')
+            linter = Flake8()
+            with unittest.mock.patch.object(linter, 'userConfigPaths', return_value=()):
+                initial = Linter.settings(linter, filePath)
+                with open(os.path.join(dirPath, 'setup.cfg'), 'w') as f:
+                    f.write('[flake8]\nignore = E501\n')
+                created = Linter.settings(linter, filePath)
+                self.assertNotEqual(created, initial)
+
+                with open(os.path.join(dirPath, 'setup.cfg'), 'w') as f:
+                    f.write('[flake8]\nignore = E501,W391\n')
+                self.assertNotEqual(Linter.settings(linter, filePath), created)
+
+    def test_5(self):
+        """ Linters must implement lint() """
+        class NoLint(Linter):
+            name = 'nolint'
+
+        with self.assertRaises(TypeError):
+            NoLint()
+
+
+class Cache(unittest.TestCase):
+    def test_1(self):
+        """ Least recently used results are dropped """
+        cache = lint_cache.LintCache('/nonexistent/lint_cache.json')
+        with unittest.mock.patch.object(lint_cache, '_MAX_ENTRIES', 2):
+            cache.put('flake8', ('/a',), '/a/b.py', 'hash1', {0: ('e', 'one')})
+            cache.put('flake8', ('/a',), '/a/b.py', 'hash2', {0: ('e', 'two')})
+            self.assertEqual(cache.get('flake8', ('/a',), '/a/b.py', 'hash1'), {0: ('e', 'one')})
+            cache.put('flake8', ('/a',), '/a/b.py', 'hash3', {0: ('e', 'three')})
+
+        self.assertIsNone(cache.get('flake8', ('/a',), '/a/b.py', 'hash2'))
+        self.assertIsNotNone(cache.get('flake8', ('/a',), '/a/b.py', 'hash1'))
+        self.assertIsNotNone(cache.get('flake8', ('/a',), '/a/b.py', 'hash3'))
+        self.assertIsNone(cache.get('flake8', ('/b',), '/a/b.py', 'hash3'))
+        self.assertIsNone(cache.get('shellcheck', ('/a',), '/a/b.py', 'hash3'))
+        # Configuration may apply to some files only
+        self.assertIsNone(cache.get('flake8', ('/a',), '/a/c.py', 'hash3'))
+
+    def test_2(self):
+        """ Cache is saved and loaded """
+        with tempfile.TemporaryDirectory() as dirPath:
+            path = os.path.join(dirPath, 'lint_cache.json')
+            cache = lint_cache.LintCache(path)
+            cache.put('flake8', ('/a', 'flake8'), '/a/b.py', 'hash1', {3: ('w', 'W391 blank line')})
+            cache.save()
+
+            loaded = lint_cache.LintCache(path)
+            loaded.load()
+            self.assertEqual(loaded.get('flake8', ('/a', 'flake8'), '/a/b.py', 'hash1'),
+                             {3: ('w', 'W391 blank line')})
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+# .. -*- coding: utf-8 -*-
+#
+# *****************************************
+# test_markdown_renderer.py - Unit testing
+# *****************************************
+#
+# Imports
+# =======
+# Library imports
+# ---------------
+import unittest
+import os.path
+import sys
+#
+# Local application imports
+# -------------------------
+# Insert path to base before importing.
+sys.path.insert(0, os.path.join(os.path.abspath(os.path.dirname(__file__)), ".."))
+import base
+# Base will insert path to enki, so its modules that we want to test can now be
+# imported.
+from enki.plugins.preview.markdown_renderer import splitBlocks, MarkdownRenderer, \
+    RenderedMarkdown, BLOCK_MARKER
+#
+# Tests for splitBlocks
+# =====================
+class TestSplitBlocks(unittest.TestCase):
+    # Check that the blocks join back to the text, then return them.
+    def split(self, text):
+        blocks, references = splitBlocks(text)
+        self.assertEqual('\n'.join(blocks), text)
+        return blocks, references
+
+    # Paragraphs and headings are separate blocks.
+    def test_1(self):
+        blocks, references = self.split('# Title\n\nOne\ntwo\n\nThree\n')
+        self.assertEqual(blocks, ['# Title\n', 'One\ntwo\n', 'Three\n'])
+        self.assertEqual(references, '')
+
+    # A fenced code block containing blank lines stays in one block.
+    def test_2(self):
+        blocks, references = self.split('```\na\n\nb\n```\n\nText')
+        self.assertEqual(blocks, ['```\na\n\nb\n```\n', 'Text'])
+
+    # Loose list items and their indented paragraphs stay together.
+    def test_3(self):
+        blocks, references = self.split('* a\n\n    more a\n\n* b\n\nText')
+        self.assertEqual(blocks, ['* a\n\n    more a\n\n* b\n', 'Text'])
+
+    # Quotes separated by blank lines stay together.
+    def test_4(self):
+        blocks, references = self.split('> a\n\n> b\n\nText')
+        self.assertEqual(blocks, ['> a\n\n> b\n', 'Text'])
+
+    # A raw HTML block with blank lines stays in one block.
+    def test_5(self):
+        blocks, references = self.split('<div>\n\ntext\n\n</div>\n\nText')
+        self.assertEqual(blocks, ['<div>\n\ntext\n\n</div>\n', 'Text'])
+
+    # Reference definitions are collected.
+    def test_6(self):
+        blocks, references = self.split('See [a][1].\n\n[1]: http://a.b\n')
+        self.assertEqual(references, '[1]: http://a.b')
+
+    # Empty text.
+    def test_7(self):
+        blocks, references = self.split('')
+        self.assertEqual(blocks, [''])
+#
+# Tests for MarkdownRenderer
+# ==========================
+class TestMarkdownRenderer(unittest.TestCase):
+    # The result contains a marker per block.
+    @base.requiresModule('markdown')
+    def test_1(self):
+        html = MarkdownRenderer().render('', 'One\n\nTwo')
+        self.assertIsInstance(html, RenderedMarkdown)
+        self.assertEqual(len(html.blocks), 2)
+        self.assertEqual(html.count('<!--{}-->'.format(BLOCK_MARKER)), 2)
+        self.assertIn('<p>One</p>', html.blocks[0])
+
+    # Unchanged blocks aren't converted again.
+    @base.requiresModule('markdown')
+    def test_2(self):
+        renderer = MarkdownRenderer()
+        first = renderer.render('', 'One\n\nTwo')
+        second = renderer.render('', 'One\n\nThree')
+        self.assertIs(first.blocks[0], second.blocks[0])
+        self.assertIn('<p>Three</p>', second.blocks[1])
+
+    # Reference links work in any block.
+    @base.requiresModule('markdown')
+    def test_3(self):
+        html = MarkdownRenderer().render('', 'See [a][1].\n\n[1]: http://a.b\n')
+        self.assertIn('href="http://a.b"', html.blocks[0])
+#
+# Main
+# ====
+if __name__ == '__main__':
+    unittest.main()
@@ -11,11 +11,13 @@ sys.path.insert(0, os.path.join(os.path.abspath(os.path.dirname(__file__)), ".."
 
 import base
 
-from PyQt5.QtCore import Qt, QModelIndex
+from PyQt5.QtCore import Qt, QModelIndex, QPersistentModelIndex
 from PyQt5.QtTest import QTest
 
 from enki.core.core import core
-from enki.plugins.navigator.ctags import processText
+from enki.plugins.navigator import ProcessorThread
+from enki.plugins.navigator.ctags import processText, Tagger, Tag, FailedException
+from enki.plugins.navigator.dock import _TagModel
 
 
 RUBY_SOURCE = '''class Person
@@ -320,5 +322,86 @@ class Parser(base.TestCase):
         self.assertEqual(asDicts(tags), ref)
 
 
+def makeTags(spec, parent=None):
+    """Make tags from a list of (name, lineNumber, children spec)"""
+    tags = []
+    for name, lineNumber, childrenSpec in spec:
+        tag = Tag('function', name, lineNumber, parent)
+        tag.children = makeTags(childrenSpec, tag)
+        tags.append(tag)
+    return tags
+
+
+class Model(base.TestCase):
+
+    def _dump(self, model, parent=QModelIndex()):
+        return [(model.data(model.index(row, 0, parent), Qt.DisplayRole),
+                 model.index(row, 0, parent).internalPointer().lineNumber,
+                 self._dump(model, model.index(row, 0, parent)))
+                for row in range(model.rowCount(parent))]
+
+    def test_1(self):
+        """New tags are diffed into the model. Unchanged tags keep their indexes"""
+        model = _TagModel()
+        resets = []
+        model.modelReset.connect(lambda: resets.append(True))
+
+        model.setTags(makeTags([('Cls', 1, [('m1', 2, []), ('m2', 5, [])]), ('f', 10, [])]))
+        clsIndex = QPersistentModelIndex(model.index(0, 0, QModelIndex()))
+        m2Index = QPersistentModelIndex(model.index(1, 0, model.index(0, 0, QModelIndex())))
+
+        spec = [('new', 0, []), ('Cls', 2, [('m2', 6, []), ('m3', 8, [])]), ('f', 11, [])]
+        model.setTags(makeTags(spec))
+        self.assertEqual(self._dump(model), spec)
+        self.assertEqual((clsIndex.row(), clsIndex.data()), (1, 'Cls'))
+        self.assertEqual((m2Index.row(), m2Index.data()), (0, 'm2'))
+        self.assertEqual(resets, [])
+
+        model.setTags([])
+        self.assertEqual(self._dump(model), [])
+        model.term()
+
+    def test_2(self):
+        """The current tag is the tag on the line or the last one above it"""
+        model = _TagModel()
+        model.setTags(makeTags([('Cls', 1, [('m1', 1, []), ('m2', 5, [])]), ('f', 10, [])]))
+        names = [model.data(model._indexForLineNumber(line), Qt.DisplayRole)
+                 for line in (0, 1, 2, 5, 9, 10, 100)]
+        self.assertEqual(names, [None, 'Cls', 'm1', 'm2', 'm2', 'f', 'f'])
+        model.term()
+
+
+class Interactive(base.TestCase):
+
+    @base.requiresCmdlineUtility('ctags --version')
+    def test_1(self):
+        """The tagger gives the same tags as processText and survives a ctags crash"""
+        tagger = Tagger()
+        try:
+            ref = asDicts(processText('Python', PY_CODE, False))
+            self.assertEqual(asDicts(tagger.processText('Python', PY_CODE, False)), ref)
+
+            for coprocess in tagger._coprocesses.values():
+                coprocess._popen.kill()
+                coprocess._popen.wait()
+            self.assertEqual(asDicts(tagger.processText('Python', PY_CODE, False)), ref)
+        finally:
+            tagger.terminate()
+
+
+
+class Thread(base.TestCase):
+
+    def test_1(self):
+        """The job id is emitted after an error, so that the debouncer finishes the right job"""
+        thread = ProcessorThread()
+        try:
+            with patch.object(Tagger, 'processText', side_effect=FailedException('failed')):
+                self.assertEmits(lambda: thread.process('Python', PY_CODE, False, 7),
+                                 thread.processed, 2000, expectedSignalParams=(7,))
+        finally:
+            thread.stopAsync()
+            thread.wait()
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+# .. -*- coding: utf-8 -*-
+#
+# ****************************************
+# test_persistent_sphinx.py - Unit testing
+# ****************************************
+#
+# Imports
+# =======
+# Library imports
+# ---------------
+import unittest
+import os.path
+import sys
+import shutil
+import tempfile
+#
+# Local application imports
+# -------------------------
+# Insert path to base before importing.
+sys.path.insert(0, os.path.join(os.path.abspath(os.path.dirname(__file__)), ".."))
+import base
+# Base will insert path to enki, so its modules that we want to test can now be
+# imported.
+from enki.plugins.preview.persistent_sphinx import PersistentSphinx
+#
+# Tests
+# =====
+class TestPersistentSphinx(unittest.TestCase):
+    def setUp(self):
+        self.projectPath = tempfile.mkdtemp()
+        self._write('conf.py', "project = 'test'\n")
+        self._write('index.rst', 'Index\n=====\n\n.. toctree::\n\n   page\n')
+        self._write('page.rst', 'Page\n====\n\nText\n')
+        self.sphinx = PersistentSphinx()
+        self.log = []
+
+    def tearDown(self):
+        self.sphinx.terminate()
+        shutil.rmtree(self.projectPath)
+
+    def _write(self, name, text):
+        with open(os.path.join(self.projectPath, name), 'w') as f:
+            f.write(text)
+
+    def _build(self, name):
+        return self.sphinx.build(self.projectPath, self.projectPath,
+                                 os.path.join(self.projectPath, '_build', 'html'),
+                                 os.path.join(self.projectPath, '_build', 'doctrees'),
+                                 os.path.join(self.projectPath, name), self.log.append)
+
+    # The output file of the document is reported.
+    @base.requiresModule('sphinx')
+    def test_1(self):
+        outputFile, warnings = self._build('page.rst')
+        self.assertEqual(outputFile, os.path.join(self.projectPath, '_build', 'html', 'page.html'))
+        self.assertTrue(os.path.isfile(outputFile))
+        self.assertTrue(self.log)
+
+    # Later builds update changed documents and report their warnings.
+    @base.requiresModule('sphinx')
+    def test_2(self):
+        self._build('page.rst')
+        self._write('page.rst', 'Page\n====\n\nNew *text\n')
+        outputFile, warnings = self._build('page.rst')
+        with open(outputFile) as f:
+            self.assertIn('New', f.read())
+        self.assertIn('WARNING', warnings)
+
+    # Files which aren't documents have no output.
+    @base.requiresModule('sphinx')
+    def test_3(self):
+        outputFile, warnings = self._build('conf.py')
+        self.assertIsNone(outputFile)
+
+    # Output written to file descriptor 1, like a subprocess does, doesn't
+    # break the protocol.
+    @base.requiresModule('sphinx')
+    def test_4(self):
+        self._write('conf.py', "import os\nos.write(1, b'not JSON\\n')\nproject = 'test'\n")
+        outputFile, warnings = self._build('page.rst')
+        self.assertEqual(outputFile, os.path.join(self.projectPath, '_build', 'html', 'page.html'))
+#
+# Main
+# ====
+if __name__ == '__main__':
+    unittest.main()
@@ -13,7 +13,7 @@ import unittest
 import os.path
 import sys
 import codecs
-from unittest.mock import patch
+from unittest.mock import patch, MagicMock
 
 # Local application imports
 # -------------------------
@@ -27,7 +27,7 @@ from base import WaitForSignal
 # ---------------------------
 from PyQt5.QtWidgets import QMessageBox, QApplication
 from PyQt5.QtGui import QWheelEvent
-from PyQt5.QtCore import Qt, QPointF, QPoint, pyqtSignal, QObject
+from PyQt5.QtCore import Qt, QPointF, QPoint, pyqtSignal, QObject, QUrl
 from PyQt5.QtTest import QTest
 
 # Local application imports
@@ -40,6 +40,8 @@ import enki.plugins.preview
 from enki.plugins.preview import CodeChatSettingsWidget, SphinxSettingsWidget, _getSphinxVersion
 from import_fail import ImportFail
 from enki.plugins.preview.preview_sync import CallbackManager
+from enki.plugins.preview.preview import _getCodeChatLexer, _parallelJobs, PreviewDock
+from enki.plugins.preview.build_log import LogBuffer
 
 
 _SPHINX_VERSION = [1, 3, 0]
@@ -894,7 +896,7 @@ head
         # Modify this file internally, then wait for the typing timer to expire.
         qp = core.workspace().currentDocument().qutepart
         self.assertEmits(lambda: qp.appendPlainText('xxx'),
-                         self._dock()._typingTimer.timeout, timeoutMs=1000)
+                         self._dock()._typingDebouncer.timeout, timeoutMs=5000)
         # The typing timer invokes _scheduleDocumentProcessing. Make sure
         # it completes by waiting until all events are processed.
         base._processPendingEvents()
@@ -1157,7 +1159,8 @@ head
         self.testText = 'Testing 1, 2, 3...'
         self._doBasicTest('md')
         path = os.path.join(self.TEST_FILE_DIR, 'test.html')
-        self._dock()._previewSave(path)
+        with WaitForSignal(self._dock().previewSaved, 5000):
+            self._dock()._previewSave(path)
         with open(path, 'r', encoding='utf-8') as f:
             self.assertIn(self.testText, f.read())
 
@@ -1173,6 +1176,61 @@ head
             self.assertIn(includeText, f.read())
 
 
+class ParallelJobs(unittest.TestCase):
+    def test_1(self):
+        """The Sphinx jobs setting is read like ``sphinx-build -j``."""
+        self.assertEqual(_parallelJobs(' 4 '), 4)
+        self.assertEqual(_parallelJobs('auto'), os.cpu_count() or 1)
+        self.assertEqual(_parallelJobs('0'), 1)
+        self.assertEqual(_parallelJobs('many'), 1)
+
+
+class CodeChatLexer(unittest.TestCase):
+    @base.requiresModule('CodeChat')
+    def test_1(self):
+        """CodeChat reuses lexers, which don't depend on the file content."""
+        lexer = _getCodeChatLexer('# A comment\nx = 1\n', os.path.join('dir', 'a.py'))
+        self.assertIs(_getCodeChatLexer('', os.path.join('dir', 'b.py')), lexer)
+        self.assertIsNot(_getCodeChatLexer('/* A comment */', os.path.join('dir', 'c.c')), lexer)
+        # ``.v`` is Verilog or Coq; the first file doesn't decide for the others.
+        verilog = _getCodeChatLexer('module m(input a);\nendmodule\n', os.path.join('dir', 'a.v'))
+        coq = _getCodeChatLexer('Theorem t : True.\nProof. trivial. Qed.\n', os.path.join('dir', 'b.v'))
+        self.assertEqual(verilog.name, 'verilog')
+        self.assertEqual(coq.name, 'Coq')
+        # ``CMakeLists.txt`` isn't plain text like other ``.txt`` files.
+        cmake = 'cmake_minimum_required(VERSION 3.0)\n'
+        self.assertNotEqual(_getCodeChatLexer(cmake, os.path.join('dir', 'a.txt')).name,
+                            _getCodeChatLexer(cmake, os.path.join('dir', 'CMakeLists.txt')).name)
+
+
+class SetHtml(unittest.TestCase):
+    """Showing a conversion result, with a mock in place of the dock. A page
+    which is patched and a page which is reloaded are handled the same way.
+    """
+    def _setHtml(self, patched, errString):
+        dock = MagicMock()
+        dock._domPatcher.update.return_value = patched
+        dock._logBuffer = LogBuffer()
+        dock._rebuildNeeded = True
+        PreviewDock._setHtml(dock, 'file.md', '<p>Text</p>', errString, QUrl())
+        return dock
+
+    # The log shows the messages of the conversion.
+    def test_1(self):
+        for patched in (True, False):
+            dock = self._setHtml(patched, 'Oops')
+            self.assertEqual(dock._loadHtml.called, not patched)
+            dock._flushLog.assert_called_once_with()
+            self.assertTrue(dock._logBuffer.summary()[3])
+            dock._setHtmlProgress.assert_called_once_with('Error(s): 0, warning(s): 0', None)
+
+    # A rebuild requested during the conversion runs after it.
+    def test_2(self):
+        for patched in (True, False):
+            dock = self._setHtml(patched, '')
+            self.assertFalse(dock._rebuildNeeded)
+            dock._scheduleDocumentProcessing.assert_called_once_with()
+
 
 #
 # Main
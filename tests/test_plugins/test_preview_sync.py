@@ -37,7 +37,8 @@ from test_preview import PreviewTestCase, WaitForCallback
 from base import requiresModule, WaitForSignal, TestCase
 import enki.plugins.preview
 import enki.plugins.preview.preview_sync
-from enki.plugins.preview.preview_sync import CallbackManager, CallbackFuture, CallbackFutureState
+from enki.plugins.preview.preview_sync import CallbackManager, CallbackFuture, CallbackFutureState, \
+    PreviewSync
 from import_fail import ImportFail
 
 class CallbackToWrap:
@@ -165,8 +166,70 @@ class CallbackManagerTest(base.TestCase):
         self.assertEqual([], cw2.returnedParams)
         self.assertEqual([], cw3.returnedParams)
 
+# Caching of the preview's plain text
+# ===================================
+# These tests drive a PreviewSync without a web view; a mock stands in for the
+# preview dock.
+@unittest.skipUnless(enki.plugins.preview.preview_sync.PositionMap,
+                     'Requires working TRE')
+class PagePlainText(unittest.TestCase):
+    def setUp(self):
+        self.ps = PreviewSync.__new__(PreviewSync)
+        self.ps._dock = MagicMock()
+        self.ps._dock._afterLoaded.afterLoaded.side_effect = lambda func, *args: func(*args)
+        self.ps._callbackManager = CallbackManager()
+        self.ps._cursorMovementTimer = MagicMock()
+        self.ps._pagePlainText = None
+        self.ps._pagePlainTextFuture = None
+        self.ps._syncAfterPlainText = False
+        self.runJavaScript = self.ps._dock._widget.webEngineView.page().runJavaScript
+
+    def _reply(self, text):
+        """Answer the last ``fetchPagePlainText()`` request with ``text``
+        """
+        script, world, callback = self.runJavaScript.call_args[0]
+        self.assertEqual(script, 'fetchPagePlainText();')
+        callback(text)
+
+    # A sync requested before the text arrives runs when it arrives. Later syncs
+    # reuse it.
+    def test_1(self):
+        with patch.object(self.ps, '_havePlainText') as havePlainText:
+            self.ps.syncTextToPreview()
+            self.ps.syncTextToPreview()
+            self.assertEqual(self.runJavaScript.call_count, 1)
+            havePlainText.assert_not_called()
+
+            self._reply('One\n\nTwo')
+            havePlainText.assert_called_once_with('One\n\nTwo')
+
+            self.ps.syncTextToPreview()
+            self.ps.syncTextToPreview()
+            self.assertEqual(self.runJavaScript.call_count, 1)
+            self.assertEqual(havePlainText.call_count, 3)
+
+    # A page change discards the text and the reply to a request sent before it.
+    def test_2(self):
+        self.ps._onLoadFinished(True)
+        self.ps._onLoadStarted()
+        self._reply('Old')
+        self.assertIsNone(self.ps._pagePlainText)
+
+        with patch.object(self.ps, '_havePlainText') as havePlainText:
+            self.ps.onPageContentsChanged()
+            self.assertEqual(self.runJavaScript.call_count, 2)
+            self._reply('New')
+            havePlainText.assert_called_once_with('New')
+        self.assertEqual(self.ps._pagePlainText, 'New')
+
+    # The preview is told only the index into the text it keeps.
+    def test_3(self):
+        self.ps._movePreviewPaneToIndex(12345)
+        script = self.runJavaScript.call_args[0][0]
+        self.assertEqual(script, 'highlightFind(12345);')
+
 @unittest.skip('Crashes')
-@unittest.skipUnless(enki.plugins.preview.preview_sync.findApproxTextInTarget,
+@unittest.skipUnless(enki.plugins.preview.preview_sync.PositionMap,
                      'Requires working TRE')
 class Test(PreviewTestCase):
     # Web to code sync tests
@@ -573,9 +636,9 @@ Here is some text after a table.""", True)
         Note: Running this before test_click1/2/3 causes test failure -- the patches in those tests doesn't work after ImportFail in this test reloads the preview_sync module. So, name it test_xsync22 so that it will run after these tests.
         """
         with ImportFail(['approx_match'], [enki.plugins.preview.preview_sync]):
-            self.assertIsNone(enki.plugins.preview.preview_sync.findApproxTextInTarget)
+            self.assertIsNone(enki.plugins.preview.preview_sync.PositionMap)
         # Now, make sure that TRE imports correctly.
-        self.assertTrue(enki.plugins.preview.preview_sync.findApproxTextInTarget)
+        self.assertTrue(enki.plugins.preview.preview_sync.PositionMap)
 #
 # Main
 # ====
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+
+import unittest
+import os.path
+import sys
+import gzip
+import json
+
+sys.path.insert(0, os.path.join(os.path.abspath(os.path.dirname(__file__)), ".."))
+
+import base
+
+from enki.core.core import core
+import enki.plugins.recovery
+
+
+def _findPlugin():
+    for plugin in core.loadedPlugins():
+        if isinstance(plugin, enki.plugins.recovery.Plugin):
+            return plugin
+
+
+class Test(base.TestCase):
+
+    def _journalFiles(self, plugin):
+        if not os.path.isdir(plugin._dirPath):
+            return []
+        return [name for name in os.listdir(plugin._dirPath)
+                if name.endswith(enki.plugins.recovery._JOURNAL_SUFFIX)]
+
+    def test_1(self):
+        # Modified document is written to the journal. Journal is removed after saving
+        plugin = _findPlugin()
+        doc = self.createFile('file1.txt', 'asdf')
+        doc.qutepart.lines[0] = 'new text'  # setting whole text doesn't mark the document modified
+
+        plugin._snapshot()
+        self.waitUntilPassed(2000, lambda: self.assertEqual(len(self._journalFiles(plugin)), 1))
+
+        journalPath = os.path.join(plugin._dirPath, self._journalFiles(plugin)[0])
+        journal = enki.plugins.recovery._readJournal(journalPath)
+        self.assertEqual(journal['filePath'], doc.filePath())
+        self.assertEqual(journal['text'], 'new text')
+
+        doc.saveFile()
+        self.waitUntilPassed(2000, lambda: self.assertEqual(self._journalFiles(plugin), []))
+
+    def test_2(self):
+        # Journal of a crashed instance is recovered
+        staleDir = os.path.join(enki.plugins.recovery._RECOVERY_DIR, 'crashed')
+        os.makedirs(staleDir, exist_ok=True)
+        filePath = os.path.join(self.TEST_FILE_DIR, 'file1.txt')
+        with open(filePath, 'w') as file_:
+            file_.write('old text')
+        with gzip.open(os.path.join(staleDir, '0.json.gz'), 'wt', encoding='utf8') as journalFile:
+            json.dump({'filePath': filePath, 'time': 0, 'text': 'recovered text'}, journalFile)
+
+        plugin = _findPlugin()
+        plugin._findStaleJournals()
+        core.actionManager().action('mFile/aRecoverUnsaved').trigger()
+
+        document = core.workspace().findDocumentForPath(filePath)
+        self.assertEqual(document.qutepart.text, 'recovered text')
+        self.assertTrue(document.qutepart.document().isModified())
+        self.assertIsNone(core.actionManager().action('mFile/aRecoverUnsaved'))
+
+        # Stale journal is removed after the document is journaled again
+        self.waitUntilPassed(2000, lambda: self.assertFalse(os.path.exists(staleDir)))
+        self.assertEqual(len(self._journalFiles(plugin)), 1)
+        journalPath = os.path.join(plugin._dirPath, self._journalFiles(plugin)[0])
+        self.assertEqual(enki.plugins.recovery._readJournal(journalPath)['text'], 'recovered text')
+
+    def test_3(self):
+        # The thread applies edits to its copy of the text. Edits after saving are journaled
+        plugin = _findPlugin()
+        doc = self.createFile('file1.txt', 'one\ntwo\n')
+        doc.qutepart.lines[1] = 'TWO'
+        plugin._snapshot()
+        doc.saveFile()
+        doc.qutepart.lines.append('three')
+
+        plugin._snapshot()
+        self.waitUntilPassed(2000, lambda: self.assertEqual(len(self._journalFiles(plugin)), 1))
+        journalPath = os.path.join(plugin._dirPath, self._journalFiles(plugin)[0])
+        self.waitUntilPassed(2000, lambda: self.assertEqual(
+            enki.plugins.recovery._readJournal(journalPath)['text'], doc.qutepart.text))
+
+    def test_4(self):
+        # A restarted instance with the PID of the crashed one doesn't use its directory
+        plugin = _findPlugin()
+        self.assertNotEqual(os.path.basename(plugin._dirPath), str(os.getpid()))
+        self.assertTrue(os.path.basename(plugin._dirPath).startswith('{}-'.format(os.getpid())))
+
+    def test_5(self):
+        # Edits are applied like QTextDocument reports them
+        applyEdits = enki.plugins.recovery._applyEdits
+        self.assertEqual(applyEdits('abcdef', [(1, 2, 'XY'), (0, 0, '>')]), '>aXYdef')
+        # Replacing the whole text reports one more removed char
+        self.assertEqual(applyEdits('abc', [(0, 4, 'new')]), 'new')
+
+    def test_6(self):
+        # Text of an opened file is not overwritten, recovered text is opened as a new document
+        doc = self.createFile('file1.txt', 'opened text')
+        staleDir = os.path.join(enki.plugins.recovery._RECOVERY_DIR, 'crashed')
+        os.makedirs(staleDir, exist_ok=True)
+        with gzip.open(os.path.join(staleDir, '0.json.gz'), 'wt', encoding='utf8') as journalFile:
+            json.dump({'filePath': doc.filePath(), 'time': 0, 'text': 'recovered text'}, journalFile)
+
+        plugin = _findPlugin()
+        plugin._findStaleJournals()
+        core.actionManager().action('mFile/aRecoverUnsaved').trigger()
+
+        self.assertEqual(doc.qutepart.text, 'opened text')
+        recovered = core.workspace().currentDocument()
+        self.assertIsNot(recovered, doc)
+        self.assertIsNone(recovered.filePath())
+        self.assertEqual(recovered.qutepart.text, 'recovered text')
+        self.assertTrue(recovered.qutepart.document().isModified())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+# .. -*- coding: utf-8 -*-
+#
+# ************************************
+# test_render_cache.py - Unit testing
+# ************************************
+#
+# Imports
+# =======
+# Library imports
+# ---------------
+import unittest
+import os.path
+import sys
+#
+# Local application imports
+# -------------------------
+# Insert path to base before importing.
+sys.path.insert(0, os.path.join(os.path.abspath(os.path.dirname(__file__)), ".."))
+import base
+# Base will insert path to enki, so its modules that we want to test can now be
+# imported.
+from enki.plugins.preview.render_cache import RenderCache, textHash
+#
+# Tests
+# =====
+class TestRenderCache(unittest.TestCase):
+    # Cached values are returned.
+    def test_1(self):
+        cache = RenderCache(10)
+        cache.put('a', 'A', 1)
+        self.assertEqual(cache.get('a'), 'A')
+        self.assertIsNone(cache.get('b'))
+
+    # The least recently used values are dropped to stay within the budget.
+    def test_2(self):
+        cache = RenderCache(10)
+        cache.put('a', 'A', 4)
+        cache.put('b', 'B', 4)
+        cache.get('a')
+        cache.put('c', 'C', 4)
+        self.assertEqual(cache.get('a'), 'A')
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('c'), 'C')
+
+    # Values larger than the budget aren't cached.
+    def test_3(self):
+        cache = RenderCache(10)
+        cache.put('a', 'A', 4)
+        cache.put('b', 'B', 11)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), 'A')
+
+    # Replacing a value frees the size of the old one.
+    def test_4(self):
+        cache = RenderCache(10)
+        cache.put('a', 'A', 8)
+        cache.put('a', 'A2', 8)
+        self.assertEqual(cache.get('a'), 'A2')
+        self.assertEqual(len(cache), 1)
+
+    # Hashes depend on the text.
+    def test_5(self):
+        self.assertEqual(textHash('text'), textHash('text'))
+        self.assertNotEqual(textHash('text'), textHash('text '))
+#
+# Main
+# ====
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+# .. -*- coding: utf-8 -*-
+#
+# ***********************************
+# test_symbol_index.py - Unit testing
+# ***********************************
+#
+# Imports
+# =======
+# Library imports
+# ---------------
+import unittest
+import os.path
+import sys
+import shutil
+import tempfile
+from unittest.mock import patch
+#
+# Local application imports
+# -------------------------
+# Insert path to base before importing.
+sys.path.insert(0, os.path.join(os.path.abspath(os.path.dirname(__file__)), ".."))
+import base
+# Base will insert path to enki, so its modules that we want to test can now be
+# imported.
+from enki.plugins.navigator.symbol_index import (parseCtagsOutput, makeFileSymbols, findSymbols,
+                                                 loadIndex, saveIndex, Symbol, _tagBatch,
+                                                 _IndexerThread)
+#
+# Tests
+# =====
+CTAGS_OUTPUT = '''Cls\tpkg/a.py\t2;"\tclass\tline:2
+foobar\tpkg/a.py\t3;"\tmember\tline:3
+x\tpkg/a.py\t4;"\tvariable\tline:4
+main\tb.c\t10;"\tfunction\tline:10
+ctags: Warning: something happened
+'''
+
+
+class Parser(unittest.TestCase):
+    def test_1(self):
+        """Tags are grouped by file. Variables are ignored"""
+        self.assertEqual(parseCtagsOutput(CTAGS_OUTPUT),
+                         {'pkg/a.py': [('Cls', 1, 'class'), ('foobar', 2, 'member')],
+                          'b.c': [('main', 9, 'function')]})
+
+
+class Search(unittest.TestCase):
+    def setUp(self):
+        self.entries = [('a.py', makeFileSymbols(1, [('Cls', 1, 'class'),
+                                                     ('foobar', 2, 'member'),
+                                                     ('fooBar', 5, 'function')])),
+                        ('b.py', makeFileSymbols(1, [('other_foo_bar', 7, 'function')])),
+                        ('c.py', makeFileSymbols(1, []))]
+
+    def test_1(self):
+        """Names are fuzzy matched. Continuous matches are better"""
+        self.assertEqual(findSymbols(self.entries, 'fbr', 10),
+                         [Symbol('foobar', 'member', 'a.py', 2),
+                          Symbol('fooBar', 'function', 'a.py', 5),
+                          Symbol('other_foo_bar', 'function', 'b.py', 7)])
+        self.assertEqual(findSymbols(self.entries, 'foobar', 1),
+                         [Symbol('foobar', 'member', 'a.py', 2)])
+
+    def test_2(self):
+        """Upper case pattern is case sensitive"""
+        self.assertEqual(findSymbols(self.entries, 'fB', 10),
+                         [Symbol('fooBar', 'function', 'a.py', 5)])
+        self.assertEqual(findSymbols(self.entries, 'zzz', 10), [])
+
+
+class Persistence(unittest.TestCase):
+    def setUp(self):
+        self.configDir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.configDir)
+
+    def test_1(self):
+        """Saved index is loaded for the same project only"""
+        files = {'a.py': makeFileSymbols(12.5, [('Cls', 1, 'class'), ('foobar', 2, 'member')])}
+        with patch('enki.plugins.navigator.symbol_index.CONFIG_DIR', self.configDir):
+            saveIndex('/project', files)
+            self.assertEqual(loadIndex('/project'), files)
+            self.assertEqual(loadIndex('/other'), {})
+
+
+class Tagging(unittest.TestCase):
+    @base.requiresCmdlineUtility('ctags --version')
+    def test_1(self):
+        """Files of a batch are tagged"""
+        projectPath = tempfile.mkdtemp()
+        try:
+            os.mkdir(os.path.join(projectPath, 'pkg'))
+            with open(os.path.join(projectPath, 'pkg', 'a.py'), 'w') as f:
+                f.write('\nclass Cls:\n    def foobar(self):\n        pass\n')
+            tags = _tagBatch('ctags', projectPath, [os.path.join('pkg', 'a.py')])
+            self.assertEqual([name for name, line, kind in tags[os.path.join('pkg', 'a.py')]],
+                             ['Cls', 'foobar'])
+        finally:
+            shutil.rmtree(projectPath)
+
+
+class Indexer(unittest.TestCase):
+    def test_1(self):
+        """Project indexing stops between batches once the thread is asked to stop"""
+        projectPath = tempfile.mkdtemp()
+        try:
+            relPaths = ['{}.py'.format(i) for i in range(3)]
+            for relPath in relPaths:
+                with open(os.path.join(projectPath, relPath), 'w') as f:
+                    f.write('x = 1\n')
+
+            with patch.object(_IndexerThread, 'start'):
+                thread = _IndexerThread()
+            thread._projectPath = projectPath
+            indexed = []
+            thread.indexed.connect(lambda path, files, truncated: indexed.append(files))
+
+            def tagBatch(ctagsPath, projectPath, batch):
+                thread.stopAsync()
+                return {relPath: [('x', 1, 'variable')] for relPath in batch}
+
+            with patch('enki.plugins.navigator.symbol_index._BATCH_SIZE', 1), \
+                    patch('enki.plugins.navigator.symbol_index._MAX_PROCESSES', 1), \
+                    patch('enki.plugins.navigator.symbol_index._tagBatch', tagBatch):
+                thread._indexProject(relPaths, 'ctags')
+            self.assertEqual(len(indexed), 1)
+            self.assertLess(len(indexed[0]), len(relPaths))
+        finally:
+            shutil.rmtree(projectPath)
+#
+# Main
+# ====
+if __name__ == '__main__':
+    unittest.main()
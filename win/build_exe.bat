@@ -48,7 +48,6 @@ REM
 REM * ``hook-enki.py``
 REM * ``hook-qutepart.py``
 REM * ``hook-CodeChat.py``
-REM * ``hook-regex.py``
 REM
 REM PyInstaller is invoked with the following `options
 REM <http://htmlpreview.github.io/?https://github.com/pyinstaller/pyinstaller/blob/develop/doc/Manual.html#options>`_: